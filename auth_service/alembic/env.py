@@ -6,6 +6,8 @@ from alembic import context
 # Import Base từ project của bạn
 from app.utils.db import Base
 from app.models.user import User
+from app.models.login_throttle import LoginThrottle
+from app.models.revoked_token import RevokedToken
 
 # Alembic Config object
 config = context.config
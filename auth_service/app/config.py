@@ -10,7 +10,56 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# DB_ASYNC=true: route async dùng AsyncSession (asyncpg) thay vì Session sync trong threadpool
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Connection pool của mỗi process: tổng connection tới DB = số worker x (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))   # chờ connection rảnh tối đa (giây) rồi báo lỗi
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))     # đóng connection cũ hơn số giây này (-1: không)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# DB_PGBOUNCER=true: DB_HOST/DB_PORT là PgBouncer chế độ transaction pooling (không pre-ping, không cache prepared statement)
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
-ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
\ No newline at end of file
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Thư viện JWT: jose | pyjwt (so sánh: python -m common.jwt_bench). ALGORITHM=HS256 dùng SECRET_KEY;
+# EdDSA/RS256/ES256 ký bằng JWT_PRIVATE_KEY_FILE, Event/Gallery kiểm tra bằng JWT_PUBLIC_KEY_FILE (file PEM)
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose")
+JWT_PRIVATE_KEY_FILE = os.getenv("JWT_PRIVATE_KEY_FILE")
+JWT_PUBLIC_KEY_FILE = os.getenv("JWT_PUBLIC_KEY_FILE")
+# Cache access token đã kiểm tra (mỗi worker): số mục tối đa, thời gian sống (giây, không quá exp của token)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 300))
+
+# Thu hồi token (logout, refresh token đã xoay vòng): bảng revoked_tokens + Bloom filter jti trong mỗi worker
+REVOCATION_SYNC_KEY = os.getenv("REVOCATION_SYNC_KEY")                     # Event/Gallery gửi qua header X-Sync-Key; trống: không kiểm tra
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", 5))  # giây giữa hai lần lấy thu hồi mới
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", 10000))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", 0.01))
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", 3600))  # dựng lại filter, bỏ jti đã hết hạn
+
+# Hash mật khẩu (bcrypt) chạy trong process pool riêng của mỗi worker
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))                    # đổi cost: hash cũ được hash lại khi user đăng nhập
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))     # số process bcrypt
+PASSWORD_HASH_QUEUE_SIZE = int(os.getenv("PASSWORD_HASH_QUEUE_SIZE", 32))  # số việc được chờ thêm; đầy thì trả 503
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", 2))  # giây, header Retry-After của 503
+
+# Giới hạn đăng nhập (token bucket, kiểm tra trước DB/bcrypt): backend memory | postgres | none
+LOGIN_THROTTLE_BACKEND = os.getenv("LOGIN_THROTTLE_BACKEND", "memory")
+LOGIN_THROTTLE_MAX_KEYS = int(os.getenv("LOGIN_THROTTLE_MAX_KEYS", 100000))     # backend memory: số key tối đa (LRU)
+LOGIN_USERNAME_BURST = float(os.getenv("LOGIN_USERNAME_BURST", 5))
+LOGIN_USERNAME_PER_MINUTE = float(os.getenv("LOGIN_USERNAME_PER_MINUTE", 5))
+# Theo IP: rộng tay hơn vì cả hội trường có thể đăng nhập sau cùng một NAT
+LOGIN_IP_BURST = float(os.getenv("LOGIN_IP_BURST", 30))
+LOGIN_IP_PER_MINUTE = float(os.getenv("LOGIN_IP_PER_MINUTE", 60))
+LOGIN_TRUST_FORWARDED_FOR = os.getenv("LOGIN_TRUST_FORWARDED_FOR", "false").lower() in ("1", "true", "yes")
+
+# Bulk import user (admin): số process hash song song, số dòng mỗi lô insert, số dòng tối đa mỗi request,
+# độ dài tối đa một bản ghi (byte, kể cả ô CSV nhiều dòng; dài hơn bị báo invalid, không giữ trong bộ nhớ)
+BULK_IMPORT_WORKERS = int(os.getenv("BULK_IMPORT_WORKERS") or os.cpu_count() or 1)
+BULK_IMPORT_BATCH_SIZE = int(os.getenv("BULK_IMPORT_BATCH_SIZE", 256))
+BULK_IMPORT_MAX_ROWS = int(os.getenv("BULK_IMPORT_MAX_ROWS", 10000))
+BULK_IMPORT_MAX_LINE_BYTES = int(os.getenv("BULK_IMPORT_MAX_LINE_BYTES", 4096))
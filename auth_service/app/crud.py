@@ -0,0 +1,73 @@
+from datetime import datetime
+from typing import Dict, List, Optional, Set, Tuple
+from sqlalchemy import func
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app.models.revoked_token import RevokedToken
+from app.models.user import User
+
+# Truy vấn DB của Auth Service (ORM sync); route async gọi qua run_db
+
+def get_user_by_username(db: Session, username: str) -> Optional[User]:
+    return db.query(User).filter(User.username == username).first()
+
+def user_exists(db: Session, username: str, email: str) -> bool:
+    return db.query(User.id).filter(
+        (User.username == username) | (User.email == email)
+    ).first() is not None
+
+def create_user(db: Session, username: str, email: str, hashed_password: str, role: str) -> User:
+    new_user = User(
+        username=username,
+        email=email,
+        password=hashed_password,
+        role=role
+    )
+    db.add(new_user)
+    db.commit()
+    db.refresh(new_user)
+    return new_user
+
+def update_password(db: Session, user_id: int, hashed_password: str) -> None:
+    db.query(User).filter(User.id == user_id).update({User.password: hashed_password})
+    db.commit()
+
+def find_taken(db: Session, usernames: List[str], emails: List[str]) -> Tuple[Set[str], Set[str]]:
+    """Username / email đã có trong DB (một query cho cả lô)"""
+    rows = db.query(User.username, User.email).filter(
+        User.username.in_(usernames) | User.email.in_(emails)
+    ).all()
+    return {row.username for row in rows}, {row.email for row in rows}
+
+def insert_users(db: Session, users: List[Dict]) -> Dict[str, int]:
+    """INSERT cả lô, dòng trùng username/email (kể cả do request khác vừa tạo) bị bỏ qua; trả về {username: id} đã tạo"""
+    if not users:
+        return {}
+    stmt = insert(User).values(users).on_conflict_do_nothing().returning(User.id, User.username)
+    created = {row.username: row.id for row in db.execute(stmt)}
+    db.commit()
+    return created
+
+def revoke_token(db: Session, jti: str, expires_at: datetime) -> bool:
+    """Thu hồi token; False nếu đã bị thu hồi trước đó (INSERT nguyên tử: hai request cùng thu hồi thì chỉ một thắng)"""
+    stmt = insert(RevokedToken).values(jti=jti, expires_at=expires_at).on_conflict_do_nothing(
+        index_elements=[RevokedToken.jti]
+    ).returning(RevokedToken.id)
+    revoked = db.execute(stmt).first() is not None
+    db.commit()
+    return revoked
+
+def is_token_revoked(db: Session, jti: str) -> bool:
+    return db.query(RevokedToken.id).filter(RevokedToken.jti == jti).first() is not None
+
+def list_revocations(db: Session, since: int, limit: int) -> List[RevokedToken]:
+    """Các thu hồi chưa hết hạn có id > since, theo id tăng dần"""
+    return db.query(RevokedToken.id, RevokedToken.jti, RevokedToken.expires_at).filter(
+        RevokedToken.id > since, RevokedToken.expires_at > func.now()
+    ).order_by(RevokedToken.id).limit(limit).all()
+
+def prune_revocations(db: Session) -> int:
+    """Xóa thu hồi của token đã hết hạn (token hết hạn đã bị từ chối sẵn)"""
+    deleted = db.query(RevokedToken).filter(RevokedToken.expires_at <= func.now()).delete(synchronize_session=False)
+    db.commit()
+    return deleted
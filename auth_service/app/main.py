@@ -1,6 +1,34 @@
+import asyncio
+from contextlib import asynccontextmanager, suppress
 from fastapi import FastAPI
-from app.routes import auth
+from fastapi.responses import PlainTextResponse
+from common.revocation import revocation_sync_loop
+from app.config import REVOCATION_SYNC_INTERVAL
+from app.routes import auth, revocations as revocation_routes, users
+from app.utils.hashing import bulk_hasher, password_hasher
+from common.pool_metrics import render_metrics
+from app.utils.revocation import revocations
+from app.utils.security import token_validator
 
-app = FastAPI(title="Auth Service")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Nhận các thu hồi do worker khác ghi vào revoked_tokens
+    sync_task = asyncio.create_task(revocation_sync_loop(revocations, REVOCATION_SYNC_INTERVAL))
+    yield
+    sync_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await sync_task
+    # Dừng các process bcrypt cùng worker
+    password_hasher.shutdown()
+    bulk_hasher.shutdown()
 
-app.include_router(auth.router, prefix="/auth", tags=["auth"])
\ No newline at end of file
+app = FastAPI(title="Auth Service", lifespan=lifespan)
+
+app.include_router(auth.router, prefix="/auth", tags=["auth"])
+app.include_router(users.router, prefix="/auth/users", tags=["users"])
+app.include_router(revocation_routes.router, prefix="/auth/revocations", tags=["revocations"])
+
+# Số liệu connection pool, cache token và revocation filter (Prometheus text format) của worker nhận request
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics() + token_validator.render_metrics(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,13 @@
+from sqlalchemy import Boolean, Column, DateTime, Float, String, func
+from app.utils.db import Base
+
+class LoginThrottle(Base):
+    """Token bucket giới hạn đăng nhập dùng chung giữa các worker (LOGIN_THROTTLE_BACKEND=postgres).
+    UNLOGGED: không ghi WAL, mất khi Postgres crash cũng không sao (bucket chỉ đầy lại)."""
+    __tablename__ = "login_throttle"
+    __table_args__ = {"prefixes": ["UNLOGGED"]}
+
+    key = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    allowed = Column(Boolean, nullable=False)  # kết quả của lần lấy token gần nhất
+    updated_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
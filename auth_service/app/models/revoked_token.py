@@ -0,0 +1,12 @@
+from sqlalchemy import BigInteger, Column, DateTime, String, func
+from app.utils.db import Base
+
+class RevokedToken(Base):
+    """Token (access hoặc refresh) đã bị thu hồi trước khi hết hạn: logout, refresh token đã xoay vòng.
+    id tăng dần để các service khác lấy dần phần thu hồi mới (GET /auth/revocations?since=<id>)."""
+    __tablename__ = "revoked_tokens"
+
+    id = Column(BigInteger, primary_key=True, autoincrement=True)
+    jti = Column(String, unique=True, nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)  # exp của token; sau đó dòng có thể xóa
+    revoked_at = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
@@ -1,16 +1,20 @@
-from fastapi import APIRouter, Depends, HTTPException, Body
-from sqlalchemy.orm import Session
+import math
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Body, Request
 from pydantic import BaseModel, EmailStr
-from jose import jwt, JWTError
-from app.config import SECRET_KEY, ALGORITHM
-from app.models.user import User
-from app.utils.db import get_db, Base, engine
+from common.jwt_codec import TokenDecodeError, TokenExpiredError
+from app import crud
+from app.config import PASSWORD_HASH_RETRY_AFTER
+from app.utils.db import get_session, run_db
+from app.utils.hashing import HasherBusy, password_hasher
+from app.utils.revocation import revocations
+from app.utils.throttle import client_ip, login_limiter
 from app.utils.security import (
+    codec,
     create_refresh_token,
     create_access_token,
     verify_token,
-    hash_password,
-    verify_password,
 )
 
 router = APIRouter()
@@ -27,24 +31,25 @@ class UserLogin(BaseModel):
     password: str
 
 # ------------------ ROUTES ------------------
+def hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="Too many password checks in progress, retry later",
+        headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+    )
+
+# Route async: DB đi qua run_db (AsyncSession khi DB_ASYNC=true), bcrypt chạy trong process pool
+# của password_hasher; pool quá tải thì trả 503 + Retry-After
 @router.post("/signup")
-def signup(user: UserCreate, db: Session = Depends(get_db)):
-    existing = db.query(User).filter(
-        (User.username == user.username) | (User.email == user.email)
-    ).first()
-    if existing:
+async def signup(user: UserCreate, db=Depends(get_session)):
+    if await run_db(db, crud.user_exists, user.username, user.email):
         raise HTTPException(status_code=400, detail="User already exists")
 
-    hashed_pw = hash_password(user.password)
-    new_user = User(
-        username=user.username,
-        email=user.email,
-        password=hashed_pw,
-        role=user.role
-    )
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    try:
+        hashed_pw = await password_hasher.hash(user.password)
+    except HasherBusy:
+        raise hasher_busy()
+    new_user = await run_db(db, crud.create_user, user.username, user.email, hashed_pw, user.role)
     return {
         "msg": "User created",
         "id": new_user.id,
@@ -53,12 +58,36 @@ def signup(user: UserCreate, db: Session = Depends(get_db)):
         "role": new_user.role
     }
 
+# Giới hạn theo IP và username được kiểm tra trước khi đụng tới user/bcrypt; vượt thì 429 + Retry-After
 @router.post("/login")
-def login(user: UserLogin, db: Session = Depends(get_db)):
-    db_user = db.query(User).filter(User.username == user.username).first()
-    if not db_user or not verify_password(user.password, db_user.password):
+async def login(user: UserLogin, request: Request, db=Depends(get_session)):
+    wait = await login_limiter.hit(db, user.username, client_ip(request))
+    if wait:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many login attempts, retry later",
+            headers={"Retry-After": str(max(1, math.ceil(min(wait, 3600))))},
+        )
+
+    db_user = await run_db(db, crud.get_user_by_username, user.username)
+    if not db_user:
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+    try:
+        valid = await password_hasher.verify(user.password, db_user.password)
+    except HasherBusy:
+        raise hasher_busy()
+    if not valid:
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
+    # BCRYPT_ROUNDS đã đổi: hash lại bằng cost mới khi đang có mật khẩu gốc (pool bận thì để lần đăng nhập sau)
+    if password_hasher.needs_rehash(db_user.password):
+        try:
+            rehashed = await password_hasher.hash(user.password)
+        except HasherBusy:
+            pass
+        else:
+            await run_db(db, crud.update_password, db_user.id, rehashed)
+
     access_token = create_access_token(
         db_user.id, db_user.username, db_user.email, db_user.role
     )
@@ -81,19 +110,55 @@ def me(user: dict = Depends(verify_token)):
         "role": user["role"]
     }
 
+async def revoke(db, jti: str, exp: float) -> bool:
+    """Ghi thu hồi vào DB và filter của worker này (các worker/service khác nhận qua lần sync tiếp theo)"""
+    revoked = await run_db(db, crud.revoke_token, jti, datetime.fromtimestamp(exp, timezone.utc))
+    revocations.add(jti)
+    return revoked
+
+# Thu hồi access token đang dùng và (nếu gửi kèm) refresh token của cùng user
+@router.post("/logout")
+async def logout(
+    refresh_token: Optional[str] = Body(None, embed=True),
+    db=Depends(get_session),
+    user: dict = Depends(verify_token),
+):
+    if user["jti"] and user["exp"]:
+        await revoke(db, user["jti"], user["exp"])
+    if refresh_token:
+        try:
+            payload = codec.decode(refresh_token)
+        except TokenExpiredError:
+            payload = None  # đã hết hạn thì không cần thu hồi
+        except TokenDecodeError:
+            raise HTTPException(status_code=400, detail="Invalid refresh token")
+        if payload is not None:
+            if payload.get("type") != "refresh" or payload.get("sub") != str(user["user_id"]) or not payload.get("jti"):
+                raise HTTPException(status_code=400, detail="Invalid refresh token")
+            await revoke(db, payload["jti"], payload["exp"])
+    return {"msg": "Logged out"}
+
+# Xoay vòng refresh token: mỗi refresh token chỉ dùng được một lần, lần dùng đó thu hồi nó và cấp cặp token mới.
+# Thu hồi là một INSERT ... ON CONFLICT DO NOTHING nên hai request dùng cùng refresh token thì chỉ một thành công.
 @router.post("/refresh")
-def refresh(refresh_token: str = Body(..., embed=True)):
+async def refresh(refresh_token: str = Body(..., embed=True), db=Depends(get_session)):
     try:
-        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
-        if payload.get("type") != "refresh":
-            raise HTTPException(status_code=401, detail="Invalid token type")
-
-        user_id = payload.get("sub")
-        username = payload.get("username")
-        email = payload.get("email")
-        role = payload.get("role")
-
-        new_access_token = create_access_token(user_id, username, email, role)
-        return {"access_token": new_access_token}
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid refresh token")
\ No newline at end of file
+        payload = codec.decode(refresh_token)
+    except TokenDecodeError:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    if payload.get("type") != "refresh":
+        raise HTTPException(status_code=401, detail="Invalid token type")
+    if not payload.get("jti") or payload.get("exp") is None:
+        raise HTTPException(status_code=401, detail="Invalid refresh token")
+    if not await revoke(db, payload["jti"], payload["exp"]):
+        raise HTTPException(status_code=401, detail="Refresh token already used")
+
+    user_id = payload.get("sub")
+    username = payload.get("username")
+    email = payload.get("email")
+    role = payload.get("role")
+
+    return {
+        "access_token": create_access_token(user_id, username, email, role),
+        "refresh_token": create_refresh_token(user_id, username, email, role),
+    }
@@ -0,0 +1,31 @@
+import hmac
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from app import crud
+from app.config import REVOCATION_SYNC_KEY
+from app.utils.db import get_session, run_db
+
+router = APIRouter()
+
+# Event/Gallery Service đồng bộ Bloom filter jti bị thu hồi từ đây (common.revocation.HttpRevocationSource)
+
+def check_sync_key(x_sync_key: Optional[str] = Header(None)):
+    if REVOCATION_SYNC_KEY and not hmac.compare_digest(x_sync_key or "", REVOCATION_SYNC_KEY):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+# Thu hồi chưa hết hạn có id > since (theo id tăng dần); since=0 để lấy toàn bộ
+@router.get("", dependencies=[Depends(check_sync_key)])
+async def list_revocations(
+    since: int = Query(0, ge=0),
+    limit: int = Query(1000, ge=1, le=10000),
+    db=Depends(get_session),
+):
+    rows = await run_db(db, crud.list_revocations, since, limit)
+    return {"items": [
+        {"id": row.id, "jti": row.jti, "expires_at": row.expires_at.timestamp()} for row in rows
+    ]}
+
+# Kiểm tra chính xác một jti (khi Bloom filter của service gọi báo "có thể có")
+@router.get("/{jti}", dependencies=[Depends(check_sync_key)])
+async def get_revocation(jti: str, db=Depends(get_session)):
+    return {"jti": jti, "revoked": await run_db(db, crud.is_token_revoked, jti)}
@@ -0,0 +1,107 @@
+import asyncio
+from typing import Dict, List, Optional, Set, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Request
+from pydantic import ValidationError
+from app import crud
+from app.config import BULK_IMPORT_BATCH_SIZE, BULK_IMPORT_MAX_LINE_BYTES, BULK_IMPORT_MAX_ROWS, PASSWORD_HASH_RETRY_AFTER
+from app.routes.auth import UserCreate, hasher_busy
+from app.utils.db import get_session, run_db
+from app.utils.hashing import HasherBusy, bulk_hasher
+from app.utils.security import verify_token
+from app.utils.user_import import import_format, read_rows
+
+router = APIRouter()
+
+# Mỗi worker chỉ chạy một bulk import (pool hash của import đã dùng hết core)
+import_slots = asyncio.Semaphore(1)
+
+def row_result(line: int, username: Optional[str], status: str, **extra) -> Dict:
+    return {"line": line, "username": username, "status": status, **extra}
+
+async def import_batch(db, batch: List[Tuple[int, UserCreate]]) -> List[Dict]:
+    """Một lô: một query lọc user đã có (khỏi tốn bcrypt), hash song song, một câu INSERT ... ON CONFLICT DO NOTHING"""
+    taken_usernames, taken_emails = await run_db(
+        db, crud.find_taken, [row.username for _, row in batch], [row.email for _, row in batch]
+    )
+    results = []
+    pending = []
+    for line, row in batch:
+        if row.username in taken_usernames:
+            results.append(row_result(line, row.username, "exists", error="Username already exists"))
+        elif row.email in taken_emails:
+            results.append(row_result(line, row.username, "exists", error="Email already exists"))
+        else:
+            pending.append((line, row))
+
+    try:
+        hashes = await bulk_hasher.hash_many([row.password for _, row in pending])
+    except HasherBusy:
+        # Các lô trước đã được tạo; gửi lại cả file thì chúng thành "exists"
+        raise hasher_busy()
+    created = await run_db(db, crud.insert_users, [
+        {"username": row.username, "email": row.email, "password": hashed, "role": row.role}
+        for (_, row), hashed in zip(pending, hashes)
+    ])
+    for line, row in pending:
+        if row.username in created:
+            results.append(row_result(line, row.username, "created", id=created[row.username]))
+        else:
+            # Vừa bị request khác tạo trùng giữa lúc lọc và lúc insert
+            results.append(row_result(line, row.username, "exists", error="User already exists"))
+    return results
+
+# Admin tạo hàng loạt tài khoản (vd. khách mời của một sự kiện doanh nghiệp)
+# Body là CSV (text/csv, có header username,email,password[,role]) hoặc JSON lines (application/x-ndjson),
+# được đọc dần theo lô BULK_IMPORT_BATCH_SIZE dòng; trả về kết quả từng dòng: created / exists / invalid.
+# Quá BULK_IMPORT_MAX_ROWS dòng thì dừng, các dòng đã xử lý vẫn được giữ (truncated=true).
+@router.post("/import")
+async def import_users(request: Request, db=Depends(get_session), user: dict = Depends(verify_token)):
+    if user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    fmt = import_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(status_code=415, detail="Content-Type must be text/csv or application/x-ndjson")
+    if import_slots.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Another import is in progress, retry later",
+            headers={"Retry-After": str(PASSWORD_HASH_RETRY_AFTER)},
+        )
+
+    async with import_slots:
+        results: List[Dict] = []
+        seen_usernames: Set[str] = set()
+        seen_emails: Set[str] = set()
+        batch: List[Tuple[int, UserCreate]] = []
+        rows = 0
+        truncated = False
+        async for line, data in read_rows(request.stream(), fmt, BULK_IMPORT_MAX_LINE_BYTES):
+            rows += 1
+            if rows > BULK_IMPORT_MAX_ROWS:
+                truncated = True
+                break
+            if isinstance(data, str):
+                results.append(row_result(line, None, "invalid", error=data))
+                continue
+            try:
+                row = UserCreate.model_validate(data)
+            except ValidationError as exc:
+                error = exc.errors()[0]
+                field = ".".join(str(part) for part in error["loc"])
+                results.append(row_result(line, data.get("username"), "invalid", error=f"{field}: {error['msg']}"))
+                continue
+            if row.username in seen_usernames or row.email in seen_emails:
+                results.append(row_result(line, row.username, "invalid", error="Duplicate username or email in import"))
+                continue
+            seen_usernames.add(row.username)
+            seen_emails.add(row.email)
+            batch.append((line, row))
+            if len(batch) >= BULK_IMPORT_BATCH_SIZE:
+                results.extend(await import_batch(db, batch))
+                batch = []
+        if batch:
+            results.extend(await import_batch(db, batch))
+
+    results.sort(key=lambda result: result["line"])
+    counts = {status: sum(1 for result in results if result["status"] == status) for status in ("created", "exists", "invalid")}
+    return {**counts, "truncated": truncated, "results": results}
@@ -1,14 +1,12 @@
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, declarative_base
-from app.config import DATABASE_URL
+from sqlalchemy.orm import declarative_base
+from app import config
+from common.db import Database, run_db
 
-engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+# Engine / session của service (tham số pool, DB_ASYNC... trong config); factory dùng chung ở common.db
+database = Database(config)
+engine = database.engine
+SessionLocal = database.SessionLocal
 Base = declarative_base()
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
\ No newline at end of file
+get_db = database.get_db
+get_session = database.get_session
@@ -0,0 +1,89 @@
+import asyncio
+import math
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, List, Optional, TypeVar
+from app import config
+from app.utils.security import bcrypt_rounds, hash_password, verify_password
+
+# bcrypt (~250 ms CPU mỗi lần với cost 12) chạy trong process pool riêng thay vì threadpool của route:
+# - Đợt đăng nhập dồn dập không chiếm hết thread, /auth/me và /auth/refresh vẫn được phục vụ
+# - Số việc đang chạy + đang chờ bị giới hạn (workers + PASSWORD_HASH_QUEUE_SIZE); vượt quá thì
+#   báo HasherBusy ngay (route trả 503 + Retry-After) thay vì để request xếp hàng tới timeout
+# - Process dùng spawn: fork từ process đang có nhiều thread (uvicorn, pool DB) không an toàn
+# - Process con chết (OOM...) làm hỏng cả pool: bỏ pool hỏng, thử lại một lần trên pool mới; vẫn hỏng thì HasherBusy
+
+T = TypeVar("T")
+
+def hash_passwords(passwords: List[str], rounds: int) -> List[str]:
+    """Chạy trong process con: hash cả một phần của lô (một lần gửi qua pipe thay vì mỗi mật khẩu một lần)"""
+    return [hash_password(password, rounds) for password in passwords]
+
+class HasherBusy(Exception):
+    """Hàng đợi hash mật khẩu đã đầy, hoặc process pool hỏng liên tục"""
+
+class PasswordHasher:
+    def __init__(self, workers: int, queue_size: int):
+        self.workers = workers
+        self.max_pending = workers + queue_size
+        self.pending = 0  # chỉ đổi trên event loop nên không cần khóa
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+        return self._executor
+
+    def _discard(self, executor: ProcessPoolExecutor) -> None:
+        # Việc khác cùng gặp pool hỏng có thể đã tạo pool mới: chỉ bỏ đúng pool đã hỏng
+        if self._executor is executor:
+            self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn: Callable[..., T], *args) -> T:
+        if self.pending >= self.max_pending:
+            raise HasherBusy()
+        self.pending += 1
+        try:
+            for _ in range(2):
+                executor = self._get_executor()
+                try:
+                    return await asyncio.wrap_future(executor.submit(fn, *args))
+                except BrokenProcessPool:
+                    self._discard(executor)
+            raise HasherBusy()
+        finally:
+            self.pending -= 1
+
+    async def hash(self, password: str) -> str:
+        return await self._run(hash_password, password, config.BCRYPT_ROUNDS)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, password, hashed_password)
+
+    async def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hash cả lô song song: chia đều cho các process, giữ nguyên thứ tự"""
+        if not passwords:
+            return []
+        size = math.ceil(len(passwords) / self.workers)
+        parts = await asyncio.gather(*(
+            self._run(hash_passwords, passwords[i:i + size], config.BCRYPT_ROUNDS)
+            for i in range(0, len(passwords), size)
+        ))
+        return [hashed for part in parts for hashed in part]
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Hash tạo với cost khác BCRYPT_ROUNDS hiện tại"""
+        return bcrypt_rounds(hashed_password) != config.BCRYPT_ROUNDS
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher(config.PASSWORD_HASH_WORKERS, config.PASSWORD_HASH_QUEUE_SIZE)
+# Pool riêng cho bulk import: dùng mọi core trong lúc import mà không chiếm pool của login/signup
+bulk_hasher = PasswordHasher(config.BULK_IMPORT_WORKERS, queue_size=0)
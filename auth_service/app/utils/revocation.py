@@ -0,0 +1,29 @@
+from typing import List
+from common.revocation import Revocation, RevocationFilter
+from app import config, crud
+from app.utils.db import SessionLocal
+
+# Auth Service là nguồn chính xác (bảng revoked_tokens) nên filter của chính nó đọc thẳng DB thay vì qua HTTP
+
+class DbRevocationSource:
+    def changes(self, since: int, limit: int) -> List[Revocation]:
+        with SessionLocal() as db:
+            if since == 0:
+                # Dựng lại filter (mỗi REVOCATION_REBUILD_SECONDS): dọn luôn các dòng đã hết hạn
+                crud.prune_revocations(db)
+            return [
+                (row.id, row.jti, row.expires_at.timestamp())
+                for row in crud.list_revocations(db, since, limit)
+            ]
+
+    def is_revoked(self, jti: str) -> bool:
+        with SessionLocal() as db:
+            return crud.is_token_revoked(db, jti)
+
+revocations = RevocationFilter(
+    DbRevocationSource(),
+    capacity=config.REVOCATION_FILTER_CAPACITY,
+    error_rate=config.REVOCATION_FILTER_ERROR_RATE,
+    rebuild_seconds=config.REVOCATION_REBUILD_SECONDS,
+    check_ttl=config.REVOCATION_SYNC_INTERVAL,
+)
@@ -1,16 +1,29 @@
 import bcrypt
-from jose import jwt, JWTError
 import uuid
+from typing import Optional
 from fastapi import HTTPException, Depends
 from fastapi.security import OAuth2PasswordBearer
 from datetime import datetime, timedelta
-from app.config import SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES
+from common.auth_tokens import InvalidToken, TokenValidator, VerifiedTokenCache
+from common.jwt_codec import make_codec, read_key
+from app.config import (
+    SECRET_KEY, ALGORITHM, ACCESS_TOKEN_EXPIRE_MINUTES, BCRYPT_ROUNDS, TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL,
+    JWT_BACKEND, JWT_PRIVATE_KEY_FILE, JWT_PUBLIC_KEY_FILE,
+)
+from app.utils.revocation import revocations
 
 # Khai báo OAuth2 scheme để lấy token từ header Authorization
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
 
-def hash_password(password: str) -> str:
-    salt = bcrypt.gensalt()
+# Ký và kiểm tra JWT (thư viện + thuật toán theo cấu hình)
+codec = make_codec(
+    JWT_BACKEND, ALGORITHM, secret_key=SECRET_KEY,
+    private_key=read_key(JWT_PRIVATE_KEY_FILE), public_key=read_key(JWT_PUBLIC_KEY_FILE),
+)
+
+# hash_password / verify_password tốn CPU (bcrypt): route gọi qua app.utils.hashing (process pool riêng)
+def hash_password(password: str, rounds: int = BCRYPT_ROUNDS) -> str:
+    salt = bcrypt.gensalt(rounds=rounds)
     return bcrypt.hashpw(password.encode("utf-8"), salt).decode("utf-8")
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -19,6 +32,13 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         hashed_password.encode("utf-8")
     )
 
+def bcrypt_rounds(hashed_password: str) -> Optional[int]:
+    """Cost của hash bcrypt ("$2b$12$..." -> 12); None nếu không đọc được"""
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
 def create_access_token(user_id: int, username: str, email: str, role: str):
     expire = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     payload = {
@@ -30,7 +50,7 @@ def create_access_token(user_id: int, username: str, email: str, role: str):
         "iat": datetime.utcnow(),   # thời điểm tạo
         "jti": str(uuid.uuid4())    # mã ngẫu nhiên
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    return codec.encode(payload)
 
 def create_refresh_token(user_id: int, username: str, email: str, role: str):
     expire = datetime.utcnow() + timedelta(days=7)  # refresh token thường dài hơn
@@ -44,24 +64,16 @@ def create_refresh_token(user_id: int, username: str, email: str, role: str):
         "jti": str(uuid.uuid4()),
         "type": "refresh"
     }
-    return jwt.encode(payload, SECRET_KEY, algorithm=ALGORITHM)
+    return codec.encode(payload)
+
+# Cùng bộ kiểm tra token (có cache, có kiểm tra thu hồi) với Event/Gallery Service
+token_validator = TokenValidator(
+    codec, VerifiedTokenCache(TOKEN_CACHE_SIZE, TOKEN_CACHE_TTL), required=("sub", "username"),
+    revocations=revocations,
+)
 
 def verify_token(token: str = Depends(oauth2_scheme)):
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        user_id: str = payload.get("sub")
-        username: str = payload.get("username")
-        email: str = payload.get("email")
-        role: str = payload.get("role")
-
-        if user_id is None or username is None:
-            raise HTTPException(status_code=401, detail="Invalid token")
-
-        return {
-            "user_id": int(user_id),
-            "username": username,
-            "email": email,
-            "role": role
-        }
-    except JWTError:
-        raise HTTPException(status_code=401, detail="Invalid token")
\ No newline at end of file
+        return token_validator.validate(token)
+    except InvalidToken:
+        raise HTTPException(status_code=401, detail="Invalid token")
@@ -0,0 +1,151 @@
+import datetime
+import math
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+from fastapi import Request
+from sqlalchemy import case, func, literal
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+from app import config
+from app.models.login_throttle import LoginThrottle
+from app.utils.db import run_db
+
+# Giới hạn tần suất đăng nhập theo IP client và theo username, kiểm tra TRƯỚC mọi truy vấn user và bcrypt:
+# một đợt dò mật khẩu (credential stuffing) bị chặn bằng 429 thay vì biến thành CPU bcrypt
+# - Token bucket: mỗi key có tối đa burst token, hồi per_minute token mỗi phút; mỗi lần login lấy 1 token
+# - memory: bucket trong process, tối đa LOGIN_THROTTLE_MAX_KEYS key (bỏ key lâu không dùng nhất - LRU);
+#   mỗi gunicorn worker có bucket riêng nên giới hạn thực tế nhân theo số worker
+# - postgres: bucket nằm trong bảng UNLOGGED login_throttle (một câu upsert mỗi key), đúng trên mọi worker
+# - none: tắt
+
+Check = Tuple[str, "Limit"]
+
+@dataclass(frozen=True)
+class Limit:
+    burst: float       # số lần liên tiếp tối đa
+    per_minute: float  # tốc độ hồi token
+
+    @property
+    def rate(self) -> float:
+        return self.per_minute / 60.0
+
+    def retry_after(self, tokens: float) -> float:
+        """Số giây tới khi bucket có lại 1 token"""
+        return (1 - tokens) / self.rate if self.rate > 0 else math.inf
+
+    @property
+    def refill_seconds(self) -> float:
+        """Thời gian bucket rỗng hồi đầy (key idle lâu hơn thì không còn trạng thái gì cần giữ)"""
+        return self.burst / self.rate if self.rate > 0 else math.inf
+
+class MemoryBuckets:
+    def __init__(self, max_keys: int):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()  # key -> (tokens, thời điểm)
+
+    def take(self, key: str, limit: Limit, now: Optional[float] = None) -> float:
+        """Lấy 1 token; trả về 0 nếu được phép, ngược lại số giây phải chờ"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            tokens, updated = self._buckets.pop(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            wait = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                wait = limit.retry_after(tokens)
+            self._buckets[key] = (tokens, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+            return wait
+
+    def take_all(self, checks: List[Check]) -> float:
+        for key, limit in checks:
+            wait = self.take(key, limit)
+            if wait:
+                return wait
+        return 0.0
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+class PostgresBuckets:
+    CLEANUP_EVERY = 1000  # sau chừng này lần kiểm tra thì xóa các key đã idle quá thời gian hồi đầy
+
+    def __init__(self):
+        self._calls = 0
+
+    def take(self, db: Session, key: str, limit: Limit) -> float:
+        table = LoginThrottle.__table__
+        elapsed = func.extract("epoch", func.now() - table.c.updated_at)
+        refilled = func.least(literal(limit.burst), table.c.tokens + elapsed * limit.rate)
+        stmt = insert(table).values(key=key, tokens=limit.burst - 1, allowed=True, updated_at=func.now())
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.key],
+            set_={
+                "tokens": case((refilled >= 1, refilled - 1), else_=refilled),
+                "allowed": refilled >= 1,
+                "updated_at": func.now(),
+            },
+        ).returning(table.c.tokens, table.c.allowed)
+        tokens, allowed = db.execute(stmt).one()
+        return 0.0 if allowed else limit.retry_after(tokens)
+
+    def take_all(self, db: Session, checks: List[Check]) -> float:
+        """Lấy token theo thứ tự, dừng ở key đầu tiên bị chặn (không tốn token của các key sau)"""
+        try:
+            for key, limit in checks:
+                wait = self.take(db, key, limit)
+                if wait:
+                    return wait
+            return 0.0
+        finally:
+            self._calls += 1
+            if self._calls % self.CLEANUP_EVERY == 0:
+                self.cleanup(db, max(limit.refill_seconds for _, limit in checks))
+            db.commit()
+
+    def cleanup(self, db: Session, idle_seconds: float) -> int:
+        if math.isinf(idle_seconds):
+            return 0
+        return db.query(LoginThrottle).filter(
+            LoginThrottle.updated_at < func.now() - datetime.timedelta(seconds=idle_seconds)
+        ).delete(synchronize_session=False)
+
+USERNAME_LIMIT = Limit(config.LOGIN_USERNAME_BURST, config.LOGIN_USERNAME_PER_MINUTE)
+IP_LIMIT = Limit(config.LOGIN_IP_BURST, config.LOGIN_IP_PER_MINUTE)
+
+def client_ip(request: Request) -> str:
+    """IP client; sau reverse proxy (LOGIN_TRUST_FORWARDED_FOR=true) lấy địa chỉ cuối cùng proxy ghi vào X-Forwarded-For"""
+    if config.LOGIN_TRUST_FORWARDED_FOR:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.rsplit(",", 1)[-1].strip()
+    return request.client.host if request.client else "unknown"
+
+class LoginRateLimiter:
+    BACKENDS = ("memory", "postgres", "none")
+
+    def __init__(self, backend: str, max_keys: int):
+        # Gõ sai tên backend không được âm thầm tắt giới hạn đăng nhập
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown LOGIN_THROTTLE_BACKEND {backend!r}, expected one of {list(self.BACKENDS)}")
+        self.backend = backend
+        self.memory = MemoryBuckets(max_keys) if backend == "memory" else None
+        self.postgres = PostgresBuckets() if backend == "postgres" else None
+
+    async def hit(self, db, username: str, ip: str) -> float:
+        """Ghi nhận một lần đăng nhập; trả về 0 nếu được phép, ngược lại số giây client phải chờ.
+        IP kiểm tra trước: bị chặn theo IP thì không tốn token của username."""
+        checks = [(f"ip:{ip}", IP_LIMIT), (f"user:{username.strip().lower()}", USERNAME_LIMIT)]
+        if self.memory is not None:
+            return self.memory.take_all(checks)
+        if self.postgres is not None:
+            return await run_db(db, self.postgres.take_all, checks)
+        return 0.0
+
+login_limiter = LoginRateLimiter(config.LOGIN_THROTTLE_BACKEND, config.LOGIN_THROTTLE_MAX_KEYS)
@@ -0,0 +1,127 @@
+import csv
+import json
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Union
+
+# Đọc file import user theo từng dòng trong lúc request còn đang gửi lên (không đọc cả body vào bộ nhớ)
+# - text/csv: dòng đầu là header, cột username,email,password[,role]; ô trong dấu nháy được chứa xuống dòng
+#   (một bản ghi trải trên nhiều dòng, được đọc lại bằng csv.reader như một bản ghi)
+# - application/x-ndjson (JSON lines): mỗi dòng một object {"username", "email", "password", "role"?}
+# Dòng trống bị bỏ qua; bản ghi hỏng hoặc dài quá max_line_bytes trả về chuỗi lỗi thay vì dict để route báo lỗi theo từng dòng
+# (số dòng của bản ghi nhiều dòng là dòng bắt đầu)
+
+CSV_TYPES = {"text/csv", "application/csv"}
+JSON_LINES_TYPES = {"application/x-ndjson", "application/jsonl", "application/json-lines", "application/x-jsonlines"}
+
+Row = Tuple[int, Union[Dict, str]]  # (số dòng, dữ liệu hoặc lỗi)
+
+def import_format(content_type: Optional[str]) -> Optional[str]:
+    media_type = (content_type or "").split(";", 1)[0].strip().lower()
+    if media_type in CSV_TYPES:
+        return "csv"
+    if media_type in JSON_LINES_TYPES:
+        return "jsonl"
+    return None
+
+def _decode(line: bytes, first: bool) -> str:
+    if first:
+        line = line.removeprefix(b"\xef\xbb\xbf")
+    return line.decode("utf-8", errors="replace").rstrip("\r")
+
+async def iter_lines(chunks: AsyncIterator[bytes], max_bytes: int) -> AsyncIterator[Optional[str]]:
+    """Ghép các chunk của body thành từng dòng (UTF-8, chấp nhận BOM và \\r\\n).
+
+    Chỉ tìm xuống dòng trong chunk mới (không quét lại phần đã đệm); dòng dài quá max_bytes trả về None
+    một lần và phần còn lại của dòng bị bỏ qua ngay khi nhận.
+    """
+    buffer = bytearray()
+    skipping = False  # đang bỏ phần còn lại của một dòng quá dài
+    first = True
+    async for chunk in chunks:
+        start = 0
+        while (end := chunk.find(b"\n", start)) >= 0:
+            piece = chunk[start:end]
+            start = end + 1
+            if skipping:
+                skipping = False
+                continue
+            if len(buffer) + len(piece) > max_bytes:
+                buffer.clear()
+                yield None
+            else:
+                buffer += piece
+                yield _decode(bytes(buffer), first)
+                buffer.clear()
+            first = False
+        if skipping:
+            continue
+        buffer += chunk[start:]
+        if len(buffer) > max_bytes:
+            buffer.clear()
+            skipping = True
+            first = False
+            yield None
+    if buffer:
+        yield _decode(bytes(buffer), first)
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str, max_bytes: int) -> AsyncIterator[Tuple[int, Union[List[str], str]]]:
+    """(số dòng bắt đầu, các dòng của một bản ghi hoặc chuỗi lỗi).
+
+    CSV: số dấu nháy lẻ nghĩa là một ô trong nháy còn mở, bản ghi tiếp tục ở dòng sau ("" thoát nháy không đổi
+    chẵn lẻ). Bản ghi dài quá max_bytes bị báo lỗi; phần còn lại không được giữ, chỉ đếm dấu nháy để biết chỗ kết thúc.
+    """
+    too_long = f"Row longer than {max_bytes} bytes"
+    line_no = start = size = 0
+    record: List[str] = []
+    quoted = dropping = False
+    async for line in iter_lines(chunks, max_bytes):
+        line_no += 1
+        if line is None:
+            # Không biết dấu nháy trong phần bị bỏ: bản ghi kết thúc tại dòng này
+            yield (start if record or dropping else line_no), too_long
+            record, size, quoted, dropping = [], 0, False, False
+            continue
+        if not record and not dropping:
+            start, size = line_no, 0
+        size += len(line.encode("utf-8")) + (1 if line_no > start else 0)
+        if fmt == "csv" and line.count('"') % 2:
+            quoted = not quoted
+        if size > max_bytes:
+            record, dropping = [], True
+        elif not dropping:
+            record.append(line)
+        if quoted:
+            continue
+        yield start, too_long if dropping else record
+        record, dropping = [], False
+    if quoted:
+        yield start, too_long if dropping else "Unterminated quoted field"
+
+async def read_rows(chunks: AsyncIterator[bytes], fmt: str, max_line_bytes: int) -> AsyncIterator[Row]:
+    header: Optional[List[str]] = None
+    async for line_no, lines in iter_records(chunks, fmt, max_line_bytes):
+        if isinstance(lines, str):
+            yield line_no, lines
+            continue
+        if len(lines) == 1 and not lines[0].strip():
+            continue
+        if fmt == "jsonl":
+            try:
+                data = json.loads(lines[0])
+            except ValueError:
+                yield line_no, "Invalid JSON"
+                continue
+            yield line_no, data if isinstance(data, dict) else "Expected a JSON object"
+            continue
+
+        values = next(csv.reader(line + "\n" for line in lines))
+        if header is None:
+            header = [name.strip().lower() for name in values]
+            continue
+        if len(values) != len(header):
+            yield line_no, f"Expected {len(header)} columns, got {len(values)}"
+            continue
+        # Ô trống coi như không có (role mặc định); mật khẩu giữ nguyên khoảng trắng
+        yield line_no, {
+            name: value if name == "password" else value.strip()
+            for name, value in zip(header, values) if value.strip() != ""
+        }
@@ -2,7 +2,7 @@ import pytest
 from fastapi.testclient import TestClient
 from app.main import app
 from app.models.user import User
-from app.utils.db import Base, SessionLocal, engine, get_db
+from app.utils.db import Base, SessionLocal, engine, get_session
 from sqlalchemy.orm import Session
 
 client = TestClient(app)
@@ -12,13 +12,13 @@ def database_fixture():
     Base.metadata.drop_all(bind=engine)
     Base.metadata.create_all(bind=engine)
     db = SessionLocal()
-    app.dependency_overrides[get_db] = lambda: db
+    app.dependency_overrides[get_session] = lambda: db
     try:
         yield db
     finally:
         db.close()
         Base.metadata.drop_all(bind=engine)
-        del app.dependency_overrides[get_db]
+        del app.dependency_overrides[get_session]
 
 def test_signup_success(db: Session):
     response = client.post("/auth/signup", json={
@@ -117,6 +117,42 @@ def test_refresh_token_success(db: Session):
     assert response.status_code == 200
     assert "access_token" in response.json()
 
+def test_refresh_token_rotation(db: Session):
+    """Refresh token chỉ dùng được một lần; lần dùng lại bị từ chối"""
+    client.post("/auth/signup", json={"username": "rotateuser", "email": "rotate@example.com", "password": "123"})
+    first = client.post("/auth/login", json={"username": "rotateuser", "password": "123"}).json()["refresh_token"]
+
+    response = client.post("/auth/refresh", json={"refresh_token": first})
+    assert response.status_code == 200
+    second = response.json()["refresh_token"]
+    assert second != first
+
+    response = client.post("/auth/refresh", json={"refresh_token": first})
+    assert response.status_code == 401
+    assert response.json()["detail"] == "Refresh token already used"
+    assert client.post("/auth/refresh", json={"refresh_token": second}).status_code == 200
+
+def test_logout_revokes_tokens(db: Session, monkeypatch):
+    client.post("/auth/signup", json={"username": "logoutuser", "email": "logout@example.com", "password": "123"})
+    tokens = client.post("/auth/login", json={"username": "logoutuser", "password": "123"}).json()
+    headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+    assert client.get("/auth/me", headers=headers).status_code == 200  # token đã nằm trong cache
+
+    response = client.post("/auth/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+    assert client.get("/auth/me", headers=headers).status_code == 401
+    assert client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]}).status_code == 401
+
+    # Event/Gallery Service đồng bộ từ đây; sync key sai thì bị từ chối
+    items = client.get("/auth/revocations", params={"since": 0}).json()["items"]
+    assert len(items) == 2 and items[0]["id"] < items[1]["id"]
+    assert client.get("/auth/revocations", params={"since": items[0]["id"]}).json()["items"] == items[1:]
+    assert client.get(f"/auth/revocations/{items[0]['jti']}").json()["revoked"] is True
+    assert client.get("/auth/revocations/unknown").json()["revoked"] is False
+    monkeypatch.setattr("app.routes.revocations.REVOCATION_SYNC_KEY", "sync-secret")
+    assert client.get("/auth/revocations").status_code == 403
+    assert client.get("/auth/revocations", headers={"X-Sync-Key": "sync-secret"}).status_code == 200
+
 def test_refresh_token_invalid(db: Session):
     response = client.post("/auth/refresh", json={"refresh_token": "invalidtoken"})
     assert response.status_code == 401
@@ -132,4 +168,222 @@ def test_password_is_hashed(db: Session):
     assert user is not None
     assert user.password != "123"
     from app.utils.security import verify_password
-    assert verify_password("123", user.password)
\ No newline at end of file
+    assert verify_password("123", user.password)
+def test_async_session_mode(monkeypatch):
+    """DB_ASYNC: signup/login chạy trên AsyncSession (asyncpg)"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+    import app.utils.db as db_module
+    from app.config import ASYNC_DATABASE_URL
+
+    Base.metadata.create_all(bind=engine)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, poolclass=NullPool)
+    monkeypatch.setattr(db_module.database, "AsyncSessionLocal", async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    try:
+        with TestClient(app) as async_client:
+            payload = {"username": "asyncuser", "email": "async@example.com", "password": "123"}
+            assert async_client.post("/auth/signup", json=payload).status_code == 200
+            assert async_client.post("/auth/signup", json=payload).status_code == 400
+            response = async_client.post("/auth/login", json={"username": "asyncuser", "password": "123"})
+            assert response.status_code == 200 and "access_token" in response.json()
+            assert async_client.post("/auth/login", json={"username": "asyncuser", "password": "x"}).status_code == 401
+    finally:
+        Base.metadata.drop_all(bind=engine)
+
+def test_pool_metrics(db: Session):
+    """/metrics xuất số liệu connection pool của worker"""
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert 'db_pool_checked_out{pool="sync"' in response.text
+    assert 'db_pool_checkout_wait_seconds_bucket{pool="sync"' in response.text
+
+def test_rehash_on_login_when_cost_changes(db: Session, monkeypatch):
+    """Đổi BCRYPT_ROUNDS: hash cũ vẫn đăng nhập được và được hash lại bằng cost mới"""
+    import app.config as config
+    from app.utils.security import bcrypt_rounds, verify_password
+
+    monkeypatch.setattr(config, "BCRYPT_ROUNDS", 4)
+    client.post("/auth/signup", json={"username": "costuser", "email": "cost@example.com", "password": "123"})
+    user = db.query(User).filter(User.username == "costuser").first()
+    assert bcrypt_rounds(user.password) == 4
+
+    monkeypatch.setattr(config, "BCRYPT_ROUNDS", 5)
+    assert client.post("/auth/login", json={"username": "costuser", "password": "123"}).status_code == 200
+    db.refresh(user)
+    assert bcrypt_rounds(user.password) == 5 and verify_password("123", user.password)
+    # Sai mật khẩu thì không đụng tới hash
+    old_hash = user.password
+    monkeypatch.setattr(config, "BCRYPT_ROUNDS", 6)
+    assert client.post("/auth/login", json={"username": "costuser", "password": "x"}).status_code == 401
+    db.refresh(user)
+    assert user.password == old_hash
+
+def test_password_hasher_backpressure(db: Session, monkeypatch):
+    """Hàng đợi bcrypt đầy: trả 503 + Retry-After ngay, route khác vẫn chạy"""
+    from app.utils.hashing import password_hasher
+
+    client.post("/auth/signup", json={"username": "busy", "email": "busy@example.com", "password": "123"})
+    monkeypatch.setattr(password_hasher, "pending", password_hasher.max_pending)
+    response = client.post("/auth/login", json={"username": "busy", "password": "123"})
+    assert response.status_code == 503 and response.headers["retry-after"].isdigit()
+    response = client.post("/auth/signup", json={"username": "busy2", "email": "busy2@example.com", "password": "123"})
+    assert response.status_code == 503
+    assert client.post("/auth/refresh", json={"refresh_token": "invalidtoken"}).status_code == 401
+
+def test_password_hasher_broken_pool(db: Session, monkeypatch):
+    """Process con chết: thử lại trên pool mới; pool mới cũng hỏng thì 503 + Retry-After thay vì 500"""
+    import asyncio
+    import os
+    from app.utils.hashing import HasherBusy, PasswordHasher, password_hasher
+
+    client.post("/auth/signup", json={"username": "broken", "email": "broken@example.com", "password": "123"})
+    hasher = PasswordHasher(workers=1, queue_size=0)
+    try:
+        with pytest.raises(HasherBusy):
+            asyncio.run(hasher._run(os._exit, 1))
+        assert hasher.pending == 0
+        assert asyncio.run(hasher.verify("123", asyncio.run(hasher.hash("123"))))
+
+        monkeypatch.setattr(password_hasher, "verify", lambda *args: hasher._run(os._exit, 1))
+        response = client.post("/auth/login", json={"username": "broken", "password": "123"})
+    finally:
+        hasher.shutdown()
+    assert response.status_code == 503 and response.headers["retry-after"].isdigit()
+
+def test_login_throttle(db: Session, monkeypatch):
+    """Quá số lần đăng nhập theo username/IP: 429 + Retry-After, không chạy bcrypt"""
+    from app.routes import auth as auth_routes
+    from app.utils import throttle
+    from app.utils.hashing import password_hasher
+
+    for typo in ("Postgres", "redis", ""):
+        with pytest.raises(ValueError):
+            throttle.LoginRateLimiter(typo, max_keys=100)  # không âm thầm tắt giới hạn
+    assert throttle.LoginRateLimiter("none", max_keys=100).memory is None
+
+    monkeypatch.setattr(auth_routes, "login_limiter", throttle.LoginRateLimiter("memory", max_keys=100))
+    monkeypatch.setattr(throttle, "USERNAME_LIMIT", throttle.Limit(burst=3, per_minute=1))
+    monkeypatch.setattr(throttle, "IP_LIMIT", throttle.Limit(burst=5, per_minute=1))
+    client.post("/auth/signup", json={"username": "victim", "email": "victim@example.com", "password": "123"})
+
+    for _ in range(3):
+        assert client.post("/auth/login", json={"username": "victim", "password": "wrong"}).status_code == 401
+    verifies = []
+    monkeypatch.setattr(password_hasher, "verify", lambda *args: verifies.append(args))
+    response = client.post("/auth/login", json={"username": "Victim", "password": "123"})
+    assert response.status_code == 429 and int(response.headers["retry-after"]) >= 1
+    assert verifies == []
+
+    # Cùng IP đã dùng 4/5 token (cả lần bị chặn theo username): thêm một lần nữa rồi bị chặn theo IP
+    assert client.post("/auth/login", json={"username": "other1", "password": "x"}).status_code == 401
+    assert client.post("/auth/login", json={"username": "other2", "password": "x"}).status_code == 429
+
+def test_login_throttle_buckets(db: Session):
+    """Token bucket hồi theo thời gian; memory bỏ key lâu không dùng; postgres dùng chung giữa các worker"""
+    from app.models.login_throttle import LoginThrottle
+    from app.utils.throttle import Limit, MemoryBuckets, PostgresBuckets
+
+    limit = Limit(burst=2, per_minute=60)  # 1 token/giây
+    buckets = MemoryBuckets(max_keys=2)
+    assert buckets.take("a", limit, now=0) == 0 and buckets.take("a", limit, now=0) == 0
+    assert buckets.take("a", limit, now=0) == pytest.approx(1.0)
+    assert buckets.take("a", limit, now=0.5) == pytest.approx(0.5)
+    assert buckets.take("a", limit, now=1.5) == 0
+    buckets.take("b", limit, now=2)
+    buckets.take("c", limit, now=2)
+    assert len(buckets) == 2 and "a" not in buckets._buckets
+
+    # Hai instance (như hai worker) dùng chung bucket trong bảng login_throttle
+    first, second = PostgresBuckets(), PostgresBuckets()
+    checks = [("user:shared", Limit(burst=2, per_minute=1))]
+    assert first.take_all(db, checks) == 0
+    assert second.take_all(db, checks) == 0
+    wait = first.take_all(db, checks)
+    assert 0 < wait <= 60
+    row = db.query(LoginThrottle).filter(LoginThrottle.key == "user:shared").one()
+    assert row.allowed is False and 0 <= row.tokens < 1
+    # Bị chặn ở key đầu thì không tốn token key sau
+    assert second.take_all(db, checks + [("ip:1.2.3.4", Limit(burst=1, per_minute=1))]) > 0
+    assert db.query(LoginThrottle).filter(LoginThrottle.key == "ip:1.2.3.4").first() is None
+
+def test_bulk_import_users(db: Session, monkeypatch):
+    """Admin import CSV / JSON lines: kết quả từng dòng, user trùng bị bỏ qua, user mới đăng nhập được"""
+    import json
+    import app.config as config
+    from app.routes import users as users_routes
+
+    monkeypatch.setattr(config, "BCRYPT_ROUNDS", 4)
+    monkeypatch.setattr(users_routes, "BULK_IMPORT_BATCH_SIZE", 2)
+    client.post("/auth/signup", json={"username": "importer", "email": "importer@example.com", "password": "123", "role": "admin"})
+    client.post("/auth/signup", json={"username": "existing", "email": "existing@example.com", "password": "123"})
+    admin = client.post("/auth/login", json={"username": "importer", "password": "123"}).json()["access_token"]
+    headers = {"Authorization": f"Bearer {admin}"}
+
+    csv_body = (
+        "username,email,password,role\r\n"
+        "guest1,guest1@example.com,pw1,\r\n"
+        "guest2,guest2@example.com, pw2 ,user\r\n"
+        "existing,other@example.com,pw,\r\n"
+        "guest3,not-an-email,pw,\r\n"
+        "\r\n"
+        "guest1,guest1b@example.com,pw,\r\n"
+        "guest4,guest4@example.com\r\n"
+        "guest5,existing@example.com,pw,\r\n"
+        "guest6,guest6@example.com,pw6,admin\r\n"
+    )
+    response = client.post("/auth/users/import", content=csv_body.encode(), headers={**headers, "Content-Type": "text/csv"})
+    assert response.status_code == 200
+    body = response.json()
+    statuses = {r["line"]: r["status"] for r in body["results"]}
+    assert statuses == {2: "created", 3: "created", 4: "exists", 5: "invalid", 7: "invalid", 8: "invalid", 9: "exists", 10: "created"}
+    assert (body["created"], body["exists"], body["invalid"], body["truncated"]) == (3, 2, 3, False)
+    guest6 = db.query(User).filter(User.username == "guest6").one()
+    assert guest6.role == "admin" and guest6.password.startswith("$2b$04$")
+    assert client.post("/auth/login", json={"username": "guest2", "password": " pw2 "}).status_code == 200
+
+    lines = [{"username": f"jl{i}", "email": f"jl{i}@example.com", "password": "pw"} for i in range(3)]
+    jsonl = "\n".join(json.dumps(line) for line in lines) + "\n[1]\n{broken"
+    monkeypatch.setattr(users_routes, "BULK_IMPORT_MAX_ROWS", 4)
+    body = client.post("/auth/users/import", content=jsonl.encode(), headers={**headers, "Content-Type": "application/x-ndjson"}).json()
+    assert [r["status"] for r in body["results"]] == ["created", "created", "created", "invalid"]
+    assert body["truncated"] is True
+    assert db.query(User).filter(User.username.like("jl%")).count() == 3
+
+    assert client.post("/auth/users/import", content=b"{}", headers={**headers, "Content-Type": "application/json"}).status_code == 415
+    user_token = client.post("/auth/login", json={"username": "guest1", "password": "pw1"}).json()["access_token"]
+    response = client.post("/auth/users/import", content=csv_body.encode(),
+                           headers={"Authorization": f"Bearer {user_token}", "Content-Type": "text/csv"})
+    assert response.status_code == 403
+
+def test_import_line_limit():
+    """Tách dòng qua nhiều chunk nhỏ; dòng dài quá giới hạn bị báo một lần, phần thừa không được đệm"""
+    import asyncio
+    from app.utils.user_import import iter_lines, read_rows
+
+    def collect(read, body: bytes, chunk_size: int):
+        async def chunks():
+            for i in range(0, len(body), chunk_size):
+                yield body[i:i + chunk_size]
+
+        async def run():
+            return [line async for line in read(chunks())]
+        return asyncio.run(run())
+
+    body = b"\xef\xbb\xbfab\r\n" + b"x" * 50 + b"\ncd\n\n" + b"y" * 12 + b"\nef"
+    for chunk_size in (1, 3, 7, len(body)):
+        assert collect(lambda c: iter_lines(c, 10), body, chunk_size) == ["ab", None, "cd", "", None, "ef"]
+    assert collect(lambda c: iter_lines(c, 10), b"z" * 11, 4) == [None]
+    rows = collect(lambda c: read_rows(c, "csv", 30), b"username,email,password\n" + b"a" * 40 + b"\n", 5)
+    assert rows == [(2, "Row longer than 30 bytes")]
+
+    # Ô CSV trong dấu nháy chứa xuống dòng: một bản ghi, số dòng là dòng bắt đầu
+    body = b'username,email,password\r\n"multi\r\nline",m@example.com,"pw ""q""\nx"\r\nnext,n@example.com,pw\r\n'
+    rows = collect(lambda c: read_rows(c, "csv", 100), body, 3)
+    assert rows == [
+        (2, {"username": "multi\nline", "email": "m@example.com", "password": 'pw "q"\nx'}),
+        (5, {"username": "next", "email": "n@example.com", "password": "pw"}),
+    ]
+    body = b'u,e,p\n"' + b"a\n" * 20 + b'",x,y\nok,o,p\n"open,x,y\n'
+    assert collect(lambda c: read_rows(c, "csv", 30), body, 4) == [
+        (2, "Row longer than 30 bytes"), (23, {"u": "ok", "e": "o", "p": "p"}), (24, "Unterminated quoted field"),
+    ]
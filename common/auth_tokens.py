@@ -0,0 +1,136 @@
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, Optional, Sequence, Tuple
+from common.jwt_codec import JWTCodec, TokenDecodeError, TokenExpiredError
+
+if TYPE_CHECKING:
+    from common.revocation import RevocationFilter
+
+# Kiểm tra access token (JWT do Auth Service cấp) dùng chung cho các service
+# - TokenValidator: giải mã + kiểm tra chữ ký/claim một lần, trả về thông tin user
+# - VerifiedTokenCache: token đã kiểm tra được cache theo SHA-256 của token (không giữ token gốc trong bộ nhớ),
+#   mục cache hết hạn sau TOKEN_CACHE_TTL giây nhưng không bao giờ muộn hơn exp của token; đầy thì bỏ mục ít dùng nhất (LRU)
+# - Token lỗi/hết hạn không được cache: lần sau vẫn giải mã lại và báo đúng lỗi
+# - Có revocations (common.revocation.RevocationFilter) thì mỗi lần validate còn kiểm tra jti chưa bị thu hồi,
+#   kể cả token lấy từ cache (logout có hiệu lực mà không cần xóa cache)
+
+User = Dict[str, Any]
+
+class InvalidToken(Exception):
+    """Token không hợp lệ; detail là thông báo trả cho client (401)"""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+class VerifiedTokenCache:
+    def __init__(self, max_entries: int = 10000, ttl: float = 300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[bytes, Tuple[float, User]]" = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.sha256(token.encode("utf-8")).digest()
+
+    def get(self, key: bytes, now: Optional[float] = None) -> Optional[User]:
+        now = time.time() if now is None else now
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: bytes, user: User, exp: Optional[float], now: Optional[float] = None) -> None:
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return
+        now = time.time() if now is None else now
+        expires_at = now + self.ttl if exp is None else min(now + self.ttl, exp)
+        if expires_at <= now:
+            return
+        with self._lock:
+            self._entries[key] = (expires_at, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class TokenValidator:
+    """Giải mã access token thành {user_id, username, email, role, jti, exp}; required: claim bắt buộc phải có"""
+
+    def __init__(self, codec: JWTCodec, cache: VerifiedTokenCache,
+                 required: Sequence[str] = ("sub",), revocations: Optional["RevocationFilter"] = None):
+        self.codec = codec
+        self.cache = cache
+        self.required = tuple(required)
+        self.revocations = revocations
+
+    def decode(self, token: str) -> Tuple[User, Optional[float]]:
+        try:
+            payload = self.codec.decode(token)
+        except TokenExpiredError:
+            raise InvalidToken("Token expired")
+        except TokenDecodeError:
+            raise InvalidToken("Invalid token")
+        if any(payload.get(claim) is None for claim in self.required):
+            raise InvalidToken("Invalid token payload")
+        try:
+            user_id = int(payload["sub"])
+        except (TypeError, ValueError):
+            raise InvalidToken("Invalid token payload")
+        user = {
+            "user_id": user_id,
+            "username": payload.get("username"),
+            "email": payload.get("email"),
+            "role": payload.get("role"),
+            "jti": payload.get("jti"),
+        }
+        exp = payload.get("exp")
+        user["exp"] = float(exp) if isinstance(exp, (int, float)) else None
+        return user, user["exp"]
+
+    def validate(self, token: str) -> User:
+        key = self.cache.key(token)
+        user = self.cache.get(key)
+        if user is None:
+            user, exp = self.decode(token)
+            self.cache.put(key, user, exp)
+        if self.revocations is not None and self.revocations.is_revoked(user["jti"]):
+            raise InvalidToken("Token revoked")
+        # Bản sao: route có thể sửa dict user mà không làm hỏng mục cache
+        return dict(user)
+
+    def render_metrics(self) -> str:
+        """Counter hit/miss và số mục của cache, số liệu revocation filter (Prometheus text format, nhãn worker = pid)"""
+        labels = f'worker="{os.getpid()}"'
+        text = (
+            "# HELP token_cache_hits_total Access tokens served from the verified-token cache\n"
+            "# TYPE token_cache_hits_total counter\n"
+            f"token_cache_hits_total{{{labels}}} {self.cache.hits}\n"
+            "# HELP token_cache_misses_total Access tokens that needed a full JWT decode\n"
+            "# TYPE token_cache_misses_total counter\n"
+            f"token_cache_misses_total{{{labels}}} {self.cache.misses}\n"
+            "# HELP token_cache_entries Verified tokens currently cached\n"
+            "# TYPE token_cache_entries gauge\n"
+            f"token_cache_entries{{{labels}}} {len(self.cache)}\n"
+        )
+        if self.revocations is not None:
+            text += self.revocations.render_metrics(labels)
+        return text
@@ -0,0 +1,37 @@
+import hashlib
+import math
+from typing import Iterator
+
+# Bloom filter: tập hợp gọn (vài bit mỗi phần tử), chỉ trả lời "chắc chắn không có" hoặc "có thể có"
+# - m bit, k hàm băm sinh từ một digest BLAKE2b (double hashing: h1 + i*h2)
+# - Với capacity phần tử, tỉ lệ dương tính giả xấp xỉ error_rate; thêm quá capacity thì tỉ lệ này tăng dần
+# - Không xóa được phần tử: muốn bỏ phần tử cũ thì dựng filter mới
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = 0.01):
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / (math.log(2) ** 2)))  # số bit
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, item: str) -> Iterator[int]:
+        digest = hashlib.blake2b(item.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "big")
+        h2 = int.from_bytes(digest[8:], "big") | 1
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, item: str) -> None:
+        for position in self._positions(item):
+            self._bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, item: str) -> bool:
+        return all(self._bits[position >> 3] & (1 << (position & 7)) for position in self._positions(item))
+
+    @property
+    def byte_size(self) -> int:
+        return len(self._bits)
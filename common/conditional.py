@@ -0,0 +1,48 @@
+import datetime
+import hashlib
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+from fastapi import Request, Response
+
+# Conditional GET: route tra "phiên bản" của dữ liệu bằng một query rẻ (revision / updated_at),
+# so với If-None-Match / If-Modified-Since; khớp thì trả 304 mà không cần tải + serialize cả object.
+
+def make_etag(*parts) -> str:
+    """ETag từ các thành phần phiên bản (id, revision, updated_at, tham số query...)"""
+    raw = "|".join("" if part is None else str(part) for part in parts)
+    return '"' + hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32] + '"'
+
+def _etag_matches(header: str, etag: str) -> bool:
+    # So sánh yếu (RFC 9110): bỏ tiền tố W/
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+def is_not_modified(request: Request, etag: str, last_modified: Optional[datetime.datetime] = None) -> bool:
+    """Có If-None-Match thì chỉ xét ETag; không thì xét If-Modified-Since (độ chính xác tới giây)"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return _etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=datetime.timezone.utc)
+        return last_modified.replace(microsecond=0) <= since
+    return False
+
+def validator_headers(etag: str, last_modified: Optional[datetime.datetime] = None) -> Dict[str, str]:
+    """Header gửi kèm cả 200 lẫn 304; no-cache: client luôn revalidate nhưng được dùng lại bản đã có"""
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Authorization"}
+    if last_modified is not None:
+        if last_modified.tzinfo is None:
+            last_modified = last_modified.replace(tzinfo=datetime.timezone.utc)
+        headers["Last-Modified"] = format_datetime(last_modified.astimezone(datetime.timezone.utc), usegmt=True)
+    return headers
+
+def not_modified(headers: Dict[str, str]) -> Response:
+    return Response(status_code=304, headers=headers)
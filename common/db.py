@@ -0,0 +1,82 @@
+import uuid
+from types import ModuleType
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, Type, TypeVar, Union
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+from starlette.concurrency import run_in_threadpool
+from common.pool_metrics import instrumented
+
+# Engine + session dùng chung cho các service; mỗi service chỉ truyền module config của mình
+# (DATABASE_URL, ASYNC_DATABASE_URL, DB_ASYNC, DB_POOL_*, DB_PGBOUNCER)
+
+T = TypeVar("T")
+
+def engine_options(config: ModuleType, poolclass: Type[Pool], is_async: bool = False) -> Dict[str, Any]:
+    """Tham số pool theo config (DB_POOL_*). DB_PGBOUNCER: connection tới PgBouncer (pool_mode=transaction)
+    nên bỏ pre-ping (PgBouncer tự kiểm tra server) và không dùng lại prepared statement giữa các transaction."""
+    options: Dict[str, Any] = {
+        "poolclass": poolclass,
+        "pool_size": config.DB_POOL_SIZE,
+        "max_overflow": config.DB_MAX_OVERFLOW,
+        "pool_timeout": config.DB_POOL_TIMEOUT,
+        "pool_recycle": config.DB_POOL_RECYCLE,
+        "pool_pre_ping": config.DB_POOL_PRE_PING and not config.DB_PGBOUNCER,
+    }
+    if config.DB_PGBOUNCER and is_async:
+        # asyncpg luôn prepare câu lệnh: tắt cache và đặt tên duy nhất để không đụng statement trên server connection khác
+        options["connect_args"] = {
+            "statement_cache_size": 0,
+            "prepared_statement_cache_size": 0,
+            "prepared_statement_name_func": lambda: f"__asyncpg_{uuid.uuid4()}__",
+        }
+    return options
+
+class Database:
+    """Engine sync (pool "sync") và, khi DB_ASYNC, engine async asyncpg (pool "async").
+
+    Engine async: route async lấy session qua get_session và gọi code ORM qua run_db, nên cùng một route
+    chạy được ở cả hai chế độ (so sánh throughput, chuyển dần). Engine sync vẫn được giữ cho route chưa
+    chuyển, worker và các lệnh CLI.
+    """
+
+    def __init__(self, config: ModuleType):
+        self.engine = create_engine(config.DATABASE_URL, **engine_options(config, instrumented(QueuePool, "sync")))
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+        self.async_engine = create_async_engine(
+            config.ASYNC_DATABASE_URL, **engine_options(config, instrumented(AsyncAdaptedQueuePool, "async"), is_async=True)
+        ) if config.DB_ASYNC else None
+        self.AsyncSessionLocal = async_sessionmaker(
+            self.async_engine, autoflush=False, expire_on_commit=False
+        ) if self.async_engine else None
+
+    def get_db(self) -> Iterator[Session]:
+        db = self.SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def get_session(self) -> AsyncIterator[Union[Session, AsyncSession]]:
+        """AsyncSession khi DB_ASYNC, ngược lại Session thường"""
+        if self.AsyncSessionLocal is None:
+            db = self.SessionLocal()
+            try:
+                yield db
+            finally:
+                db.close()
+            return
+        async with self.AsyncSessionLocal() as db:
+            yield db
+
+async def run_db(db: Union[Session, AsyncSession], fn: Callable[..., T], *args, **kwargs) -> T:
+    """Chạy fn(session, *args) viết bằng ORM sync.
+
+    AsyncSession: run_sync chạy fn trong greenlet trên connection asyncpg, không chiếm thread nào
+    (fn chỉ được làm việc với DB; việc tốn CPU/file I/O vẫn phải đưa vào threadpool).
+    Session: chạy trong threadpool như route sync.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
@@ -0,0 +1,128 @@
+import argparse
+import time
+import timeit
+import tracemalloc
+from typing import Callable, Dict, List, Optional
+from common.jwt_codec import BACKENDS, JWTCodec, TokenDecodeError, TokenExpiredError, make_codec
+
+# Đo chi phí mỗi lần ký (encode) / kiểm tra (decode) token của từng backend x thuật toán:
+#   python -m common.jwt_bench [--iterations 5000] [--repeat 5]
+# - us/op: thời gian tốt nhất trong các lần lặp (timeit), tính cho một thao tác
+# - KiB peak/op: bộ nhớ cấp phát tạm cao nhất trong một thao tác (tracemalloc), tức lượng rác GC phải dọn
+# - retained B/op: bộ nhớ còn giữ lại sau 1000 thao tác liên tiếp chia 1000 (rò rỉ / cache trong thư viện phình ra)
+# Trước khi đo, mỗi backend phải qua kiểm tra đúng: đọc được token của backend khác, từ chối chữ ký giả và token hết hạn
+
+SECRET = "benchmark-secret-key-with-32-bytes!"
+
+def sample_payload() -> Dict:
+    """Giống access token của Auth Service"""
+    now = int(time.time())
+    return {
+        "sub": "42", "username": "bench", "email": "bench@example.com", "role": "user",
+        "exp": now + 1800, "iat": now, "jti": "0f8fad5b-d9cb-469f-a165-70867728950e",
+    }
+
+def ed25519_keys() -> Optional[str]:
+    """Private key Ed25519 (PEM) tạo mới cho lần đo; None nếu thiếu cryptography"""
+    try:
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+    except ImportError:
+        return None
+    return Ed25519PrivateKey.generate().private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    ).decode("utf-8")
+
+def build_codecs(algorithms: List[str]) -> Dict[str, Dict[str, object]]:
+    """{algorithm: {backend: codec hoặc chuỗi lý do không dùng được}}"""
+    private_key = ed25519_keys()
+    codecs: Dict[str, Dict[str, object]] = {}
+    for algorithm in algorithms:
+        codecs[algorithm] = {}
+        for backend in BACKENDS:
+            try:
+                codecs[algorithm][backend] = make_codec(backend, algorithm, secret_key=SECRET, private_key=private_key)
+            except Exception as exc:
+                codecs[algorithm][backend] = f"unsupported: {exc}"
+    return codecs
+
+def check_correct(codec: JWTCodec, others: List[JWTCodec]) -> Optional[str]:
+    """None nếu đúng, ngược lại là mô tả lỗi"""
+    payload = sample_payload()
+    token = codec.encode(payload)
+    for other in [codec] + others:
+        if other.decode(token)["sub"] != payload["sub"] or codec.decode(other.encode(payload))["jti"] != payload["jti"]:
+            return f"payload mismatch with {other.backend}"
+    header, body, signature = token.split(".")
+    forged = f"{header}.{body}.{signature[:-4]}{'AAAA' if signature[-4:] != 'AAAA' else 'BBBB'}"
+    expired = codec.encode({**payload, "exp": payload["iat"] - 10})
+    for bad, expected in ((forged, TokenDecodeError), (expired, TokenExpiredError), ("not-a-token", TokenDecodeError)):
+        try:
+            codec.decode(bad)
+        except expected:
+            continue
+        except Exception as exc:
+            return f"wrong error {type(exc).__name__}"
+        return "accepted an invalid token"
+    return None
+
+def measure(fn: Callable[[], object], iterations: int, repeat: int) -> Dict[str, float]:
+    fn()  # làm nóng (import lười, cache của thư viện)
+    seconds = min(timeit.repeat(fn, number=iterations, repeat=repeat)) / iterations
+
+    tracemalloc.start()
+    peaks = []
+    for _ in range(20):
+        tracemalloc.reset_peak()
+        current = tracemalloc.get_traced_memory()[0]
+        fn()
+        peaks.append(tracemalloc.get_traced_memory()[1] - current)
+    before = tracemalloc.get_traced_memory()[0]
+    for _ in range(1000):
+        fn()
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return {"us": seconds * 1e6, "peak_kib": min(peaks) / 1024, "retained": retained / 1000}
+
+def run(algorithms: List[str], iterations: int, repeat: int) -> List[Dict]:
+    rows = []
+    codecs = build_codecs(algorithms)
+    for algorithm, by_backend in codecs.items():
+        usable = [codec for codec in by_backend.values() if isinstance(codec, JWTCodec)]
+        for backend, codec in by_backend.items():
+            if not isinstance(codec, JWTCodec):
+                rows.append({"algorithm": algorithm, "backend": backend, "error": codec})
+                continue
+            error = check_correct(codec, [other for other in usable if other is not codec])
+            if error:
+                rows.append({"algorithm": algorithm, "backend": backend, "error": f"incorrect: {error}"})
+                continue
+            payload = sample_payload()
+            token = codec.encode(payload)
+            for operation, fn in (("encode", lambda: codec.encode(payload)), ("decode", lambda: codec.decode(token))):
+                rows.append({"algorithm": algorithm, "backend": backend, "operation": operation,
+                             **measure(fn, iterations, repeat)})
+    return rows
+
+def format_rows(rows: List[Dict]) -> str:
+    lines = [f"{'algorithm':<10}{'backend':<8}{'op':<8}{'us/op':>10}{'KiB peak/op':>13}{'retained B/op':>15}"]
+    for row in rows:
+        if "error" in row:
+            lines.append(f"{row['algorithm']:<10}{row['backend']:<8}{row['error']}")
+        else:
+            lines.append(
+                f"{row['algorithm']:<10}{row['backend']:<8}{row['operation']:<8}"
+                f"{row['us']:>10.1f}{row['peak_kib']:>13.1f}{row['retained']:>15.1f}"
+            )
+    return "\n".join(lines)
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="JWT encode/decode cost per backend and algorithm")
+    parser.add_argument("--algorithms", nargs="+", default=["HS256", "EdDSA"])
+    parser.add_argument("--iterations", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    print(format_rows(run(args.algorithms, args.iterations, args.repeat)))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional
+import jwt as pyjwt
+from jose import jwk as jose_jwk, jwt as jose_jwt, ExpiredSignatureError, JWTError
+from jose.constants import ALGORITHMS as JOSE_ALGORITHMS
+
+# Mã hóa / giải mã JWT qua một interface nhỏ để đổi thư viện (python-jose, PyJWT) hoặc thuật toán bằng cấu hình
+# - HS256...: một khóa bí mật dùng chung (SECRET_KEY) cho cả ký và kiểm tra
+# - EdDSA, RS256, ES256...: Auth Service ký bằng private key, các service khác chỉ cần public key
+# - Khóa được dựng một lần khi tạo codec (không parse lại PEM / khóa ở mỗi request)
+# - Lỗi của từng thư viện được đổi về TokenDecodeError / TokenExpiredError
+# So sánh tốc độ các backend: python -m common.jwt_bench
+
+Payload = Dict[str, Any]
+
+class TokenDecodeError(Exception):
+    """Token sai chữ ký, sai định dạng hoặc claim không hợp lệ"""
+
+class TokenExpiredError(TokenDecodeError):
+    """Token đã quá exp"""
+
+class JWTCodec(ABC):
+    """encode: ký payload thành token; decode: kiểm tra chữ ký + exp/nbf/iat rồi trả về payload"""
+    backend = ""
+
+    def __init__(self, algorithm: str, signing_key: Optional[str] = None, verifying_key: Optional[str] = None):
+        self.algorithm = algorithm
+
+    @abstractmethod
+    def encode(self, payload: Payload) -> str:
+        """Ký payload thành token"""
+
+    @abstractmethod
+    def decode(self, token: str) -> Payload:
+        """Payload của token hợp lệ; ngược lại TokenDecodeError / TokenExpiredError"""
+
+class JoseCodec(JWTCodec):
+    backend = "jose"
+
+    def __init__(self, algorithm: str, signing_key: Optional[str] = None, verifying_key: Optional[str] = None):
+        if algorithm not in JOSE_ALGORITHMS.SUPPORTED:
+            raise ValueError(f"python-jose does not support {algorithm}")
+        super().__init__(algorithm, signing_key, verifying_key)
+        self._signing_key = jose_jwk.construct(signing_key, algorithm) if signing_key is not None else None
+        self._verifying_key = jose_jwk.construct(verifying_key, algorithm) if verifying_key is not None else None
+
+    def encode(self, payload: Payload) -> str:
+        if self._signing_key is None:
+            raise RuntimeError("No signing key configured (verify-only codec)")
+        return jose_jwt.encode(payload, self._signing_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> Payload:
+        try:
+            return jose_jwt.decode(token, self._verifying_key, algorithms=[self.algorithm])
+        except ExpiredSignatureError as exc:
+            raise TokenExpiredError(str(exc))
+        except JWTError as exc:
+            raise TokenDecodeError(str(exc))
+
+class PyJWTCodec(JWTCodec):
+    backend = "pyjwt"
+
+    def __init__(self, algorithm: str, signing_key: Optional[str] = None, verifying_key: Optional[str] = None):
+        try:
+            algorithm_impl = pyjwt.get_algorithm_by_name(algorithm)
+        except NotImplementedError:
+            raise ValueError(f"PyJWT does not support {algorithm}")
+        super().__init__(algorithm, signing_key, verifying_key)
+        self._signing_key = algorithm_impl.prepare_key(signing_key) if signing_key is not None else None
+        self._verifying_key = algorithm_impl.prepare_key(verifying_key) if verifying_key is not None else None
+
+    def encode(self, payload: Payload) -> str:
+        if self._signing_key is None:
+            raise RuntimeError("No signing key configured (verify-only codec)")
+        return pyjwt.encode(payload, self._signing_key, algorithm=self.algorithm)
+
+    def decode(self, token: str) -> Payload:
+        try:
+            return pyjwt.decode(token, self._verifying_key, algorithms=[self.algorithm])
+        except pyjwt.ExpiredSignatureError as exc:
+            raise TokenExpiredError(str(exc))
+        except pyjwt.InvalidTokenError as exc:
+            raise TokenDecodeError(str(exc))
+
+BACKENDS = {codec.backend: codec for codec in (JoseCodec, PyJWTCodec)}
+
+def read_key(path: Optional[str]) -> Optional[str]:
+    """Đọc khóa PEM từ file (vd. secret mount vào container); path trống thì None"""
+    if not path:
+        return None
+    with open(path, encoding="utf-8") as key_file:
+        return key_file.read()
+
+def public_key_pem(private_key: str) -> str:
+    """Public key (PEM) suy ra từ private key, cho service vừa ký vừa kiểm tra token"""
+    from cryptography.hazmat.primitives import serialization
+
+    key = serialization.load_pem_private_key(private_key.encode("utf-8"), password=None)
+    return key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo
+    ).decode("utf-8")
+
+def make_codec(backend: str, algorithm: str, secret_key: Optional[str] = None,
+               private_key: Optional[str] = None, public_key: Optional[str] = None) -> JWTCodec:
+    """HS*: ký và kiểm tra bằng secret_key; thuật toán khóa bất đối xứng: ký bằng private_key (nếu có),
+    kiểm tra bằng public_key (không có thì suy ra từ private_key)"""
+    if not algorithm:
+        raise ValueError("No JWT algorithm configured")
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown JWT backend {backend!r}, expected one of {sorted(BACKENDS)}")
+    if algorithm.upper().startswith("HS"):
+        signing_key = verifying_key = secret_key
+    else:
+        signing_key = private_key
+        verifying_key = public_key or (public_key_pem(private_key) if private_key else None)
+    if verifying_key is None:
+        raise ValueError(f"No verification key configured for {algorithm}")
+    return BACKENDS[backend](algorithm, signing_key, verifying_key)
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Type
+from sqlalchemy import event
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import Pool
+
+# Số liệu connection pool của SQLAlchemy, xuất dạng text Prometheus tại GET /metrics
+# - Gauge đọc thẳng từ pool lúc scrape: kích thước cấu hình, connection đang mượn / đang rảnh, overflow
+# - Histogram thời gian chờ lấy connection (đo quanh _do_get của pool, gồm cả lúc phải mở connection mới)
+# - Counter: timeout khi pool cạn, số connection đã mở, số connection bị invalidate (hard/soft)
+# Số liệu là của từng process (nhãn worker = pid): gunicorn nhiều worker thì mỗi worker là một series riêng
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+class PoolStats:
+    """Bộ đếm của một pool; pool là instance hiện tại (engine.dispose() tạo pool mới cùng class)"""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.pool: Optional[Pool] = None
+        self._lock = threading.Lock()
+        self.wait_buckets = [0] * len(WAIT_BUCKETS)
+        self.wait_count = 0
+        self.wait_sum = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = {"hard": 0, "soft": 0}
+        # Listener event của pool: tạo một lần để pool tạo lại sau dispose() không bị gắn trùng
+        self.listeners = {
+            "connect": lambda dbapi_conn, record: self._count("connects"),
+            "invalidate": lambda dbapi_conn, record, exc: self.count_invalidation("hard"),
+            "soft_invalidate": lambda dbapi_conn, record, exc: self.count_invalidation("soft"),
+        }
+
+    def observe_wait(self, seconds: float) -> None:
+        with self._lock:
+            self.wait_count += 1
+            self.wait_sum += seconds
+            for i, bound in enumerate(WAIT_BUCKETS):
+                if seconds <= bound:
+                    self.wait_buckets[i] += 1
+                    break
+
+    def _count(self, field: str) -> None:
+        with self._lock:
+            setattr(self, field, getattr(self, field) + 1)
+
+    def count_invalidation(self, kind: str) -> None:
+        with self._lock:
+            self.invalidations[kind] += 1
+
+REGISTRY: Dict[str, PoolStats] = {}
+
+class _InstrumentedPool:
+    """Mixin đặt trước class pool gốc (QueuePool / AsyncAdaptedQueuePool)"""
+
+    stats: PoolStats
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats.pool = self
+        for identifier, fn in self.stats.listeners.items():
+            if fn not in getattr(self.dispatch, identifier):  # pool tạo lại đã được chép listener của pool cũ
+                event.listen(self, identifier, fn)
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except PoolTimeoutError:
+            self.stats._count("timeouts")
+            raise
+        finally:
+            self.stats.observe_wait(time.perf_counter() - start)
+
+def instrumented(base: Type[Pool], name: str) -> Type[Pool]:
+    """Class pool có đo đạc, dùng làm poolclass của create_engine; số liệu đăng ký dưới nhãn pool=name"""
+    stats = PoolStats(name)
+    cls = type(f"Instrumented{base.__name__}", (_InstrumentedPool, base), {"stats": stats})
+    REGISTRY[name] = stats
+    return cls
+
+def _metric(lines: List[str], name: str, kind: str, help_text: str, samples: List[tuple]) -> None:
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for suffix, labels, value in samples:
+        label_text = ",".join(f'{key}="{val}"' for key, val in labels.items())
+        lines.append(f"{name}{suffix}{{{label_text}}} {value}")
+
+def render_metrics() -> str:
+    """Text exposition format của Prometheus cho mọi pool đã đăng ký"""
+    worker = str(os.getpid())
+    gauges = {"size": [], "checked_out": [], "checked_in": [], "overflow": []}
+    wait, timeouts, connects, invalidations = [], [], [], []
+    for stats in REGISTRY.values():
+        labels = {"pool": stats.name, "worker": worker}
+        pool = stats.pool
+        if pool is not None:
+            gauges["size"].append(("", labels, pool.size()))
+            gauges["checked_out"].append(("", labels, pool.checkedout()))
+            gauges["checked_in"].append(("", labels, pool.checkedin()))
+            gauges["overflow"].append(("", labels, max(pool.overflow(), 0)))
+        with stats._lock:
+            cumulative = 0
+            for bound, count in zip(WAIT_BUCKETS, stats.wait_buckets):
+                cumulative += count
+                wait.append(("_bucket", {**labels, "le": str(bound)}, cumulative))
+            wait.append(("_bucket", {**labels, "le": "+Inf"}, stats.wait_count))
+            wait.append(("_sum", labels, round(stats.wait_sum, 6)))
+            wait.append(("_count", labels, stats.wait_count))
+            timeouts.append(("", labels, stats.timeouts))
+            connects.append(("", labels, stats.connects))
+            for kind, count in stats.invalidations.items():
+                invalidations.append(("", {**labels, "kind": kind}, count))
+
+    lines: List[str] = []
+    _metric(lines, "db_pool_size", "gauge", "Configured pool size", gauges["size"])
+    _metric(lines, "db_pool_checked_out", "gauge", "Connections currently checked out", gauges["checked_out"])
+    _metric(lines, "db_pool_checked_in", "gauge", "Idle connections in the pool", gauges["checked_in"])
+    _metric(lines, "db_pool_overflow", "gauge", "Connections open beyond pool size", gauges["overflow"])
+    _metric(lines, "db_pool_checkout_wait_seconds", "histogram", "Time spent waiting for a connection", wait)
+    _metric(lines, "db_pool_checkout_timeouts_total", "counter", "Checkouts that hit pool_timeout", timeouts)
+    _metric(lines, "db_pool_connections_total", "counter", "New DBAPI connections opened", connects)
+    _metric(lines, "db_pool_invalidations_total", "counter", "Connections invalidated", invalidations)
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,172 @@
+import asyncio
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional, Protocol, Tuple
+import requests
+from starlette.concurrency import run_in_threadpool
+from common.bloom import BloomFilter
+
+# Danh sách token bị thu hồi (logout, refresh token đã xoay vòng) phía service nhận token
+# - Auth Service giữ bảng revoked_tokens (nguồn chính xác); mỗi worker giữ một Bloom filter các jti bị thu hồi
+# - Kiểm tra mỗi request chỉ là tra Bloom filter trong bộ nhớ; chỉ khi filter báo "có thể có" (token bị thu hồi thật
+#   hoặc dương tính giả ~error_rate) mới hỏi nguồn chính xác, kết quả được nhớ ngắn hạn
+# - sync() lấy dần các thu hồi mới theo id tăng dần; định kỳ (hoặc khi vượt capacity) dựng lại filter từ đầu
+#   để bỏ các jti đã hết hạn (token hết hạn đã bị từ chối sẵn)
+# - Hỏi nguồn chính xác lỗi (Auth Service không phản hồi) thì coi như đã thu hồi: filter đã báo "có thể có"
+
+logger = logging.getLogger("common.revocation")
+
+Revocation = Tuple[int, str, float]  # (id, jti, expires_at epoch giây)
+
+class RevocationSource(Protocol):
+    def changes(self, since: int, limit: int) -> List[Revocation]:
+        """Các thu hồi có id > since chưa hết hạn, theo id tăng dần, tối đa limit dòng"""
+
+    def is_revoked(self, jti: str) -> bool:
+        """Kiểm tra chính xác"""
+
+class HttpRevocationSource:
+    """Nguồn là Auth Service (GET /auth/revocations, GET /auth/revocations/{jti})"""
+
+    def __init__(self, base_url: str, sync_key: Optional[str] = None, timeout: float = 2.0):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        if sync_key:
+            self.session.headers["X-Sync-Key"] = sync_key
+
+    def changes(self, since: int, limit: int) -> List[Revocation]:
+        response = self.session.get(
+            f"{self.base_url}/auth/revocations", params={"since": since, "limit": limit}, timeout=self.timeout
+        )
+        response.raise_for_status()
+        return [(item["id"], item["jti"], item["expires_at"]) for item in response.json()["items"]]
+
+    def is_revoked(self, jti: str) -> bool:
+        response = self.session.get(f"{self.base_url}/auth/revocations/{jti}", timeout=self.timeout)
+        response.raise_for_status()
+        return bool(response.json()["revoked"])
+
+class RevocationFilter:
+    SYNC_OVERLAP = 50        # đọc lại vài id cuối: transaction thu hồi commit không theo thứ tự id
+    MAX_CHECKED = 10000      # số kết quả kiểm tra chính xác được nhớ
+
+    def __init__(self, source: RevocationSource, capacity: int = 10000, error_rate: float = 0.01,
+                 rebuild_seconds: float = 3600, check_ttl: float = 5.0, page_size: int = 1000):
+        self.source = source
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.rebuild_seconds = rebuild_seconds
+        self.check_ttl = check_ttl
+        self.page_size = page_size
+        self.filter = BloomFilter(capacity, error_rate)
+        self.last_id = 0
+        self.lookups = 0
+        self.filter_hits = 0
+        self.false_positives = 0
+        self._built_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self._checked: "OrderedDict[str, Tuple[float, bool]]" = OrderedDict()
+
+    def _fetch(self, since: int) -> List[Revocation]:
+        entries: List[Revocation] = []
+        while True:
+            page = self.source.changes(since, self.page_size)
+            entries.extend(page)
+            if len(page) < self.page_size:
+                return entries
+            since = page[-1][0]
+
+    def sync(self) -> int:
+        """Cập nhật filter; trả về số thu hồi mới nhận"""
+        if (self._built_at is None or time.monotonic() - self._built_at > self.rebuild_seconds
+                or self.filter.count > self.filter.capacity):
+            return self.rebuild()
+        entries = self._fetch(max(0, self.last_id - self.SYNC_OVERLAP))
+        added = 0
+        with self._lock:
+            for revocation_id, jti, _ in entries:
+                if jti not in self.filter:
+                    self.filter.add(jti)
+                    added += 1
+                self.last_id = max(self.last_id, revocation_id)
+        return added
+
+    def rebuild(self) -> int:
+        entries = self._fetch(0)
+        fresh = BloomFilter(max(self.capacity, 2 * len(entries)), self.error_rate)
+        for _, jti, _ in entries:
+            fresh.add(jti)
+        with self._lock:
+            self.filter = fresh
+            self.last_id = max([self.last_id] + [revocation_id for revocation_id, _, _ in entries])
+            self._built_at = time.monotonic()
+        logger.info("Revocation filter rebuilt: %d entries, %d bytes", len(entries), fresh.byte_size)
+        return len(entries)
+
+    def add(self, jti: str) -> None:
+        """Thu hồi ngay trong process này (vd. Auth Service vừa xử lý logout), không chờ sync"""
+        with self._lock:
+            self.filter.add(jti)
+            self._checked[jti] = (time.monotonic() + self.rebuild_seconds, True)
+
+    def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti:
+            return False
+        with self._lock:
+            self.lookups += 1
+            if jti not in self.filter:
+                return False
+            self.filter_hits += 1
+            checked = self._checked.get(jti)
+            if checked is not None and checked[0] > time.monotonic():
+                self._checked.move_to_end(jti)
+                return checked[1]
+        try:
+            revoked = self.source.is_revoked(jti)
+        except Exception:
+            logger.warning("Exact revocation check failed for a filter hit, treating token as revoked", exc_info=True)
+            return True
+        with self._lock:
+            if not revoked:
+                self.false_positives += 1
+            # Đã thu hồi thì không bao giờ hết; "chưa thu hồi" chỉ nhớ tới lần sync sau
+            ttl = self.rebuild_seconds if revoked else self.check_ttl
+            self._checked[jti] = (time.monotonic() + ttl, revoked)
+            self._checked.move_to_end(jti)
+            while len(self._checked) > self.MAX_CHECKED:
+                self._checked.popitem(last=False)
+        return revoked
+
+    def render_metrics(self, labels: str) -> str:
+        """Prometheus text format"""
+        return (
+            "# HELP revocation_lookups_total Tokens checked against the revocation filter\n"
+            "# TYPE revocation_lookups_total counter\n"
+            f"revocation_lookups_total{{{labels}}} {self.lookups}\n"
+            "# HELP revocation_filter_hits_total Filter hits that needed an exact check\n"
+            "# TYPE revocation_filter_hits_total counter\n"
+            f"revocation_filter_hits_total{{{labels}}} {self.filter_hits}\n"
+            "# HELP revocation_false_positives_total Filter hits that were not revoked\n"
+            "# TYPE revocation_false_positives_total counter\n"
+            f"revocation_false_positives_total{{{labels}}} {self.false_positives}\n"
+            "# HELP revocation_filter_entries Revoked token ids in the filter\n"
+            "# TYPE revocation_filter_entries gauge\n"
+            f"revocation_filter_entries{{{labels}}} {self.filter.count}\n"
+            "# HELP revocation_filter_bytes Memory used by the filter bit array\n"
+            "# TYPE revocation_filter_bytes gauge\n"
+            f"revocation_filter_bytes{{{labels}}} {self.filter.byte_size}\n"
+        )
+
+async def revocation_sync_loop(revocations: RevocationFilter, interval: float) -> None:
+    """Chạy trong lifespan của service: sync filter mỗi interval giây"""
+    while True:
+        try:
+            added = await run_in_threadpool(revocations.sync)
+            if added:
+                logger.info("Revocation filter: %d new revoked tokens", added)
+        except Exception:
+            logger.exception("Revocation sync failed")
+        await asyncio.sleep(interval)
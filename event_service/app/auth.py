@@ -1,7 +1,9 @@
 from fastapi import HTTPException, status, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, ExpiredSignatureError, JWTError
 from typing import Dict, Any, Optional
+from common.auth_tokens import InvalidToken, TokenValidator, VerifiedTokenCache
+from common.jwt_codec import make_codec, read_key
+from common.revocation import HttpRevocationSource, RevocationFilter
 import app.config as config
 
 # Scheme bắt buộc (Mặc định báo lỗi nếu thiếu token)
@@ -10,31 +12,29 @@ bearer_scheme = HTTPBearer(auto_error=True)
 # Scheme tùy chọn (Không báo lỗi nếu thiếu token, trả về None)
 bearer_scheme_optional = HTTPBearer(auto_error=False)
 
+# Có AUTH_SERVICE_URL: token đã thu hồi (logout) bị từ chối; chỉ jti trúng Bloom filter mới phải hỏi Auth Service
+revocations = RevocationFilter(
+    HttpRevocationSource(config.AUTH_SERVICE_URL, config.REVOCATION_SYNC_KEY),
+    capacity=config.REVOCATION_FILTER_CAPACITY,
+    error_rate=config.REVOCATION_FILTER_ERROR_RATE,
+    rebuild_seconds=config.REVOCATION_REBUILD_SECONDS,
+    check_ttl=config.REVOCATION_SYNC_INTERVAL,
+) if config.AUTH_SERVICE_URL else None
+
+# Token đã kiểm tra được cache (slideshow, trang admin gửi lại cùng token liên tục)
+token_validator = TokenValidator(
+    make_codec(config.JWT_BACKEND, config.ALGORITHM, secret_key=config.SECRET_KEY,
+               public_key=read_key(config.JWT_PUBLIC_KEY_FILE)),
+    VerifiedTokenCache(config.TOKEN_CACHE_SIZE, config.TOKEN_CACHE_TTL),
+    revocations=revocations,
+)
+
 def decode_and_validate_token(token: str) -> Dict[str, Any]:
     """Hàm phụ trợ để giải mã và kiểm tra token"""
     try:
-        payload = jwt.decode(token, config.SECRET_KEY, algorithms=[config.ALGORITHM])
-        user_id = payload.get("sub")
-        username = payload.get("username")
-        email = payload.get("email")
-        role = payload.get("role")
-
-        if user_id is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
-            )
-
-        return {
-            "user_id": int(user_id),
-            "username": username,
-            "email": email,
-            "role": role
-        }
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        return token_validator.validate(token)
+    except InvalidToken as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=exc.detail)
 
 def get_current_user(auth: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> Dict[str, Any]:
     """Dùng cho các route BẮT BUỘC đăng nhập"""
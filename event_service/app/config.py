@@ -11,11 +11,36 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# DB_ASYNC=true: route async dùng AsyncSession (asyncpg) thay vì Session sync trong threadpool
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Connection pool của mỗi process: tổng connection tới DB = số worker x (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))   # chờ connection rảnh tối đa (giây) rồi báo lỗi
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))     # đóng connection cũ hơn số giây này (-1: không)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# DB_PGBOUNCER=true: DB_HOST/DB_PORT là PgBouncer chế độ transaction pooling (không pre-ping, không cache prepared statement)
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
 
 # JWT
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Thư viện JWT: jose | pyjwt; ALGORITHM bất đối xứng (EdDSA...) thì kiểm tra bằng public key của Auth Service (file PEM)
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose")
+JWT_PUBLIC_KEY_FILE = os.getenv("JWT_PUBLIC_KEY_FILE")
+# Cache access token đã kiểm tra (mỗi worker): số mục tối đa, thời gian sống (giây, không quá exp của token)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 300))
+
+# Thu hồi token (logout): Bloom filter jti bị thu hồi đồng bộ từ Auth Service; AUTH_SERVICE_URL trống thì tắt
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL")
+REVOCATION_SYNC_KEY = os.getenv("REVOCATION_SYNC_KEY")                     # trùng với Auth Service
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", 5))  # giây; logout có hiệu lực ở đây chậm tối đa chừng này
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", 10000))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", 0.01))
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", 3600))
 
 # Service
-SERVICE_BASE_URL = os.getenv("SERVICE_BASE_URL")
\ No newline at end of file
+SERVICE_BASE_URL = os.getenv("SERVICE_BASE_URL")
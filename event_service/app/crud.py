@@ -0,0 +1,87 @@
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+import sqlalchemy as sa
+from datetime import date
+from typing import Any, Dict, List, Optional
+from app.models import Event
+from app.schemas import EventCreate, EventUpdate
+from app.qr import generate_qr_token
+
+# Truy vấn DB của Event Service, viết bằng ORM sync: route async gọi qua db.run_db
+# (AsyncSession.run_sync khi DB_ASYNC, threadpool khi không)
+
+# Các cột đủ để kiểm tra quyền + phiên bản, không tải/serialize cả event (conditional GET)
+VERSION_COLUMNS = (
+    Event.id, Event.version, Event.created_at, Event.updated_at,
+    Event.access_level, Event.qr_token, Event.created_by,
+)
+
+def create_event(db: Session, payload: EventCreate, created_by: int) -> Event:
+    ev = Event(
+        title=payload.title,
+        description=payload.description,
+        event_date=payload.event_date,
+        location=payload.location,
+        access_level=payload.access_level or "private",
+        created_by=created_by
+    )
+    db.add(ev)
+    db.commit()
+    db.refresh(ev)
+    return ev
+
+def get_event(db: Session, event_id: int) -> Optional[Event]:
+    return db.query(Event).filter(Event.id == event_id).first()
+
+def get_event_version(db: Session, event_id: int):
+    """Quyền truy cập + phiên bản của event (VERSION_COLUMNS), None: không có event"""
+    return db.query(*VERSION_COLUMNS).filter(Event.id == event_id).first()
+
+def _visible_events(db: Session, user: Dict[str, Any], date_from: Optional[date], date_to: Optional[date]):
+    q = db.query(Event)
+
+    # Logic: Admin thấy tất cả. User thấy cái mình tạo + cái người khác công khai (Public)
+    if user["role"] != "admin":
+        q = q.filter(
+            or_(
+                Event.created_by == user["user_id"],
+                Event.access_level == "public"
+            )
+        )
+
+    if date_from:
+        q = q.filter(sa.func.date(Event.event_date) >= date_from)
+    if date_to:
+        q = q.filter(sa.func.date(Event.event_date) <= date_to)
+    return q
+
+def list_events_version(db: Session, user: Dict[str, Any], date_from: Optional[date] = None, date_to: Optional[date] = None) -> tuple:
+    """Một query tổng hợp trên cùng bộ lọc với list_events: thêm/xóa đổi count + max(id), sửa đổi sum(version)"""
+    return tuple(_visible_events(db, user, date_from, date_to).with_entities(
+        sa.func.count(Event.id),
+        sa.func.max(Event.id),
+        sa.func.sum(Event.version),
+        sa.func.max(sa.func.coalesce(Event.updated_at, Event.created_at)),
+    ).one())
+
+def list_events(db: Session, user: Dict[str, Any], date_from: Optional[date] = None, date_to: Optional[date] = None) -> List[Event]:
+    return _visible_events(db, user, date_from, date_to).order_by(Event.event_date.desc()).all()
+
+def update_event(db: Session, ev: Event, payload: EventUpdate) -> Event:
+    for field, value in payload.model_dump(exclude_unset=True).items():
+        setattr(ev, field, value)
+    db.commit()
+    db.refresh(ev)
+    return ev
+
+def delete_event(db: Session, ev: Event) -> None:
+    db.delete(ev)
+    db.commit()
+
+def ensure_qr_token(db: Session, ev: Event) -> Event:
+    # Chỉ tạo mới nếu chưa có, hoặc user muốn refresh
+    if not ev.qr_token:
+        ev.qr_token = generate_qr_token()
+        db.commit()
+        db.refresh(ev)
+    return ev
@@ -1,11 +1,23 @@
+import asyncio
 from fastapi import FastAPI
-from contextlib import asynccontextmanager
+from fastapi.responses import PlainTextResponse
+from contextlib import asynccontextmanager, suppress
+from common.revocation import revocation_sync_loop
 from app.db import Base, engine
 from app.routes import router as event_router
+from app.auth import revocations, token_validator
+from app.config import REVOCATION_SYNC_INTERVAL
+from common.pool_metrics import render_metrics
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Đồng bộ danh sách token bị thu hồi từ Auth Service
+    sync_task = asyncio.create_task(revocation_sync_loop(revocations, REVOCATION_SYNC_INTERVAL)) if revocations else None
     yield
+    if sync_task is not None:
+        sync_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await sync_task
 
 app = FastAPI(title="Event Service", version="0.1.0", lifespan=lifespan)
 
@@ -13,4 +25,9 @@ app = FastAPI(title="Event Service", version="0.1.0", lifespan=lifespan)
 def health():
     return {"status": "ok"}
 
+# Số liệu connection pool, cache token và revocation filter (Prometheus text format) của worker nhận request
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics() + token_validator.render_metrics(), media_type="text/plain; version=0.0.4")
+
 app.include_router(event_router)
\ No newline at end of file
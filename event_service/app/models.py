@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime
+from sqlalchemy import Column, Integer, String, Text, DateTime, text
 from sqlalchemy.sql import func
 from sqlalchemy.types import Date
 from app.db import Base
@@ -20,4 +20,8 @@ class Event(Base):
     qr_token = Column(String(128), nullable=True, unique=True, index=True)
 
     created_at = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
\ No newline at end of file
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # phiên bản của dòng (ETag cho conditional GET): tăng trong chính câu UPDATE, không kiểm tra optimistic
+    # nên hai PATCH đồng thời đều thành công (bản sau thắng) thay vì StaleDataError
+    version = Column(Integer, nullable=False, server_default="1", onupdate=text("version + 1"))
\ No newline at end of file
@@ -1,136 +1,119 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from sqlalchemy.orm import Session
-from sqlalchemy import or_
-import sqlalchemy as sa
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Request, Response
 from typing import List, Optional
 from datetime import date
-from app.db import get_db
-from app.models import Event
+from app import crud
+from app.db import get_session, run_db
 from app.schemas import EventCreate, EventRead, EventUpdate, QRResponse
 from app.auth import get_current_user, get_current_user_optional
-from app.qr import generate_qr_token, build_share_url
+from app.qr import build_share_url
+from common.conditional import is_not_modified, make_etag, not_modified, validator_headers
 
 router = APIRouter(prefix="/events", tags=["events"])
 
-@router.post("", response_model=EventRead, status_code=status.HTTP_201_CREATED)
-def create_event(payload: EventCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    if user["role"] not in ["user", "admin"]:
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+# Route async: DB đi qua run_db (AsyncSession khi DB_ASYNC=true, threadpool khi không)
 
-    ev = Event(
-        title=payload.title,
-        description=payload.description,
-        event_date=payload.event_date,
-        location=payload.location,
-        access_level=payload.access_level or "private",
-        created_by=user["user_id"]
-    )
-    db.add(ev)
-    db.commit()
-    db.refresh(ev)
-    return ev
+def event_validators(row) -> dict:
+    """ETag theo version của dòng, Last-Modified theo updated_at (event chưa sửa lần nào: created_at)"""
+    return validator_headers(make_etag("event", row.id, row.version), row.updated_at or row.created_at)
 
-@router.get("/{event_id}", response_model=EventRead)
-def get_event(
-    event_id: int, 
-    qr_token: Optional[str] = Query(None), 
-    db: Session = Depends(get_db), 
-    user=Depends(get_current_user_optional)
-):
-    ev = db.query(Event).filter(Event.id == event_id).first()
+async def get_owned_event(event_id: int, db, user):
+    """Event mà user được sửa (chủ hoặc admin), không thì 404/403"""
+    ev = await run_db(db, crud.get_event, event_id)
     if not ev:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
-    
+    if ev.created_by != user["user_id"] and user["role"] != "admin":
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    return ev
+
+@router.post("", response_model=EventRead, status_code=status.HTTP_201_CREATED)
+async def create_event(payload: EventCreate, db=Depends(get_session), user=Depends(get_current_user)):
+    if user["role"] not in ["user", "admin"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
+    return await run_db(db, crud.create_event, payload, user["user_id"])
+
+def can_view(ev, qr_token: Optional[str], user) -> bool:
     # LOGIC KIỂM TRA QUYỀN TRUY CẬP (ACCESS CONTROL):
     # 1. Nếu là Public -> Cho xem
     if ev.access_level == "public":
-        return ev
-    
+        return True
+
     # 2. Nếu có QR Token khớp -> Cho xem (Dành cho khách quét mã)
     if qr_token and ev.qr_token == qr_token:
-        return ev
-        
+        return True
+
     # 3. Nếu đã login và là chủ/admin -> Cho xem
-    if user and (ev.created_by == user["user_id"] or user["role"] == "admin"):
-        return ev
+    return bool(user and (ev.created_by == user["user_id"] or user["role"] == "admin"))
 
-    raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Truy cập bị từ chối")
+@router.get("/{event_id}", response_model=EventRead)
+async def get_event(
+    event_id: int,
+    request: Request,
+    response: Response,
+    qr_token: Optional[str] = Query(None),
+    db=Depends(get_session),
+    user=Depends(get_current_user_optional)
+):
+    row = await run_db(db, crud.get_event_version, event_id)
+    if not row:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
+    if not can_view(row, qr_token, user):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Truy cập bị từ chối")
+
+    # Kiểm tra quyền trước rồi mới trả 304, client không có quyền không dò được phiên bản
+    headers = event_validators(row)
+    if is_not_modified(request, headers["ETag"], row.updated_at or row.created_at):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return await run_db(db, crud.get_event, event_id)
 
 @router.get("", response_model=List[EventRead])
-def list_events(
-    db: Session = Depends(get_db),
+async def list_events(
+    request: Request,
+    response: Response,
+    db=Depends(get_session),
     user=Depends(get_current_user), # Trang danh sách thường dành cho user đã login
     date_from: Optional[date] = None,
     date_to: Optional[date] = None
 ):
-    q = db.query(Event)
-    
-    # Logic: Admin thấy tất cả. User thấy cái mình tạo + cái người khác công khai (Public)
-    if user["role"] != "admin":
-        q = q.filter(
-            or_(
-                Event.created_by == user["user_id"],
-                Event.access_level == "public"
-            )
-        )
-        
-    if date_from:
-        q = q.filter(sa.func.date(Event.event_date) >= date_from)
-    if date_to:
-        q = q.filter(sa.func.date(Event.event_date) <= date_to)
-        
-    return q.order_by(Event.event_date.desc()).all()
+    # ETag từ query tổng hợp; danh sách không gửi Last-Modified vì xóa event không làm thời điểm sửa lớn nhất thay đổi
+    summary = await run_db(db, crud.list_events_version, user, date_from, date_to)
+    headers = validator_headers(make_etag("events", user["user_id"], user["role"], date_from, date_to, *summary))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return await run_db(db, crud.list_events, user, date_from, date_to)
 
 @router.patch("/{event_id}", response_model=EventRead)
-def update_event(event_id: int, payload: EventUpdate, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    ev = db.query(Event).filter(Event.id == event_id).first()
-    if not ev:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
-    if ev.created_by != user["user_id"] and user["role"] != "admin":
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-
-    for field, value in payload.model_dump(exclude_unset=True).items():
-        setattr(ev, field, value)
-    db.commit()
-    db.refresh(ev)
-    return ev
+async def update_event(event_id: int, payload: EventUpdate, db=Depends(get_session), user=Depends(get_current_user)):
+    ev = await get_owned_event(event_id, db, user)
+    return await run_db(db, crud.update_event, ev, payload)
 
 @router.delete("/{event_id}", status_code=status.HTTP_204_NO_CONTENT)
-def delete_event(event_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    ev = db.query(Event).filter(Event.id == event_id).first()
-    if not ev:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
-    if ev.created_by != user["user_id"] and user["role"] != "admin":
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-    db.delete(ev)
-    db.commit()
+async def delete_event(event_id: int, db=Depends(get_session), user=Depends(get_current_user)):
+    ev = await get_owned_event(event_id, db, user)
+    await run_db(db, crud.delete_event, ev)
     return
 
 @router.post("/{event_id}/qr", response_model=QRResponse)
-def generate_event_qr(event_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    ev = db.query(Event).filter(Event.id == event_id).first()
-    if not ev:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
-    if ev.created_by != user["user_id"] and user["role"] != "admin":
-        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Forbidden")
-
-    # Chỉ tạo mới nếu chưa có, hoặc user muốn refresh
-    if not ev.qr_token:
-        ev.qr_token = generate_qr_token()
-        db.commit()
-        db.refresh(ev)
-
+async def generate_event_qr(event_id: int, db=Depends(get_session), user=Depends(get_current_user)):
+    ev = await get_owned_event(event_id, db, user)
+    ev = await run_db(db, crud.ensure_qr_token, ev)
     share_url = build_share_url(ev.id, ev.qr_token)
     return QRResponse(event_id=ev.id, qr_token=ev.qr_token, share_url=share_url)
 
 @router.get("/share/{event_id}", response_model=EventRead)
-def access_event_via_qr(event_id: int, token: str, db: Session = Depends(get_db)):
-    ev = db.query(Event).filter(Event.id == event_id).first()
-    if not ev:
+async def access_event_via_qr(event_id: int, token: str, request: Request, response: Response, db=Depends(get_session)):
+    row = await run_db(db, crud.get_event_version, event_id)
+    if not row:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event not found")
 
-    if ev.access_level != "public":
-        if not ev.qr_token or ev.qr_token != token:
+    if row.access_level != "public":
+        if not row.qr_token or row.qr_token != token:
             raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Mã QR không hợp lệ")
 
-    return ev
\ No newline at end of file
+    # Trang chia sẻ được mở lại nhiều lần trên điện thoại: không đổi thì trả 304
+    headers = event_validators(row)
+    if is_not_modified(request, headers["ETag"], row.updated_at or row.created_at):
+        return not_modified(headers)
+    response.headers.update(headers)
+    return await run_db(db, crud.get_event, event_id)
@@ -1,7 +1,7 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
-from app.auth import get_current_user
+from app.auth import get_current_user, get_current_user_optional
 
 # Mock đầy đủ user_id và role
 def mocked_get_current_user():
@@ -112,10 +112,254 @@ def test_update_event():
     assert response.json()["title"] == "Sự kiện đã đổi tên"
 
 
+def test_conditional_get():
+    """ETag theo version, Last-Modified theo updated_at; không đổi thì 304, sửa xong thì ETag mới"""
+    event_id = test_context["public_event_id"]
+    response = client.get(f"/events/{event_id}")
+    assert response.status_code == 200
+    etag, last_modified = response.headers["etag"], response.headers["last-modified"]
+
+    assert client.get(f"/events/{event_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/events/{event_id}", headers={"If-Modified-Since": last_modified}).status_code == 304
+    assert client.get(f"/events/share/{event_id}?token=x", headers={"If-None-Match": etag}).status_code == 304
+
+    # Event private: không có quyền thì vẫn 403, không lộ phiên bản qua 304
+    private_id = test_context["private_event_id"]
+    app.dependency_overrides[get_current_user_optional] = mocked_get_current_user
+    private_etag = client.get(f"/events/{private_id}").headers["etag"]
+    app.dependency_overrides.clear()
+    assert client.get(f"/events/{private_id}", headers={"If-None-Match": private_etag}).status_code == 403
+    app.dependency_overrides[get_current_user] = mocked_get_current_user
+
+    list_etag = client.get("/events").headers["etag"]
+    assert client.get("/events", headers={"If-None-Match": list_etag}).status_code == 304
+
+    assert client.patch(f"/events/{event_id}", json={"location": "Đà Nẵng"}).status_code == 200
+    response = client.get(f"/events/{event_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    assert client.get("/events", headers={"If-None-Match": list_etag}).status_code == 200
+
+
+def test_concurrent_update():
+    """Hai PATCH cùng đọc một phiên bản: cả hai đều ghi được (không StaleDataError), version tăng đủ hai lần"""
+    from app import crud
+    from app.db import SessionLocal
+    from app.schemas import EventUpdate
+
+    event_id = test_context["public_event_id"]
+    first, second = SessionLocal(), SessionLocal()
+    try:
+        ev_first, ev_second = crud.get_event(first, event_id), crud.get_event(second, event_id)
+        version = ev_first.version
+        crud.update_event(first, ev_first, EventUpdate(location="Huế"))
+        updated = crud.update_event(second, ev_second, EventUpdate(location="Hội An"))
+        assert (updated.location, updated.version) == ("Hội An", version + 2)
+    finally:
+        first.close()
+        second.close()
+
+
 def test_delete_events():
     """Dọn dẹp: Xóa các sự kiện test"""
     for key in ["public_event_id", "private_event_id"]:
         eid = test_context[key]
         if eid:
             response = client.delete(f"/events/{eid}")
-            assert response.status_code == 204
\ No newline at end of file
+            assert response.status_code == 204
+
+def test_async_session_mode(monkeypatch):
+    """DB_ASYNC: cùng các route chạy trên AsyncSession (asyncpg) thay vì Session sync"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+    import app.config as config
+    import app.db as db_module
+
+    async_engine = create_async_engine(config.ASYNC_DATABASE_URL, poolclass=NullPool)
+    monkeypatch.setattr(db_module.database, "AsyncSessionLocal", async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    monkeypatch.setitem(app.dependency_overrides, get_current_user_optional, mocked_get_current_user)
+    with TestClient(app) as async_client:
+        payload = {"title": "Async", "event_date": "2026-07-01T09:00:00", "access_level": "private"}
+        created = async_client.post("/events", json=payload)
+        assert created.status_code == 201
+        event_id = created.json()["id"]
+
+        response = async_client.get(f"/events/{event_id}")
+        assert response.status_code == 200 and response.json()["title"] == "Async"
+        assert async_client.get(f"/events/{event_id}", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+        assert async_client.patch(f"/events/{event_id}", json={"title": "Async 2"}).json()["title"] == "Async 2"
+        qr = async_client.post(f"/events/{event_id}/qr").json()
+        assert async_client.get(f"/events/share/{event_id}?token={qr['qr_token']}").status_code == 200
+        assert event_id in [ev["id"] for ev in async_client.get("/events").json()]
+        assert async_client.delete(f"/events/{event_id}").status_code == 204
+        assert async_client.get(f"/events/{event_id}").status_code == 404
+
+def test_pool_metrics():
+    """/metrics xuất số liệu connection pool của worker"""
+    client.get("/events")
+    response = client.get("/metrics")
+    assert response.status_code == 200 and response.headers["content-type"].startswith("text/plain")
+    for name in ("db_pool_size", "db_pool_checked_out", "db_pool_overflow", "db_pool_checkout_wait_seconds_count",
+                 "db_pool_invalidations_total"):
+        assert f'{name}{{pool="sync"' in response.text
+
+def test_verified_token_cache(monkeypatch):
+    """Token hợp lệ chỉ giải mã JWT một lần; mục cache không sống quá exp của token; token lỗi không được cache"""
+    import time
+    from jose import jwt
+    import app.config as config
+    from app.auth import decode_and_validate_token, token_validator
+    from common.auth_tokens import VerifiedTokenCache
+    from fastapi import HTTPException
+
+    cache = token_validator.cache
+    cache.clear()
+    decodes = []
+    original_decode = token_validator.decode
+    monkeypatch.setattr(token_validator, "decode", lambda token: decodes.append(token) or original_decode(token))
+
+    exp = int(time.time()) + 60
+    token = jwt.encode({"sub": "7", "username": "cached", "role": "user", "exp": exp}, config.SECRET_KEY, algorithm=config.ALGORITHM)
+    hits, misses = cache.hits, cache.misses
+    for _ in range(5):
+        user = decode_and_validate_token(token)
+        assert user["user_id"] == 7
+        user["role"] = "admin"  # sửa bản trả về không ảnh hưởng cache
+    assert len(decodes) == 1 and cache.hits - hits == 4 and cache.misses - misses == 1
+    assert decode_and_validate_token(token)["role"] == "user"
+
+    key = cache.key(token)
+    assert cache._entries[key][0] <= exp
+    assert cache.get(key, now=exp) is None  # quá exp là hết hiệu lực dù TTL còn
+    decode_and_validate_token(token)
+    assert len(decodes) == 2
+
+    expired = jwt.encode({"sub": "7", "exp": int(time.time()) - 1}, config.SECRET_KEY, algorithm=config.ALGORITHM)
+    for _ in range(2):
+        with pytest.raises(HTTPException) as exc:
+            decode_and_validate_token(expired)
+        assert exc.value.detail == "Token expired"
+    assert len(decodes) == 4 and cache.key(expired) not in cache._entries
+
+    # LRU: đầy thì bỏ mục lâu không dùng nhất
+    small = VerifiedTokenCache(max_entries=2, ttl=60)
+    for name in (b"a", b"b"):
+        small.put(name, {"user_id": 1}, exp=None)
+    small.get(b"a")
+    small.put(b"c", {"user_id": 3}, exp=None)
+    assert small.get(b"b") is None and small.get(b"a") and small.get(b"c")
+
+    body = client.get("/metrics").text
+    assert "token_cache_hits_total{" in body and "token_cache_misses_total{" in body
+
+def test_revocation_filter(monkeypatch):
+    """Token bị thu hồi bị từ chối kể cả khi đã nằm trong cache; jti không trúng filter thì không hỏi Auth Service"""
+    import time
+    from jose import jwt
+    import app.config as config
+    from app.auth import decode_and_validate_token, token_validator
+    from common.bloom import BloomFilter
+    from common.revocation import RevocationFilter
+    from fastapi import HTTPException
+
+    class FakeSource:
+        def __init__(self):
+            self.rows = []
+            self.checks = []
+
+        def changes(self, since, limit):
+            return [row for row in self.rows if row[0] > since][:limit]
+
+        def is_revoked(self, jti):
+            self.checks.append(jti)
+            return any(row[1] == jti for row in self.rows)
+
+    source = FakeSource()
+    revocations = RevocationFilter(source, capacity=1000, error_rate=0.01, page_size=2)
+    monkeypatch.setattr(token_validator, "revocations", revocations)
+
+    exp = int(time.time()) + 60
+    tokens = {
+        jti: jwt.encode({"sub": "7", "jti": jti, "exp": exp}, config.SECRET_KEY, algorithm=config.ALGORITHM)
+        for jti in ("keep", "drop")
+    }
+    revocations.sync()
+    assert decode_and_validate_token(tokens["drop"])["jti"] == "drop"  # vào cache trước khi bị thu hồi
+
+    source.rows = [(1, "old-1", exp), (2, "old-2", exp), (3, "drop", exp)]
+    assert revocations.sync() == 3 and revocations.last_id == 3  # đọc qua nhiều trang
+    with pytest.raises(HTTPException) as exc:
+        decode_and_validate_token(tokens["drop"])
+    assert exc.value.detail == "Token revoked"
+    assert decode_and_validate_token(tokens["keep"])["user_id"] == 7
+    assert source.checks == ["drop"]
+    # Kết quả kiểm tra chính xác được nhớ: không hỏi lại
+    with pytest.raises(HTTPException):
+        decode_and_validate_token(tokens["drop"])
+    assert source.checks == ["drop"]
+
+    # Dương tính giả: filter báo có nhưng nguồn chính xác nói không -> token vẫn hợp lệ
+    class AlwaysHit(BloomFilter):
+        def __contains__(self, item):
+            return True
+    revocations.filter = AlwaysHit(1000)
+    assert decode_and_validate_token(tokens["keep"])["user_id"] == 7
+    assert source.checks == ["drop", "keep"] and revocations.false_positives == 1
+
+    # Nguồn chính xác lỗi khi filter trúng: coi như đã thu hồi
+    def unavailable(jti):
+        raise ConnectionError("auth service down")
+    monkeypatch.setattr(source, "is_revoked", unavailable)
+    fresh = jwt.encode({"sub": "7", "jti": "fresh", "exp": exp}, config.SECRET_KEY, algorithm=config.ALGORITHM)
+    with pytest.raises(HTTPException):
+        decode_and_validate_token(fresh)
+
+    # Tỉ lệ dương tính giả của Bloom filter xấp xỉ error_rate khi đủ capacity
+    bloom = BloomFilter(capacity=2000, error_rate=0.01)
+    for i in range(2000):
+        bloom.add(f"revoked-{i}")
+    assert all(f"revoked-{i}" in bloom for i in range(2000))
+    false_hits = sum(f"other-{i}" in bloom for i in range(10000))
+    assert false_hits < 300 and bloom.byte_size < 3000
+
+    body = client.get("/metrics").text
+    assert "revocation_filter_hits_total{" in body and "revocation_false_positives_total{" in body
+
+def test_jwt_codecs():
+    """Các backend JWT đọc được token của nhau; EdDSA: chỉ có public key thì kiểm tra được nhưng không ký được"""
+    import time
+    from common.jwt_bench import ed25519_keys, run
+    from common.jwt_codec import JWTCodec, TokenDecodeError, TokenExpiredError, make_codec, public_key_pem
+
+    payload = {"sub": "7", "username": "codec", "exp": int(time.time()) + 60, "jti": "abc"}
+    jose_codec = make_codec("jose", "HS256", secret_key="codec-secret-key-at-least-32-bytes-long")
+    pyjwt_codec = make_codec("pyjwt", "HS256", secret_key="codec-secret-key-at-least-32-bytes-long")
+    assert pyjwt_codec.decode(jose_codec.encode(payload)) == payload
+    assert jose_codec.decode(pyjwt_codec.encode(payload)) == payload
+    with pytest.raises(TokenExpiredError):
+        pyjwt_codec.decode(jose_codec.encode({**payload, "exp": int(time.time()) - 5}))
+    with pytest.raises(TokenDecodeError):
+        jose_codec.decode(make_codec("jose", "HS256", secret_key="other").encode(payload))
+
+    private_key = ed25519_keys()
+    signer = make_codec("pyjwt", "EdDSA", private_key=private_key)
+    verifier = make_codec("pyjwt", "EdDSA", public_key=public_key_pem(private_key))
+    assert verifier.decode(signer.encode(payload))["sub"] == "7"
+    with pytest.raises(RuntimeError):
+        verifier.encode(payload)
+    with pytest.raises(TokenDecodeError):
+        verifier.decode(pyjwt_codec.encode(payload))  # HS256 không qua được codec EdDSA
+    with pytest.raises(ValueError):
+        make_codec("jose", "EdDSA", private_key=private_key)
+    with pytest.raises(ValueError):
+        make_codec("pyjwt", "EdDSA")
+
+    class EncodeOnly(JWTCodec):
+        def encode(self, payload):
+            return ""
+    with pytest.raises(TypeError):
+        EncodeOnly("HS256")  # backend thiếu decode bị phát hiện ngay khi tạo
+
+    rows = run(["HS256", "EdDSA"], iterations=20, repeat=1)
+    measured = {(row["algorithm"], row["backend"], row["operation"]) for row in rows if "error" not in row}
+    assert ("HS256", "jose", "decode") in measured and ("EdDSA", "pyjwt", "encode") in measured
+    assert [row["backend"] for row in rows if "error" in row] == ["jose"]  # python-jose không có EdDSA
@@ -0,0 +1,28 @@
+"""media perceptual hash
+
+Revision ID: a9c3e5f7b2d1
+Revises: f4a7c2e9b0d5
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a9c3e5f7b2d1'
+down_revision: Union[str, Sequence[str], None] = 'f4a7c2e9b0d5'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('media', sa.Column('dhash', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('media', 'dhash')
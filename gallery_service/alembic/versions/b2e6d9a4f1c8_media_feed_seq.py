@@ -0,0 +1,31 @@
+"""media feed seq
+
+Revision ID: b2e6d9a4f1c8
+Revises: f7b1d5e3a9c4
+Create Date: 2026-10-19 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2e6d9a4f1c8'
+down_revision: Union[str, Sequence[str], None] = 'f7b1d5e3a9c4'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Media cũ: feed_seq = 0, vẫn theo thứ tự id phía sau mọi media mới
+    op.add_column('media', sa.Column('feed_seq', sa.BigInteger(), server_default='0', nullable=False))
+    op.create_index('ix_media_album_feed_seq_id', 'media', ['album_id', 'feed_seq', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_media_album_feed_seq_id', table_name='media')
+    op.drop_column('media', 'feed_seq')
@@ -0,0 +1,42 @@
+"""media image metadata
+
+Revision ID: b5d8f1a3c7e9
+Revises: a9c3e5f7b2d1
+Create Date: 2026-10-18 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b5d8f1a3c7e9'
+down_revision: Union[str, Sequence[str], None] = 'a9c3e5f7b2d1'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('media', sa.Column('width', sa.Integer(), nullable=True))
+    op.add_column('media', sa.Column('height', sa.Integer(), nullable=True))
+    op.add_column('media', sa.Column('byte_size', sa.BigInteger(), nullable=True))
+    op.add_column('media', sa.Column('captured_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('media', sa.Column('orientation', sa.String(length=10), nullable=True))
+    op.create_index('ix_media_album_captured_at_id', 'media', ['album_id', 'captured_at', 'id'], unique=False)
+    op.create_index('ix_media_album_byte_size_id', 'media', ['album_id', 'byte_size', 'id'], unique=False)
+    op.create_index('ix_media_album_orientation', 'media', ['album_id', 'orientation'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_media_album_orientation', table_name='media')
+    op.drop_index('ix_media_album_byte_size_id', table_name='media')
+    op.drop_index('ix_media_album_captured_at_id', table_name='media')
+    op.drop_column('media', 'orientation')
+    op.drop_column('media', 'captured_at')
+    op.drop_column('media', 'byte_size')
+    op.drop_column('media', 'height')
+    op.drop_column('media', 'width')
@@ -0,0 +1,28 @@
+"""media file_url index
+
+Revision ID: c1e4a7d9f2b6
+Revises: b5d8f1a3c7e9
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c1e4a7d9f2b6'
+down_revision: Union[str, Sequence[str], None] = 'b5d8f1a3c7e9'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index(op.f('ix_media_file_url'), 'media', ['file_url'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_media_file_url'), table_name='media')
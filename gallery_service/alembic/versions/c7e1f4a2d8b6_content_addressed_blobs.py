@@ -0,0 +1,41 @@
+"""content-addressed blobs with reference counting
+
+Revision ID: c7e1f4a2d8b6
+Revises: 8b4d2e6f1a93
+Create Date: 2026-10-18 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7e1f4a2d8b6'
+down_revision: Union[str, Sequence[str], None] = '8b4d2e6f1a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('blobs',
+    sa.Column('sha256', sa.String(length=64), nullable=False),
+    sa.Column('file_name', sa.String(length=255), nullable=False),
+    sa.Column('size', sa.BigInteger(), nullable=False),
+    sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('sha256')
+    )
+    op.add_column('media', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_media_content_hash'), 'media', ['content_hash'], unique=False)
+    op.create_foreign_key('media_content_hash_fkey', 'media', 'blobs', ['content_hash'], ['sha256'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('media_content_hash_fkey', 'media', type_='foreignkey')
+    op.drop_index(op.f('ix_media_content_hash'), table_name='media')
+    op.drop_column('media', 'content_hash')
+    op.drop_table('blobs')
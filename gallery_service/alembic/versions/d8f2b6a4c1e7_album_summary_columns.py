@@ -0,0 +1,57 @@
+"""album summary columns
+
+Revision ID: d8f2b6a4c1e7
+Revises: c1e4a7d9f2b6
+Create Date: 2026-10-18 19:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f2b6a4c1e7'
+down_revision: Union[str, Sequence[str], None] = 'c1e4a7d9f2b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('albums', sa.Column('media_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('albums', sa.Column('total_bytes', sa.BigInteger(), server_default='0', nullable=False))
+    op.add_column('albums', sa.Column('last_upload_at', sa.DateTime(timezone=True), nullable=True))
+    op.add_column('albums', sa.Column('cover_media_id', sa.Integer(), nullable=True))
+    # Tính tóm tắt cho album đã có
+    op.execute("""
+        UPDATE albums SET
+            media_count = s.media_count,
+            total_bytes = s.total_bytes,
+            last_upload_at = s.last_upload_at
+        FROM (
+            SELECT album_id, count(*) AS media_count, coalesce(sum(byte_size), 0) AS total_bytes,
+                   max(uploaded_at) AS last_upload_at
+            FROM media GROUP BY album_id
+        ) AS s
+        WHERE albums.id = s.album_id
+    """)
+    op.execute("""
+        UPDATE albums SET
+            cover_media_id = c.id
+        FROM (
+            SELECT DISTINCT ON (album_id) album_id, id
+            FROM media WHERE media_type = 'image'
+            ORDER BY album_id, uploaded_at, id
+        ) AS c
+        WHERE albums.id = c.album_id
+    """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('albums', 'cover_media_id')
+    op.drop_column('albums', 'last_upload_at')
+    op.drop_column('albums', 'total_bytes')
+    op.drop_column('albums', 'media_count')
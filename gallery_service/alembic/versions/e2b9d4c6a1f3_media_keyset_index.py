@@ -0,0 +1,28 @@
+"""media keyset pagination index
+
+Revision ID: e2b9d4c6a1f3
+Revises: c7e1f4a2d8b6
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2b9d4c6a1f3'
+down_revision: Union[str, Sequence[str], None] = 'c7e1f4a2d8b6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_media_album_uploaded_at_id', 'media', ['album_id', 'uploaded_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_media_album_uploaded_at_id', table_name='media')
@@ -0,0 +1,28 @@
+"""blob crc32 for album archives
+
+Revision ID: f4a7c2e9b0d5
+Revises: e2b9d4c6a1f3
+Create Date: 2026-10-18 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f4a7c2e9b0d5'
+down_revision: Union[str, Sequence[str], None] = 'e2b9d4c6a1f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('blobs', sa.Column('crc32', sa.BigInteger(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('blobs', 'crc32')
@@ -1,34 +1,52 @@
-from fastapi import HTTPException, status, Depends
+from fastapi import HTTPException, status, Depends, Query
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from jose import jwt, ExpiredSignatureError, JWTError
-from typing import Dict, Any
+from typing import Dict, Any, Optional
+from common.auth_tokens import InvalidToken, TokenValidator, VerifiedTokenCache
+from common.jwt_codec import make_codec, read_key
+from common.revocation import HttpRevocationSource, RevocationFilter
 import app.config as config
 
 bearer_scheme = HTTPBearer(auto_error=True)
+optional_bearer_scheme = HTTPBearer(auto_error=False)
 
 def get_current_user(auth: HTTPAuthorizationCredentials = Depends(bearer_scheme)) -> Dict[str, Any]:
-    token = auth.credentials
-    try:
-        payload = jwt.decode(token, config.SECRET_KEY, algorithms=[config.ALGORITHM])
-        user_id = payload.get("sub")
-        username = payload.get("username")
-        email = payload.get("email")
-        role = payload.get("role")
+    return decode_user(auth.credentials)
+
+def get_optional_user(auth: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer_scheme)) -> Optional[Dict[str, Any]]:
+    """Như get_current_user nhưng trả về None khi request không có token (route còn cách xác thực khác)"""
+    if auth is None:
+        return None
+    return decode_user(auth.credentials)
 
-        if user_id is None or username is None:
-            raise HTTPException(
-                status_code=status.HTTP_401_UNAUTHORIZED,
-                detail="Invalid token payload"
-            )
+def get_stream_user(
+    access_token: Optional[str] = Query(None),
+    auth: Optional[HTTPAuthorizationCredentials] = Depends(optional_bearer_scheme),
+) -> Dict[str, Any]:
+    """Cho route stream (SSE): EventSource của trình duyệt không gửi được header Authorization nên nhận thêm token qua query"""
+    token = auth.credentials if auth is not None else access_token
+    if token is None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+    return decode_user(token)
 
-        return {
-            "user_id": int(user_id),
-            "username": username,
-            "email": email,
-            "role": role
-        }
+# Có AUTH_SERVICE_URL: token đã thu hồi (logout) bị từ chối; chỉ jti trúng Bloom filter mới phải hỏi Auth Service
+revocations = RevocationFilter(
+    HttpRevocationSource(config.AUTH_SERVICE_URL, config.REVOCATION_SYNC_KEY),
+    capacity=config.REVOCATION_FILTER_CAPACITY,
+    error_rate=config.REVOCATION_FILTER_ERROR_RATE,
+    rebuild_seconds=config.REVOCATION_REBUILD_SECONDS,
+    check_ttl=config.REVOCATION_SYNC_INTERVAL,
+) if config.AUTH_SERVICE_URL else None
 
-    except ExpiredSignatureError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token expired")
-    except JWTError:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
\ No newline at end of file
+# Token đã kiểm tra được cache (màn hình slideshow, grid gửi lại cùng token hàng trăm lần mỗi phút)
+token_validator = TokenValidator(
+    make_codec(config.JWT_BACKEND, config.ALGORITHM, secret_key=config.SECRET_KEY,
+               public_key=read_key(config.JWT_PUBLIC_KEY_FILE)),
+    VerifiedTokenCache(config.TOKEN_CACHE_SIZE, config.TOKEN_CACHE_TTL),
+    required=("sub", "username"), revocations=revocations,
+)
+
+def decode_user(token: str) -> Dict[str, Any]:
+    try:
+        return token_validator.validate(token)
+    except InvalidToken as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=exc.detail)
@@ -0,0 +1,148 @@
+import argparse
+import logging
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import update
+import app.models as models
+from app import crud
+from app.db import SessionLocal
+from app.utils import metadata, phash
+from app.utils.storage import backend, storage_key
+
+# Tính bù dữ liệu phái sinh cho media đã có từ trước
+# Chạy: python -m app.backfill {dhash,metadata} [--album-id 1] [--batch-size 256] [--workers 4]
+# - dhash: perceptual hash, tính cho cả lô bằng NumPy
+# - metadata: kích thước ảnh, dung lượng, thời điểm chụp (EXIF), hướng ảnh
+# - Đọc/giải mã file song song trong process pool (phần tốn CPU/IO), ghi DB bằng một câu UPDATE nhiều dòng mỗi lô
+# - Duyệt theo id tăng dần nên chạy lại sau khi bị ngắt sẽ chỉ xử lý phần còn thiếu
+
+logger = logging.getLogger("app.backfill")
+
+Rows = List[Tuple[int, str, str]]  # (id, file_url, media_type)
+
+def run_backfill(
+    name: str,
+    criteria: list,
+    compute: Callable[[Rows], List[Dict]],
+    album_id: Optional[int] = None,
+    batch_size: int = 256,
+) -> int:
+    """Duyệt các media khớp criteria theo lô, compute(rows) trả về tham số UPDATE theo id; trả về số media đã cập nhật"""
+    updated = 0
+    last_id = 0
+    while True:
+        db = SessionLocal()
+        try:
+            query = db.query(models.Media.id, models.Media.file_url, models.Media.media_type).filter(
+                models.Media.id > last_id, *criteria
+            )
+            if album_id is not None:
+                query = query.filter(models.Media.album_id == album_id)
+            rows = query.order_by(models.Media.id).limit(batch_size).all()
+            if not rows:
+                return updated
+            last_id = rows[-1].id
+
+            params = compute(rows)
+            if params:
+                db.execute(update(models.Media), params)
+                db.commit()
+                updated += len(params)
+            logger.info("%s: %d media updated (last id %d)", name, updated, last_id)
+        finally:
+            db.close()
+
+def group_by_key(rows: Rows) -> Dict[str, List[int]]:
+    """Nhiều media cùng nội dung chỉ đọc file một lần"""
+    ids_by_key: Dict[str, List[int]] = {}
+    for media_id, file_url, _ in rows:
+        ids_by_key.setdefault(storage_key(file_url), []).append(media_id)
+    return ids_by_key
+
+# ------------------ DHASH ------------------
+def _load_pixels(key: str) -> Optional[np.ndarray]:
+    """Chạy trong process con; file lỗi/mất thì bỏ qua thay vì dừng cả lô"""
+    try:
+        return phash.load_pixels(key)
+    except Exception as exc:
+        logger.warning("Skip %s: %r", key, exc)
+        return None
+
+def backfill_dhash(executor: Executor, album_id: Optional[int] = None, batch_size: int = 256) -> int:
+    """Tính dHash cho mọi ảnh chưa có"""
+    def compute(rows: Rows) -> List[Dict]:
+        ids_by_key = group_by_key(rows)
+        keys = list(ids_by_key)
+        pixels = list(executor.map(_load_pixels, keys, chunksize=16))
+        loaded = [(key, p) for key, p in zip(keys, pixels) if p is not None]
+        if not loaded:
+            return []
+        hashes = phash.dhash_array(np.stack([p for _, p in loaded]))
+        return [
+            {"id": media_id, "dhash": phash.to_signed(int(value))}
+            for (key, _), value in zip(loaded, hashes)
+            for media_id in ids_by_key[key]
+        ]
+
+    criteria = [models.Media.dhash.is_(None), models.Media.media_type == "image"]
+    return run_backfill("dhash", criteria, compute, album_id=album_id, batch_size=batch_size)
+
+# ------------------ METADATA ------------------
+def _read_metadata(key: str, is_image: bool) -> Optional[Dict]:
+    try:
+        size = backend.size(key)
+        if size is None:
+            logger.warning("Skip %s: file not found", key)
+            return None
+        meta = metadata.read_stored_metadata(key) if is_image else metadata.ImageMetadata()
+        return metadata.media_columns(meta, size)
+    except Exception as exc:
+        logger.warning("Skip %s: %r", key, exc)
+        return None
+
+def backfill_metadata(executor: Executor, album_id: Optional[int] = None, batch_size: int = 256) -> int:
+    """Đọc metadata cho mọi media chưa có (byte_size null là dấu hiệu chưa xử lý)"""
+    def compute(rows: Rows) -> List[Dict]:
+        ids_by_key = group_by_key(rows)
+        image_keys = {storage_key(file_url) for _, file_url, media_type in rows if media_type == "image"}
+        keys = list(ids_by_key)
+        results = executor.map(_read_metadata, keys, [key in image_keys for key in keys], chunksize=16)
+        return [
+            {"id": media_id, **columns}
+            for key, columns in zip(keys, results) if columns is not None
+            for media_id in ids_by_key[key]
+        ]
+
+    updated = run_backfill("metadata", [models.Media.byte_size.is_(None)], compute, album_id=album_id, batch_size=batch_size)
+    if updated:
+        # total_bytes của album được cộng dồn lúc upload, media cũ vừa có byte_size thì tính lại
+        db = SessionLocal()
+        try:
+            crud.refresh_album_summaries(db, album_id=album_id)
+            db.commit()
+        finally:
+            db.close()
+    return updated
+
+COMMANDS = {
+    "dhash": backfill_dhash,
+    "metadata": backfill_metadata,
+}
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.backfill")
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    parser.add_argument("--album-id", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=256)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        count = COMMANDS[args.command](executor, album_id=args.album_id, batch_size=args.batch_size)
+    logger.info("%s backfill finished: %d media updated", args.command, count)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    main()
@@ -11,12 +11,106 @@ DB_USER = os.getenv("DB_USER")
 DB_PASSWORD = os.getenv("DB_PASSWORD")
 
 DATABASE_URL = f"postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# DB_ASYNC=true: route async dùng AsyncSession (asyncpg) thay vì Session sync trong threadpool
+DB_ASYNC = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+ASYNC_DATABASE_URL = f"postgresql+asyncpg://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# Connection pool của mỗi process: tổng connection tới DB = số worker x (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", 10))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))   # chờ connection rảnh tối đa (giây) rồi báo lỗi
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", -1))     # đóng connection cũ hơn số giây này (-1: không)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# DB_PGBOUNCER=true: DB_HOST/DB_PORT là PgBouncer chế độ transaction pooling (không pre-ping, không cache prepared statement)
+DB_PGBOUNCER = os.getenv("DB_PGBOUNCER", "false").lower() in ("1", "true", "yes")
+# LISTEN của live feed cần giữ nguyên phiên: dùng PgBouncer transaction pooling thì trỏ URL này thẳng tới Postgres
+LISTEN_DATABASE_URL = os.getenv("LISTEN_DATABASE_URL") or DATABASE_URL
 
 # JWT
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+# Thư viện JWT: jose | pyjwt; ALGORITHM bất đối xứng (EdDSA...) thì kiểm tra bằng public key của Auth Service (file PEM)
+JWT_BACKEND = os.getenv("JWT_BACKEND", "jose")
+JWT_PUBLIC_KEY_FILE = os.getenv("JWT_PUBLIC_KEY_FILE")
+# Cache access token đã kiểm tra (mỗi worker): số mục tối đa, thời gian sống (giây, không quá exp của token)
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 10000))
+TOKEN_CACHE_TTL = int(os.getenv("TOKEN_CACHE_TTL", 300))
+
+# Thu hồi token (logout): Bloom filter jti bị thu hồi đồng bộ từ Auth Service; AUTH_SERVICE_URL trống thì tắt
+AUTH_SERVICE_URL = os.getenv("AUTH_SERVICE_URL")
+REVOCATION_SYNC_KEY = os.getenv("REVOCATION_SYNC_KEY")                     # trùng với Auth Service
+REVOCATION_SYNC_INTERVAL = float(os.getenv("REVOCATION_SYNC_INTERVAL", 5))  # giây; logout có hiệu lực ở đây chậm tối đa chừng này
+REVOCATION_FILTER_CAPACITY = int(os.getenv("REVOCATION_FILTER_CAPACITY", 10000))
+REVOCATION_FILTER_ERROR_RATE = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", 0.01))
+REVOCATION_REBUILD_SECONDS = float(os.getenv("REVOCATION_REBUILD_SECONDS", 3600))
 
 # Service URL
 EVENT_SERVICE_URL = os.getenv("EVENT_SERVICE_URL")
-AI_SERVICE_URL = os.getenv("AI_SERVICE_URL")
\ No newline at end of file
+AI_SERVICE_URL = os.getenv("AI_SERVICE_URL")
+# Media upload
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", "uploads")  # file tạm + file media (backend local) + render cache
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))        # 1 MiB mỗi lần đọc/ghi
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 50 * 1024 * 1024))       # 50 MiB mỗi file
+MAX_BATCH_FILES = int(os.getenv("MAX_BATCH_FILES", 500))                     # số file tối đa mỗi request batch upload
+BATCH_UPLOAD_CONCURRENCY = int(os.getenv("BATCH_UPLOAD_CONCURRENCY", 4))     # số file được ghi song song trong một batch
+
+# Đếm tổng media của album được cache trong process (giây), tránh COUNT(*) mỗi lần cuộn trang
+MEDIA_COUNT_CACHE_TTL = int(os.getenv("MEDIA_COUNT_CACHE_TTL", 30))
+
+# Resumable upload (upload theo từng chunk)
+UPLOAD_SESSION_CHUNK_SIZE = int(os.getenv("UPLOAD_SESSION_CHUNK_SIZE", 5 * 1024 * 1024))  # 5 MiB mỗi chunk
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", 24 * 3600))       # phiên bỏ dở quá hạn sẽ bị dọn
+UPLOAD_SESSION_CLEANUP_INTERVAL = int(os.getenv("UPLOAD_SESSION_CLEANUP_INTERVAL", 600))  # chu kỳ dọn (giây)
+
+# Job queue (worker: python -m app.worker)
+JOB_WORKER_PROCESSES = int(os.getenv("JOB_WORKER_PROCESSES", os.cpu_count() or 1))  # số process xử lý ảnh
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 1.0))                       # giây chờ khi hàng đợi rỗng
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", 5))
+JOB_RETRY_BASE_SECONDS = int(os.getenv("JOB_RETRY_BASE_SECONDS", 5))                 # backoff: base * 2^(lần thử - 1)
+JOB_RETRY_MAX_SECONDS = int(os.getenv("JOB_RETRY_MAX_SECONDS", 600))
+JOB_LOCK_TIMEOUT_SECONDS = int(os.getenv("JOB_LOCK_TIMEOUT_SECONDS", 600))           # job "running" quá lâu coi như worker đã chết
+THUMBNAIL_SIZE = int(os.getenv("THUMBNAIL_SIZE", 200))
+
+# Render ảnh theo yêu cầu (/media/{id}/render) + cache LRU trên disk
+RENDER_CACHE_DIR = os.getenv("RENDER_CACHE_DIR", os.path.join(UPLOAD_DIR, ".variants"))
+RENDER_CACHE_MAX_BYTES = int(os.getenv("RENDER_CACHE_MAX_BYTES", 512 * 1024 * 1024))     # 512 MiB
+RENDER_SIZES = sorted(int(v) for v in os.getenv("RENDER_SIZES", "100,200,400,800,1200,1600,1920,2560").split(","))
+RENDER_MAX_DIMENSION = int(os.getenv("RENDER_MAX_DIMENSION", 8192))
+RENDER_QUALITY = int(os.getenv("RENDER_QUALITY", 82))
+
+# Storage backend: local (UPLOAD_DIR, chia shard theo hash) hoặc s3 (S3/MinIO)
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "local")
+STORAGE_SIGNING_KEY = os.getenv("STORAGE_SIGNING_KEY") or SECRET_KEY or ""   # ký presigned URL của backend local
+PRESIGNED_URL_TTL_SECONDS = int(os.getenv("PRESIGNED_URL_TTL_SECONDS", 3600))
+S3_BUCKET = os.getenv("S3_BUCKET")
+S3_PREFIX = os.getenv("S3_PREFIX", "media")
+S3_ENDPOINT_URL = os.getenv("S3_ENDPOINT_URL")  # vd. http://minio:9000, để trống nếu dùng AWS S3
+S3_REGION = os.getenv("S3_REGION", "us-east-1")
+S3_ACCESS_KEY = os.getenv("S3_ACCESS_KEY")
+S3_SECRET_KEY = os.getenv("S3_SECRET_KEY")
+
+# Phục vụ file media gốc (/uploads/{key})
+# Đặt sau nginx: MEDIA_ACCEL_REDIRECT_PREFIX=/protected-uploads -> app chỉ kiểm tra quyền, nginx sendfile
+MEDIA_ACCEL_REDIRECT_PREFIX = os.getenv("MEDIA_ACCEL_REDIRECT_PREFIX", "")
+
+# Tải cả album dạng ZIP (/albums/{id}/archive)
+ARCHIVE_MAX_CONCURRENT = int(os.getenv("ARCHIVE_MAX_CONCURRENT", 2))   # số archive stream cùng lúc trong mỗi worker
+ARCHIVE_RETRY_AFTER = int(os.getenv("ARCHIVE_RETRY_AFTER", 30))       # giây, gửi kèm 503 khi đã đầy
+
+# Dọn file mồ côi trong storage (python -m app.gc)
+GC_GRACE_SECONDS = int(os.getenv("GC_GRACE_SECONDS", 24 * 3600))          # file mới hơn ngưỡng này không bị đụng tới
+GC_BATCH_SIZE = int(os.getenv("GC_BATCH_SIZE", 500))                      # số file đối chiếu với DB mỗi lô
+GC_MAX_DELETES_PER_SECOND = float(os.getenv("GC_MAX_DELETES_PER_SECOND", 20))
+
+# Feed media mới qua Server-Sent Events (/albums/{id}/feed)
+FEED_KEEPALIVE_SECONDS = float(os.getenv("FEED_KEEPALIVE_SECONDS", 15))  # comment keepalive để proxy không cắt kết nối
+FEED_RETRY_MS = int(os.getenv("FEED_RETRY_MS", 3000))                    # thời gian chờ trước khi EventSource kết nối lại
+FEED_QUEUE_SIZE = int(os.getenv("FEED_QUEUE_SIZE", 100))                 # số lô event chờ tối đa của mỗi client
+FEED_REPLAY_PAGE_SIZE = int(os.getenv("FEED_REPLAY_PAGE_SIZE", 200))     # số media mỗi lần đọc bù theo Last-Event-ID
+
+# Manifest slideshow (/albums/{id}/slideshow)
+SLIDESHOW_SCREENS = os.getenv("SLIDESHOW_SCREENS", "hd=1280x720,fhd=1920x1080,qhd=2560x1440")  # tên=rộngxcao
+SLIDESHOW_DEFAULT_SCREEN = os.getenv("SLIDESHOW_DEFAULT_SCREEN", "fhd")   # cỡ dùng cho header Link preload
+SLIDESHOW_FORMAT = os.getenv("SLIDESHOW_FORMAT", "webp")
+SLIDESHOW_PRELOAD_COUNT = int(os.getenv("SLIDESHOW_PRELOAD_COUNT", 3))    # số ảnh kế tiếp client nên tải sẵn
+SLIDESHOW_CACHE_ENTRIES = int(os.getenv("SLIDESHOW_CACHE_ENTRIES", 64))   # số album giữ manifest trong mỗi worker
@@ -1,6 +1,20 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import case, select, tuple_, update
+from sqlalchemy.orm import Session, aliased
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.sql import func, literal_column
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
 import app.models as models
 import app.schemas as schemas
+from app import config, jobs
+from app.utils import storage
+from app.utils.render import render_cache, thumbnail_query, thumbnail_url
+from app.utils.pagination import TTLCounter
+from app.utils.archive import ArchiveEntry, compute_crc32
+from app.utils import metadata, phash
+from app.utils.live_feed import CHANNEL as FEED_CHANNEL, notify_payloads
+from app.utils.storage_backends import is_content_addressed
 
 # Album CRUD
 def create_album(db: Session, album: schemas.AlbumCreate, created_by: int):
@@ -20,42 +34,702 @@ def get_album(db: Session, album_id: int):
     return db.query(models.Album).filter(models.Album.id == album_id).first()
 
 def delete_album(db: Session, album_id: int):
-    """Xóa album theo id"""
+    """Xóa album theo id (media bị xóa theo cascade, blob chỉ mất khi hết tham chiếu)"""
     album = db.query(models.Album).filter(models.Album.id == album_id).first()
     if not album:
         return None
+    hash_counts = dict(
+        db.query(models.Media.content_hash, func.count())
+        .filter(models.Media.album_id == album_id, models.Media.content_hash.isnot(None))
+        .group_by(models.Media.content_hash)
+        .all()
+    )
+    legacy_urls = [
+        row[0] for row in
+        db.query(models.Media.file_url)
+        .filter(models.Media.album_id == album_id, models.Media.content_hash.is_(None))
+        .all()
+    ]
     db.delete(album)
+    released = release_blobs(db, hash_counts)
+    for file_url in legacy_urls:
+        enqueue_legacy_file_deletion(db, file_url)
     db.commit()
+    purge_blobs(db, released)
     return True
 
+def cover_subquery(album_id):
+    """Subquery: ảnh upload sớm nhất của album (đi theo index (album_id, uploaded_at, id))"""
+    return (
+        select(models.Media.id)
+        .where(models.Media.album_id == album_id, models.Media.media_type == "image")
+        .order_by(models.Media.uploaded_at, models.Media.id)
+        .limit(1)
+        .scalar_subquery()
+    )
+
+def album_changed() -> Dict:
+    """Giá trị UPDATE đánh dấu nội dung album vừa đổi (revision + updated_at)"""
+    return {"revision": models.Album.revision + 1, "updated_at": func.now()}
+
+def touch_albums(db: Session, *media_criteria) -> None:
+    """Tăng revision của các album chứa media khớp điều kiện (media đổi trạng thái xử lý...); caller tự commit"""
+    album_ids = select(models.Media.album_id).where(*media_criteria).distinct()
+    db.query(models.Album).filter(models.Album.id.in_(album_ids)).update(album_changed(), synchronize_session=False)
+
+def add_to_album_summary(db: Session, album_id: int, count: int, byte_size: int, first_image_id: Optional[int] = None) -> int:
+    """Cộng dồn tóm tắt album sau khi thêm count media (một câu UPDATE, caller tự commit); trả về revision mới.
+
+    Media được thêm trong transaction hiện tại nên uploaded_at = now() của transaction.
+    UPDATE giữ khóa dòng album tới khi commit: các upload cùng album nhận revision theo đúng thứ tự commit.
+    """
+    values = {
+        "media_count": models.Album.media_count + count,
+        "total_bytes": models.Album.total_bytes + byte_size,
+        "last_upload_at": func.now(),
+        **album_changed(),
+    }
+    if first_image_id is not None:
+        values["cover_media_id"] = func.coalesce(models.Album.cover_media_id, first_image_id)
+    return db.execute(
+        update(models.Album).where(models.Album.id == album_id).values(values).returning(models.Album.revision),
+        execution_options={"synchronize_session": False},
+    ).scalar_one()
+
+def remove_from_album_summary(db: Session, album_id: int, removed: List[models.Media]) -> None:
+    """Trừ tóm tắt album sau khi xóa media; ảnh bìa / lần upload cuối chỉ tìm lại qua index (caller tự commit)"""
+    if not removed:
+        return
+    db.flush()
+    removed_ids = [m.id for m in removed]
+    db.query(models.Album).filter(models.Album.id == album_id).update(
+        {
+            "media_count": models.Album.media_count - len(removed),
+            "total_bytes": models.Album.total_bytes - sum(m.byte_size or 0 for m in removed),
+            "last_upload_at": (
+                select(func.max(models.Media.uploaded_at))
+                .where(models.Media.album_id == album_id)
+                .scalar_subquery()
+            ),
+            "cover_media_id": case(
+                (models.Album.cover_media_id.in_(removed_ids), cover_subquery(album_id)),
+                else_=models.Album.cover_media_id,
+            ),
+            **album_changed(),
+        },
+        synchronize_session=False,
+    )
+
+def notify_media_added(db: Session, album_id: int, media_ids: List[int], feed_seq: int) -> None:
+    """Ghi vị trí feed (revision từ add_to_album_summary) cho media vừa thêm rồi NOTIFY cho live feed;
+    Postgres chỉ gửi khi transaction commit (caller tự commit)"""
+    db.query(models.Media).filter(models.Media.id.in_(media_ids)).update(
+        {models.Media.feed_seq: feed_seq}, synchronize_session=False
+    )
+    for payload in notify_payloads(album_id, media_ids):
+        db.execute(select(func.pg_notify(FEED_CHANNEL, payload)))
+
+def refresh_album_summaries(db: Session, album_id: Optional[int] = None) -> None:
+    """Tính lại tóm tắt từ bảng media (sau backfill metadata, hoặc để sửa lệch); caller tự commit"""
+    in_album = models.Media.album_id == models.Album.id
+    query = db.query(models.Album)
+    if album_id is not None:
+        query = query.filter(models.Album.id == album_id)
+    query.update(
+        {
+            "media_count": select(func.count()).where(in_album).scalar_subquery(),
+            "total_bytes": select(func.coalesce(func.sum(models.Media.byte_size), 0)).where(in_album).scalar_subquery(),
+            "last_upload_at": select(func.max(models.Media.uploaded_at)).where(in_album).scalar_subquery(),
+            "cover_media_id": cover_subquery(models.Album.id),
+            **album_changed(),
+        },
+        synchronize_session=False,
+    )
+
+def get_album_revision(db: Session, album_id: int) -> Optional[int]:
+    """Revision hiện tại của album (None: không có album)"""
+    return db.query(models.Album.revision).filter(models.Album.id == album_id).scalar()
+
+def get_album_version(db: Session, album_id: int):
+    """(id, revision, updated_at) của album, không tải cả object; None: không có album"""
+    return (
+        db.query(models.Album.id, models.Album.revision, models.Album.updated_at)
+        .filter(models.Album.id == album_id)
+        .first()
+    )
+
+def get_album_version_by_event(db: Session, event_id: int):
+    return (
+        db.query(models.Album.id, models.Album.revision, models.Album.updated_at)
+        .filter(models.Album.event_id == event_id)
+        .first()
+    )
+
+def get_media_version(db: Session, media_id: int):
+    """(album_id, revision, updated_at) của album chứa media: mọi thay đổi của media đều tăng revision album"""
+    return (
+        db.query(models.Album.id, models.Album.revision, models.Album.updated_at)
+        .join(models.Media, models.Media.album_id == models.Album.id)
+        .filter(models.Media.id == media_id)
+        .first()
+    )
+
+def get_slideshow_media(db: Session, album_id: int) -> List[models.Media]:
+    """Ảnh của album theo thứ tự trình chiếu (thứ tự upload)"""
+    return (
+        db.query(models.Media)
+        .filter(models.Media.album_id == album_id, models.Media.media_type == "image")
+        .order_by(models.Media.uploaded_at, models.Media.id)
+        .all()
+    )
+
+def get_album_archive_entries(db: Session, album_id: int) -> List[ArchiveEntry]:
+    """Danh sách file trong ZIP của album, theo thứ tự upload (tên file: <media id><đuôi>).
+
+    Blob cũ chưa có crc32 được tính bù một lần rồi lưu lại; media cũ không có blob thì
+    tính mỗi lần, file đã mất khỏi storage thì bỏ qua.
+    """
+    rows = (
+        db.query(models.Media, models.Blob)
+        .outerjoin(models.Blob, models.Blob.sha256 == models.Media.content_hash)
+        .filter(models.Media.album_id == album_id)
+        .order_by(models.Media.uploaded_at, models.Media.id)
+        .all()
+    )
+    entries = []
+    for media, blob in rows:
+        key = storage.storage_key(media.file_url)
+        if blob is not None:
+            if blob.crc32 is None:
+                blob.crc32 = compute_crc32(key)
+            size, crc32 = blob.size, blob.crc32
+        else:
+            size = storage.backend.size(key)
+            if size is None:
+                continue
+            crc32 = compute_crc32(key)
+        entries.append(ArchiveEntry(
+            name=f"{media.id}{storage.file_extension(key)}",
+            key=key,
+            size=size,
+            crc32=crc32,
+            modified_at=media.uploaded_at,
+        ))
+    db.commit()
+    return entries
+
+# Blob CRUD (lưu trữ theo nội dung + đếm tham chiếu)
+def acquire_blob(db: Session, sha256: str, size: int, file_name: str, crc32: Optional[int] = None, count: int = 1) -> Tuple[str, bool]:
+    """Tăng ref_count của blob thêm `count` (tạo mới nếu chưa có); trả về (file_name, có phải blob mới không).
+
+    Caller tự commit. Hai upload trùng nội dung chạy đồng thời sẽ bị Postgres xếp hàng
+    trên ON CONFLICT, nên chỉ một bên thấy created=True.
+    """
+    lock_storage_key(db, sha256)
+    stmt = insert(models.Blob).values(sha256=sha256, size=size, file_name=file_name, crc32=crc32, ref_count=count)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.Blob.sha256],
+        set_={
+            "ref_count": models.Blob.ref_count + count,
+            "crc32": func.coalesce(models.Blob.crc32, stmt.excluded.crc32),
+        },
+    ).returning(models.Blob.file_name, literal_column("(xmax = 0)"))
+    blob_file_name, created = db.execute(stmt).one()
+    return blob_file_name, created
+
+def release_blobs(db: Session, hash_counts: Dict[str, int]) -> List[str]:
+    """Giảm ref_count, trả về các hash đã hết tham chiếu (caller tự commit rồi gọi purge_blobs)"""
+    released = []
+    for sha256, count in hash_counts.items():
+        remaining = db.execute(
+            update(models.Blob)
+            .where(models.Blob.sha256 == sha256)
+            .values(ref_count=models.Blob.ref_count - count)
+            .returning(models.Blob.ref_count)
+        ).scalar()
+        if remaining is not None and remaining <= 0:
+            released.append(sha256)
+    return released
+
+def purge_blobs(db: Session, hashes: List[str]) -> int:
+    """Xóa dòng blob nếu vẫn không còn ai tham chiếu, file + variant được xóa nền bởi worker.
+
+    Khóa dòng blob trước khi xóa: upload trùng nội dung chạy đồng thời sẽ chờ tới khi
+    dòng bị xóa rồi tự tạo blob mới; job xóa file kiểm tra lại điều đó trước khi xóa.
+    """
+    purged = 0
+    for sha256 in hashes:
+        blob = (
+            db.query(models.Blob)
+            .filter(models.Blob.sha256 == sha256, models.Blob.ref_count <= 0)
+            .with_for_update()
+            .first()
+        )
+        if blob:
+            enqueue_file_deletion(db, blob.file_name)
+            db.delete(blob)
+            purged += 1
+        db.commit()
+    return purged
+
+# Xóa file trong storage (chạy nền qua job queue, hoặc từ GC)
+def enqueue_file_deletion(db: Session, key: str) -> None:
+    """Xếp job xóa file cùng transaction với thao tác làm file mất tham chiếu (caller tự commit)"""
+    jobs.enqueue_job(db, jobs.JOB_DELETE_FILE, {"key": key})
+
+def enqueue_legacy_file_deletion(db: Session, file_url: str) -> None:
+    """Media cũ (không có blob) trỏ thẳng tới file trong storage: xóa file khi xóa media"""
+    if file_url.startswith(f"{storage.MEDIA_URL_PREFIX}/"):
+        enqueue_file_deletion(db, storage.storage_key(file_url))
+
+def lock_storage_key(db: Session, key: str) -> None:
+    """Khóa advisory theo nội dung file (tới hết transaction): upload tạo lại blob và việc xóa file
+    cùng nội dung không bao giờ chạy xen nhau"""
+    stem = os.path.splitext(key)[0]
+    db.execute(select(func.pg_advisory_xact_lock(func.hashtext(stem))))
+
+def referenced_keys(db: Session, keys: List[str]) -> set:
+    """Các key trong danh sách vẫn đang được blob hoặc Media cũ tham chiếu"""
+    hashed = {os.path.splitext(k)[0]: k for k in keys if is_content_addressed(k)}
+    referenced = set()
+    if hashed:
+        referenced.update(
+            row[0] for row in
+            db.query(models.Blob.file_name).filter(models.Blob.sha256.in_(hashed))
+            if row[0] in keys
+        )
+    legacy = [storage.blob_url(k) for k in keys if not is_content_addressed(k)]
+    if legacy:
+        referenced.update(
+            storage.storage_key(row[0]) for row in
+            db.query(models.Media.file_url).filter(models.Media.file_url.in_(legacy)).distinct()
+        )
+    return referenced
+
+def delete_unreferenced_file(db: Session, key: str) -> bool:
+    """Xóa file (kèm variant đã render) nếu không còn ai tham chiếu; commit để nhả khóa"""
+    try:
+        lock_storage_key(db, key)
+        if referenced_keys(db, [key]):
+            return False
+        storage.delete_blob_file(key)
+        render_cache.remove_prefix(os.path.splitext(key)[0])
+        return True
+    finally:
+        db.commit()
+
 # Media CRUD
-def add_media(db: Session, media: schemas.MediaCreate, album_id: int):
-    """Thêm media vào album"""
-    db_media = models.Media(**media.model_dump(), album_id=album_id)
+def add_media(db: Session, media: schemas.MediaCreate, album_id: int, content_hash: Optional[str] = None, attributes: Optional[Dict] = None):
+    """Thêm media vào album (có content_hash: xếp job tạo thumbnail cùng transaction nếu cần)"""
+    db_media = models.Media(**media.model_dump(), album_id=album_id, content_hash=content_hash, **(attributes or {}))
     db.add(db_media)
+    db.flush()
+    if content_hash:
+        schedule_derivatives(db, db_media)
+    feed_seq = add_to_album_summary(
+        db, album_id, 1, db_media.byte_size or 0,
+        first_image_id=db_media.id if db_media.media_type == "image" else None,
+    )
+    notify_media_added(db, album_id, [db_media.id], feed_seq)
     db.commit()
     db.refresh(db_media)
     return db_media
 
-def get_media_by_album(db: Session, album_id: int, skip: int = 0, limit: int = 10):
-    """Lấy danh sách media theo album với phân trang"""
+def schedule_derivatives(db: Session, db_media: models.Media) -> None:
+    """Nội dung đã từng xử lý thì dùng lại kết quả, chỉ xếp job khi thật sự cần"""
+    statuses = {
+        row[0] for row in
+        db.query(models.Media.processing_status)
+        .filter(models.Media.content_hash == db_media.content_hash, models.Media.id != db_media.id)
+        .distinct()
+        .all()
+    }
+    if "ready" in statuses:
+        db_media.processing_status = "ready"
+        db_media.thumbnail_url = thumbnail_url(db_media.id)
+        db_media.dhash = (
+            db.query(models.Media.dhash)
+            .filter(models.Media.content_hash == db_media.content_hash, models.Media.dhash.isnot(None))
+            .limit(1)
+            .scalar()
+        )
+        return
+    db_media.processing_status = "pending"
+    if "pending" not in statuses:
+        jobs.enqueue_job(db, jobs.JOB_THUMBNAIL, {"content_hash": db_media.content_hash, "file_url": db_media.file_url})
+
+def sibling_dhash(media):
+    """Subquery: dhash đã tính của một Media khác cùng nội dung (dHash chỉ phụ thuộc nội dung file)"""
+    other = aliased(models.Media)
     return (
-        db.query(models.Media)
+        select(other.dhash)
+        .where(other.content_hash == media.content_hash, other.dhash.isnot(None))
+        .limit(1)
+        .scalar_subquery()
+    )
+
+def mark_thumbnails_ready(db: Session, *criteria) -> None:
+    """Gắn thumbnail_url (theo id của từng dòng) và chuyển sang ready cho các Media khớp điều kiện"""
+    db.query(models.Media).filter(*criteria).update(
+        {
+            "thumbnail_url": func.concat("/media/", models.Media.id, "/render?", thumbnail_query()),
+            "processing_status": "ready",
+            "dhash": func.coalesce(models.Media.dhash, sibling_dhash(models.Media)),
+        },
+        synchronize_session=False,
+    )
+    touch_albums(db, *criteria)
+
+def set_dhash(db: Session, content_hash: str, value: int) -> None:
+    """Lưu perceptual hash cho mọi Media cùng nội dung (caller tự commit)"""
+    db.query(models.Media).filter(models.Media.content_hash == content_hash).update(
+        {"dhash": phash.to_signed(value)},
+        synchronize_session=False,
+    )
+
+def add_uploaded_media(db: Session, stored: storage.StoredFile, album_id: int, media_type: str = "image"):
+    """Thêm media từ file vừa upload: nội dung trùng với blob có sẵn thì không lưu thêm bản nào"""
+    attributes = stored_media_columns(stored, media_type)
+    blob_name, created = acquire_blob(db, stored.sha256, stored.size, stored.blob_name, crc32=stored.crc32)
+    if created:
+        storage.promote_file(stored, blob_name)
+    else:
+        storage.discard_file(stored)
+    media_data = schemas.MediaCreate(file_url=storage.blob_url(blob_name), media_type=media_type)
+    return add_media(db=db, media=media_data, album_id=album_id, content_hash=stored.sha256, attributes=attributes)
+
+def stored_media_columns(stored: storage.StoredFile, media_type: str) -> Dict:
+    """Metadata (kích thước, thời điểm chụp...) đọc từ file tạm, trước khi file được promote/discard"""
+    meta = metadata.read_file_metadata(stored.file_path) if media_type == "image" else metadata.ImageMetadata()
+    return metadata.media_columns(meta, stored.size)
+
+def add_uploaded_media_batch(db: Session, stored_files: List[storage.StoredFile], album_id: int, media_type: str = "image") -> List[models.Media]:
+    """Bản batch của add_uploaded_media: mọi Media được ghi bằng một câu INSERT, một lần commit.
+
+    Trả về Media theo đúng thứ tự stored_files. File trùng nội dung (kể cả trong cùng batch)
+    chỉ giữ một blob; mỗi nội dung mới chỉ xếp một job thumbnail.
+    """
+    if not stored_files:
+        return []
+    attributes = [stored_media_columns(stored, media_type) for stored in stored_files]
+    by_hash: Dict[str, List[storage.StoredFile]] = {}
+    for stored in stored_files:
+        by_hash.setdefault(stored.sha256, []).append(stored)
+
+    # Trạng thái của các Media đã có cùng nội dung, để dùng lại thumbnail thay vì render lại
+    statuses: Dict[str, set] = {}
+    for content_hash, status in (
+        db.query(models.Media.content_hash, models.Media.processing_status)
+        .filter(models.Media.content_hash.in_(by_hash))
+        .distinct()
+        .all()
+    ):
+        statuses.setdefault(content_hash, set()).add(status)
+
+    file_urls: Dict[str, str] = {}
+    for content_hash, group in by_hash.items():
+        first = group[0]
+        blob_name, created = acquire_blob(db, content_hash, first.size, first.blob_name, crc32=first.crc32, count=len(group))
+        file_urls[content_hash] = storage.blob_url(blob_name)
+        for i, stored in enumerate(group):
+            if created and i == 0:
+                storage.promote_file(stored, blob_name)
+            else:
+                storage.discard_file(stored)
+
+    ready_hashes = [h for h in by_hash if "ready" in statuses.get(h, ())]
+    rows = [
+        {
+            "album_id": album_id,
+            "file_url": file_urls[stored.sha256],
+            "media_type": media_type,
+            "content_hash": stored.sha256,
+            "processing_status": "pending",
+            **columns,
+        }
+        for stored, columns in zip(stored_files, attributes)
+    ]
+    media_ids = list(db.scalars(insert(models.Media).returning(models.Media.id, sort_by_parameter_order=True), rows))
+    feed_seq = add_to_album_summary(
+        db, album_id, len(media_ids), sum(row["byte_size"] or 0 for row in rows),
+        first_image_id=media_ids[0] if media_type == "image" else None,
+    )
+    notify_media_added(db, album_id, media_ids, feed_seq)
+
+    if ready_hashes:
+        mark_thumbnails_ready(db, models.Media.id.in_(media_ids), models.Media.content_hash.in_(ready_hashes))
+    for content_hash in by_hash:
+        if not statuses.get(content_hash, set()) & {"ready", "pending"}:
+            jobs.enqueue_job(db, jobs.JOB_THUMBNAIL, {"content_hash": content_hash, "file_url": file_urls[content_hash]})
+    db.commit()
+    media_by_id = {m.id: m for m in db.query(models.Media).filter(models.Media.id.in_(media_ids))}
+    return [media_by_id[media_id] for media_id in media_ids]
+
+def get_media(db: Session, media_id: int):
+    """Lấy media theo id"""
+    return db.query(models.Media).filter(models.Media.id == media_id).first()
+
+def get_album_for_file(db: Session, key: str, content_hash: Optional[str] = None):
+    """Album chứa file có key này (file có thể thuộc nhiều album nhờ dedup, lấy một album bất kỳ)"""
+    query = db.query(models.Album).join(models.Media, models.Media.album_id == models.Album.id)
+    if content_hash:
+        query = query.filter(models.Media.content_hash == content_hash)
+    else:
+        query = query.filter(models.Media.file_url == storage.blob_url(key))
+    return query.first()
+
+_dhash_indexes = phash.IndexCache()
+
+def get_album_dhash_index(db: Session, album_id: int) -> phash.BKTree:
+    """BK-tree (dhash -> media id) của album, cache trong process tới khi album có thay đổi"""
+    # Chữ ký rẻ (một lần quét index theo album): thêm/xóa media hoặc có dhash mới đều làm nó đổi
+    signature = tuple(
+        db.query(func.count(), func.count(models.Media.dhash), func.max(models.Media.id))
         .filter(models.Media.album_id == album_id)
+        .one()
+    )
+
+    def build() -> phash.BKTree:
+        tree = phash.BKTree()
+        rows = (
+            db.query(models.Media.id, models.Media.dhash)
+            .filter(models.Media.album_id == album_id, models.Media.dhash.isnot(None))
+            .all()
+        )
+        for media_id, value in rows:
+            tree.add(phash.to_unsigned(value), media_id)
+        return tree
+
+    return _dhash_indexes.get(album_id, signature, build)
+
+def find_similar_media(db: Session, media: models.Media, max_distance: int) -> List[Tuple[int, models.Media]]:
+    """Các media cùng album gần giống `media` (khoảng cách Hamming <= max_distance), gần nhất trước"""
+    if media.dhash is None:
+        return []
+    tree = get_album_dhash_index(db, media.album_id)
+    matches = [(d, media_id) for d, media_id in tree.search(phash.to_unsigned(media.dhash), max_distance) if media_id != media.id]
+    by_id = {m.id: m for m in db.query(models.Media).filter(models.Media.id.in_([media_id for _, media_id in matches]))}
+    return [(d, by_id[media_id]) for d, media_id in matches if media_id in by_id]
+
+def find_duplicate_groups(db: Session, album_id: int, max_distance: int) -> List[List[int]]:
+    """Gom media gần giống nhau trong album thành nhóm (union-find trên kết quả BK-tree), mỗi nhóm >= 2 media"""
+    tree = get_album_dhash_index(db, album_id)
+    rows = (
+        db.query(models.Media.id, models.Media.dhash)
+        .filter(models.Media.album_id == album_id, models.Media.dhash.isnot(None))
+        .order_by(models.Media.uploaded_at, models.Media.id)
+        .all()
+    )
+    parent = {media_id: media_id for media_id, _ in rows}
+
+    def find(media_id: int) -> int:
+        while parent[media_id] != media_id:
+            parent[media_id] = parent[parent[media_id]]
+            media_id = parent[media_id]
+        return media_id
+
+    for media_id, value in rows:
+        for _, other_id in tree.search(phash.to_unsigned(value), max_distance):
+            if other_id in parent:
+                root_a, root_b = find(media_id), find(other_id)
+                if root_a != root_b:
+                    parent[max(root_a, root_b)] = min(root_a, root_b)
+
+    groups: Dict[int, List[int]] = {}
+    for media_id, _ in rows:
+        groups.setdefault(find(media_id), []).append(media_id)
+    return [group for group in groups.values() if len(group) > 1]
+
+# Cột được phép sắp xếp danh sách media (mỗi cột có index (album_id, cột, id))
+MEDIA_SORT_COLUMNS = {
+    "uploaded_at": models.Media.uploaded_at,
+    "captured_at": models.Media.captured_at,
+    "byte_size": models.Media.byte_size,
+}
+
+def filter_media_query(query, filters: Optional[Dict] = None):
+    """Lọc media theo metadata: orientation, captured_after/captured_before, min_width/min_height"""
+    filters = filters or {}
+    if filters.get("orientation"):
+        query = query.filter(models.Media.orientation == filters["orientation"])
+    if filters.get("captured_after"):
+        query = query.filter(models.Media.captured_at >= filters["captured_after"])
+    if filters.get("captured_before"):
+        query = query.filter(models.Media.captured_at < filters["captured_before"])
+    if filters.get("min_width"):
+        query = query.filter(models.Media.width >= filters["min_width"])
+    if filters.get("min_height"):
+        query = query.filter(models.Media.height >= filters["min_height"])
+    return query
+
+def get_media_by_album(db: Session, album_id: int, skip: int = 0, limit: int = 10, sort: str = "uploaded_at", filters: Optional[Dict] = None):
+    """Lấy danh sách media theo album với phân trang"""
+    column = MEDIA_SORT_COLUMNS[sort]
+    query = filter_media_query(db.query(models.Media).filter(models.Media.album_id == album_id), filters)
+    return (
+        query
+        .order_by(column.asc().nulls_last(), models.Media.id)
         .offset(skip)
         .limit(limit)
         .all()
     )
 
-def count_media_by_album(db: Session, album_id: int) -> int:
+def get_media_page_by_album(
+    db: Session,
+    album_id: int,
+    after: Optional[Tuple[Any, int]] = None,
+    limit: int = 20,
+    sort: str = "uploaded_at",
+    filters: Optional[Dict] = None,
+):
+    """Keyset pagination theo (cột sort, id), media thiếu giá trị cột sort xếp cuối.
+
+    Chia làm hai đoạn để đoạn nào cũng seek thẳng vào index: các dòng có giá trị
+    (so sánh (cột, id) > cursor) rồi tới các dòng null (theo id).
+    """
+    column = MEDIA_SORT_COLUMNS[sort]
+    query = filter_media_query(db.query(models.Media).filter(models.Media.album_id == album_id), filters)
+    items = []
+    if after is None or after[0] is not None:
+        valued = query.filter(column.isnot(None))
+        if after is not None:
+            valued = valued.filter(tuple_(column, models.Media.id) > tuple_(*after))
+        items = valued.order_by(column, models.Media.id).limit(limit).all()
+    if len(items) < limit:
+        nulls = query.filter(column.is_(None))
+        if after is not None and after[0] is None:
+            nulls = nulls.filter(models.Media.id > after[1])
+        items += nulls.order_by(models.Media.id).limit(limit - len(items)).all()
+    return items
+
+def get_media_feed(db: Session, album_id: int, after: Optional[Tuple[int, int]] = None, ids: Optional[List[int]] = None, limit: int = 200) -> List[models.Media]:
+    """Media cho live feed theo (feed_seq, id) tăng dần: các id được thông báo, hoặc mọi media sau vị trí after (đọc bù).
+
+    Không dùng id > Last-Event-ID: id cấp trước commit nên media id nhỏ hơn có thể commit sau khi client đã thấy id lớn hơn;
+    feed_seq tăng theo thứ tự commit nên đọc bù không bỏ sót.
+    """
+    query = db.query(models.Media).filter(models.Media.album_id == album_id)
+    if ids is not None:
+        query = query.filter(models.Media.id.in_(ids))
+    if after is not None:
+        query = query.filter(tuple_(models.Media.feed_seq, models.Media.id) > tuple_(*after))
+    return query.order_by(models.Media.feed_seq, models.Media.id).limit(limit).all()
+
+def get_feed_position(db: Session, album_id: int, media_id: int) -> Tuple[int, int]:
+    """Vị trí feed tương ứng Last-Event-ID kiểu cũ (chỉ có media id): vị trí của chính media đó;
+    media đã bị xóa thì lùi về trước mọi media có id lớn hơn (có thể gửi trùng, không bỏ sót)"""
+    feed_seq = db.query(models.Media.feed_seq).filter(
+        models.Media.album_id == album_id, models.Media.id == media_id
+    ).scalar()
+    if feed_seq is not None:
+        return feed_seq, media_id
+    feed_seq = db.query(func.min(models.Media.feed_seq)).filter(
+        models.Media.album_id == album_id, models.Media.id > media_id
+    ).scalar()
+    if feed_seq is not None:
+        return feed_seq - 1, media_id
+    feed_seq = db.query(func.max(models.Media.feed_seq)).filter(models.Media.album_id == album_id).scalar()
+    return feed_seq or 0, media_id
+
+def count_media_by_album(db: Session, album_id: int, filters: Optional[Dict] = None) -> int:
     """Đếm tổng số media trong album"""
-    return db.query(models.Media).filter(models.Media.album_id == album_id).count()
+    return filter_media_query(db.query(models.Media).filter(models.Media.album_id == album_id), filters).count()
+
+_media_counts = TTLCounter(config.MEDIA_COUNT_CACHE_TTL)
+
+def count_media_by_album_cached(db: Session, album_id: int, filters: Optional[Dict] = None) -> int:
+    """Như count_media_by_album nhưng cache trong MEDIA_COUNT_CACHE_TTL giây (có thể lệch vài giây).
+
+    Chỉ cache tổng của cả album; có bộ lọc thì đếm trực tiếp.
+    """
+    if filters and any(value is not None for value in filters.values()):
+        return count_media_by_album(db=db, album_id=album_id, filters=filters)
+    return _media_counts.get(album_id, lambda: count_media_by_album(db=db, album_id=album_id))
 
 def delete_media(db: Session, media_id: int):
     """Xóa media theo id"""
     media = db.query(models.Media).filter(models.Media.id == media_id).first()
     if not media:
         return None
+    content_hash = media.content_hash
     db.delete(media)
+    # Khóa blob trước album, cùng thứ tự với lúc upload (acquire_blob rồi mới cập nhật album)
+    released = release_blobs(db, {content_hash: 1}) if content_hash else []
+    remove_from_album_summary(db, media.album_id, [media])
+    if not content_hash:
+        enqueue_legacy_file_deletion(db, media.file_url)
+    db.commit()
+    purge_blobs(db, released)
+    return True
+
+# Upload session CRUD
+def create_upload_session(db: Session, upload_id: str, session: schemas.UploadSessionCreate, created_by: int, chunk_size: int, ttl_seconds: int):
+    """Tạo phiên upload nhiều phần"""
+    db_session = models.UploadSession(
+        id=upload_id,
+        **session.model_dump(),
+        created_by=created_by,
+        chunk_size=chunk_size,
+        expires_at=datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds),
+    )
+    db.add(db_session)
+    db.commit()
+    db.refresh(db_session)
+    return db_session
+
+def get_upload_session(db: Session, upload_id: str, lock: bool = False, shared: bool = False):
+    """Lấy phiên upload theo id (lock=True: FOR UPDATE khi complete / hủy; shared=True: FOR KEY SHARE khi ghi chunk)"""
+    query = db.query(models.UploadSession).filter(models.UploadSession.id == upload_id)
+    if lock:
+        query = query.with_for_update()
+    elif shared:
+        query = query.with_for_update(read=True, key_share=True)
+    return query.first()
+
+def record_upload_chunk(db: Session, upload_id: str, chunk_index: int, size: int, sha256: str, ttl_seconds: int):
+    """Ghi nhận chunk đã nhận (gửi lại chunk cũ thì ghi đè) và gia hạn phiên"""
+    stmt = insert(models.UploadChunk).values(
+        upload_id=upload_id, chunk_index=chunk_index, size=size, sha256=sha256
+    )
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.UploadChunk.upload_id, models.UploadChunk.chunk_index],
+        set_={"size": stmt.excluded.size, "sha256": stmt.excluded.sha256},
+    )
+    db.execute(stmt)
+    db.query(models.UploadSession).filter(models.UploadSession.id == upload_id).update(
+        {"expires_at": datetime.now(timezone.utc) + timedelta(seconds=ttl_seconds)}
+    )
+    db.commit()
+
+def get_upload_chunk_indices(db: Session, upload_id: str) -> List[int]:
+    """Danh sách index các chunk đã nhận, tăng dần"""
+    rows = (
+        db.query(models.UploadChunk.chunk_index)
+        .filter(models.UploadChunk.upload_id == upload_id)
+        .order_by(models.UploadChunk.chunk_index)
+        .all()
+    )
+    return [row[0] for row in rows]
+
+def delete_upload_session(db: Session, upload_id: str):
+    """Xóa phiên upload (chunk bị xóa theo qua ON DELETE CASCADE)"""
+    deleted = db.query(models.UploadSession).filter(models.UploadSession.id == upload_id).delete()
     db.commit()
-    return True
\ No newline at end of file
+    return deleted > 0
+
+def delete_expired_upload_sessions(db: Session) -> List[str]:
+    """Xóa các phiên upload đã hết hạn, trả về danh sách id để dọn file tạm"""
+    expired = (
+        db.query(models.UploadSession.id)
+        .filter(models.UploadSession.expires_at < func.now())
+        .all()
+    )
+    upload_ids = [row[0] for row in expired]
+    if upload_ids:
+        db.query(models.UploadSession).filter(models.UploadSession.id.in_(upload_ids)).delete(synchronize_session=False)
+        db.commit()
+    return upload_ids
+
+def get_active_upload_ids(db: Session) -> List[str]:
+    """Id của mọi phiên upload còn tồn tại"""
+    return [row[0] for row in db.query(models.UploadSession.id).all()]
@@ -0,0 +1,152 @@
+import argparse
+import json
+import logging
+import time
+from dataclasses import asdict, dataclass, field
+from datetime import datetime, timezone
+from typing import List, Optional
+from sqlalchemy.orm import Session
+import app.config as config
+import app.models as models
+from app import crud
+from app.db import SessionLocal
+from app.utils import storage
+from app.utils.storage_backends import is_valid_key
+
+# Garbage collector cho storage của Gallery Service
+# Chạy: python -m app.gc [--dry-run] [--grace-seconds 86400] [--batch-size 500] [--max-deletes-per-second 20]
+# - File trong storage không còn blob/media nào tham chiếu (kể cả thumb_* của bản cũ) -> xóa
+# - File tạm của upload hỏng giữa chừng (INCOMING_DIR/*.upload) -> xóa
+# - Dòng blob ref_count <= 0 sót lại (process chết giữa chừng) -> purge như lúc xóa media
+# Chỉ đụng tới file cũ hơn grace period; đối chiếu với DB theo từng lô; tốc độ xóa bị giới hạn
+# để không làm nghẽn disk. --dry-run chỉ in báo cáo, không xóa gì.
+
+logger = logging.getLogger("app.gc")
+
+SAMPLE_SIZE = 20
+
+@dataclass
+class GCReport:
+    dry_run: bool
+    scanned_files: int = 0
+    skipped_recent: int = 0
+    orphan_files: int = 0
+    orphan_bytes: int = 0
+    deleted_files: int = 0
+    stale_temp_files: int = 0
+    stale_temp_bytes: int = 0
+    purged_blobs: int = 0
+    sample: List[str] = field(default_factory=list)  # vài key mồ côi đầu tiên, để kiểm tra khi dry-run
+
+class RateLimiter:
+    """Giới hạn số thao tác mỗi giây (ngủ cho đủ khoảng cách giữa hai lần)"""
+
+    def __init__(self, per_second: float):
+        self.interval = 1.0 / per_second if per_second > 0 else 0.0
+        self._next = time.monotonic()
+
+    def wait(self) -> None:
+        now = time.monotonic()
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(now, self._next) + self.interval
+
+def _collect_batch(db: Session, keys: List[str], report: GCReport, limiter: RateLimiter) -> None:
+    referenced = crud.referenced_keys(db, keys)
+    db.commit()
+    for key in keys:
+        if key in referenced:
+            continue
+        report.orphan_files += 1
+        report.orphan_bytes += storage.backend.size(key) or 0
+        if len(report.sample) < SAMPLE_SIZE:
+            report.sample.append(key)
+        if report.dry_run:
+            continue
+        limiter.wait()
+        # Kiểm tra lại dưới khóa: file có thể vừa được upload tạo lại sau khi đối chiếu lô
+        if crud.delete_unreferenced_file(db, key):
+            report.deleted_files += 1
+    logger.info("Scanned %d files: %d orphans (%d bytes), %d deleted",
+                report.scanned_files, report.orphan_files, report.orphan_bytes, report.deleted_files)
+
+def collect_orphan_files(db: Session, report: GCReport, cutoff: float, batch_size: int, limiter: RateLimiter) -> None:
+    batch: List[str] = []
+    for key, mtime in storage.backend.iter_keys():
+        report.scanned_files += 1
+        if not is_valid_key(key):
+            continue
+        if mtime > cutoff:
+            report.skipped_recent += 1
+            continue
+        batch.append(key)
+        if len(batch) >= batch_size:
+            _collect_batch(db, batch, report, limiter)
+            batch = []
+    if batch:
+        _collect_batch(db, batch, report, limiter)
+
+def collect_stale_uploads(report: GCReport, cutoff: float, limiter: RateLimiter) -> None:
+    """File tạm của upload một request: request xong là file được promote/xóa, còn sót lại nghĩa là đã hỏng"""
+    for name, mtime, size in storage.list_incoming_files():
+        if not name.endswith(".upload") or mtime > cutoff:
+            continue
+        report.stale_temp_files += 1
+        report.stale_temp_bytes += size
+        if not report.dry_run:
+            limiter.wait()
+            storage.remove_incoming_file(name)
+
+def collect_released_blobs(db: Session, report: GCReport, cutoff: float) -> None:
+    hashes = [
+        row[0] for row in
+        db.query(models.Blob.sha256)
+        .filter(models.Blob.ref_count <= 0, models.Blob.created_at < datetime.fromtimestamp(cutoff, tz=timezone.utc))
+        .all()
+    ]
+    db.commit()
+    if report.dry_run:
+        report.purged_blobs += len(hashes)
+        return
+    report.purged_blobs += crud.purge_blobs(db, hashes)
+
+def run_gc(
+    dry_run: bool = False,
+    grace_seconds: Optional[int] = None,
+    batch_size: Optional[int] = None,
+    max_deletes_per_second: Optional[float] = None,
+) -> GCReport:
+    grace_seconds = config.GC_GRACE_SECONDS if grace_seconds is None else grace_seconds
+    batch_size = batch_size or config.GC_BATCH_SIZE
+    limiter = RateLimiter(config.GC_MAX_DELETES_PER_SECOND if max_deletes_per_second is None else max_deletes_per_second)
+    cutoff = time.time() - grace_seconds
+    report = GCReport(dry_run=dry_run)
+
+    db = SessionLocal()
+    try:
+        collect_released_blobs(db, report, cutoff)
+        collect_orphan_files(db, report, cutoff, batch_size, limiter)
+    finally:
+        db.close()
+    collect_stale_uploads(report, cutoff, limiter)
+    return report
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(prog="python -m app.gc")
+    parser.add_argument("--dry-run", action="store_true")
+    parser.add_argument("--grace-seconds", type=int, default=None)
+    parser.add_argument("--batch-size", type=int, default=None)
+    parser.add_argument("--max-deletes-per-second", type=float, default=None)
+    args = parser.parse_args(argv)
+
+    report = run_gc(
+        dry_run=args.dry_run,
+        grace_seconds=args.grace_seconds,
+        batch_size=args.batch_size,
+        max_deletes_per_second=args.max_deletes_per_second,
+    )
+    print(json.dumps(asdict(report), indent=2))
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    main()
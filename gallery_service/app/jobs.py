@@ -0,0 +1,74 @@
+from sqlalchemy import and_, or_
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+import app.config as config
+import app.models as models
+
+# Hàng đợi job nền lưu trong bảng `jobs`
+# - enqueue_job(): thêm job, KHÔNG commit -> job được ghi cùng transaction với dữ liệu sinh ra nó
+# - claim_jobs(): worker lấy job bằng FOR UPDATE SKIP LOCKED, nhiều worker không giẫm chân nhau
+# - complete_job() / fail_job(): ghi kết quả, lỗi thì retry với exponential backoff
+
+JOB_THUMBNAIL = "thumbnail"
+JOB_DELETE_FILE = "delete_file"
+
+def enqueue_job(db: Session, kind: str, payload: Dict[str, Any], max_attempts: Optional[int] = None) -> models.Job:
+    """Thêm job vào hàng đợi (caller tự commit)"""
+    job = models.Job(
+        kind=kind,
+        payload=payload,
+        max_attempts=max_attempts or config.JOB_MAX_ATTEMPTS,
+    )
+    db.add(job)
+    return job
+
+def claim_jobs(db: Session, limit: int) -> List[models.Job]:
+    """Claim tối đa `limit` job sẵn sàng chạy và đánh dấu running.
+
+    Job đang running nhưng locked_at quá JOB_LOCK_TIMEOUT_SECONDS (worker chết giữa chừng)
+    cũng được claim lại.
+    """
+    stale_before = func.now() - timedelta(seconds=config.JOB_LOCK_TIMEOUT_SECONDS)
+    jobs = (
+        db.query(models.Job)
+        .filter(
+            or_(
+                and_(models.Job.status == "queued", models.Job.run_after <= func.now()),
+                and_(models.Job.status == "running", models.Job.locked_at < stale_before),
+            )
+        )
+        .order_by(models.Job.run_after, models.Job.id)
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+        .all()
+    )
+    for job in jobs:
+        job.status = "running"
+        job.attempts += 1
+        job.locked_at = func.now()
+    db.commit()
+    return jobs
+
+def complete_job(db: Session, job: models.Job) -> None:
+    """Đánh dấu job chạy xong (caller tự commit)"""
+    job.status = "done"
+    job.locked_at = None
+    job.last_error = None
+
+def fail_job(db: Session, job: models.Job, error: str) -> bool:
+    """Ghi lỗi và lên lịch chạy lại; trả về True nếu đã hết số lần thử (caller tự commit)"""
+    job.last_error = error[:2000]
+    job.locked_at = None
+    if job.attempts >= job.max_attempts:
+        job.status = "failed"
+        return True
+    delay = min(config.JOB_RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), config.JOB_RETRY_MAX_SECONDS)
+    job.status = "queued"
+    job.run_after = func.now() + timedelta(seconds=delay)
+    return False
+
+def get_job(db: Session, job_id: int) -> Optional[models.Job]:
+    """Lấy job theo id"""
+    return db.query(models.Job).filter(models.Job.id == job_id).first()
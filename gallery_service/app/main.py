@@ -1,16 +1,35 @@
+import asyncio
 from fastapi import FastAPI
-from contextlib import asynccontextmanager
-from fastapi.staticfiles import StaticFiles
+from contextlib import asynccontextmanager, suppress
+from common.revocation import revocation_sync_loop
+from app.auth import revocations
+from app.config import REVOCATION_SYNC_INTERVAL
 from app.db import Base, engine
-from app.routes import album, media, health
+from app.routes import album, media, uploads, health, files, feed
+from app.utils.cleanup import upload_cleanup_loop
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    # Dọn định kỳ các phiên resumable upload bị bỏ dở
+    cleanup_task = asyncio.create_task(upload_cleanup_loop())
+    # Đồng bộ danh sách token bị thu hồi từ Auth Service
+    sync_task = asyncio.create_task(revocation_sync_loop(revocations, REVOCATION_SYNC_INTERVAL)) if revocations else None
     yield
+    # Đóng các stream SSE đang mở để worker tắt được ngay (client tự kết nối lại tới worker khác)
+    feed.feed_hub.close()
+    cleanup_task.cancel()
+    with suppress(asyncio.CancelledError):
+        await cleanup_task
+    if sync_task is not None:
+        sync_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await sync_task
 
 app = FastAPI(title="Gallery Service", version="0.1.0", lifespan=lifespan)
 
 app.include_router(health.router)
 app.include_router(album.router)
+app.include_router(uploads.router)
 app.include_router(media.router)
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
\ No newline at end of file
+app.include_router(files.router)
+app.include_router(feed.router)
@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, BigInteger, String, Text, ForeignKey, DateTime, Index
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.db import Base
+from app.utils.render import thumbnail_url
 
 class Album(Base):
     __tablename__ = "albums"
@@ -12,18 +14,113 @@ class Album(Base):
     created_by = Column(Integer, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
+    # Tóm tắt album, cập nhật cộng dồn khi thêm/xóa media (không phải đếm/quét media mỗi lần đọc)
+    media_count = Column(Integer, nullable=False, server_default="0")
+    total_bytes = Column(BigInteger, nullable=False, server_default="0")
+    last_upload_at = Column(DateTime(timezone=True), nullable=True)
+    cover_media_id = Column(Integer, nullable=True)  # ảnh upload sớm nhất của album; null: album chưa có ảnh
+    # Phiên bản nội dung album (kể cả trạng thái xử lý của media): tăng mỗi khi thay đổi, dùng cho ETag / cache manifest
+    revision = Column(Integer, nullable=False, server_default="0")
+    updated_at = Column(DateTime(timezone=True), server_default=func.now())  # Last-Modified, đổi cùng revision
+
     media_items = relationship(
         "Media",
         back_populates="album",
         cascade="all, delete-orphan"
     )
 
+    @property
+    def cover_url(self):
+        return thumbnail_url(self.cover_media_id) if self.cover_media_id else None
+
 class Media(Base):
     __tablename__ = "media"
     id = Column(Integer, primary_key=True, index=True)
     album_id = Column(Integer, ForeignKey("albums.id", ondelete="CASCADE"))
-    file_url = Column(String(500), nullable=False)
+    file_url = Column(String(500), nullable=False, index=True)  # GC / phục vụ file cũ tra ngược theo URL
     media_type = Column(String(50), nullable=False)  # image / video
+    content_hash = Column(String(64), ForeignKey("blobs.sha256"), nullable=True, index=True)  # null: media cũ / URL ngoài
     uploaded_at = Column(DateTime(timezone=True), server_default=func.now())
 
-    album = relationship("Album", back_populates="media_items")
\ No newline at end of file
+    # Ảnh phái sinh (thumbnail...) được job queue tạo nền: pending -> ready / failed
+    thumbnail_url = Column(String(500), nullable=True)
+    processing_status = Column(String(20), nullable=False, server_default="ready")
+    dhash = Column(BigInteger, nullable=True)  # perceptual hash 64-bit (có dấu), tính cùng job thumbnail
+
+    # Metadata đọc lúc ingest (null: media cũ chưa backfill / không phải ảnh)
+    width = Column(Integer, nullable=True)
+    height = Column(Integer, nullable=True)
+    byte_size = Column(BigInteger, nullable=True)
+    captured_at = Column(DateTime(timezone=True), nullable=True)  # EXIF DateTimeOriginal
+    orientation = Column(String(10), nullable=True)                # landscape / portrait / square
+    # Vị trí trong live feed = revision album lúc thêm (lấy khi giữ khóa dòng album tới commit, nên tăng theo thứ tự commit)
+    feed_seq = Column(BigInteger, nullable=False, server_default="0")
+
+    album = relationship("Album", back_populates="media_items")
+
+    # Keyset pagination theo album: WHERE album_id = ? AND (uploaded_at, id) > (?, ?) ORDER BY uploaded_at, id
+    # Sắp xếp/lọc theo thời điểm chụp, dung lượng, hướng ảnh trong album cũng đi thẳng qua index
+    __table_args__ = (
+        Index("ix_media_album_uploaded_at_id", "album_id", "uploaded_at", "id"),
+        Index("ix_media_album_captured_at_id", "album_id", "captured_at", "id"),
+        Index("ix_media_album_byte_size_id", "album_id", "byte_size", "id"),
+        Index("ix_media_album_orientation", "album_id", "orientation"),
+        Index("ix_media_album_feed_seq_id", "album_id", "feed_seq", "id"),
+    )
+
+# File lưu theo nội dung (sha256): nhiều Media cùng nội dung dùng chung một blob.
+# ref_count = số Media đang trỏ tới; về 0 thì file mới bị xóa
+class Blob(Base):
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True)
+    file_name = Column(String(255), nullable=False)
+    size = Column(BigInteger, nullable=False)
+    crc32 = Column(BigInteger, nullable=True)  # dùng khi ghép ZIP; null: blob cũ, tính bù lần đầu cần
+    ref_count = Column(Integer, nullable=False, server_default="0")
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+# Phiên upload nhiều phần (resumable): client PUT từng chunk, cuối cùng complete
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    id = Column(String(36), primary_key=True)  # uuid4
+    album_id = Column(Integer, ForeignKey("albums.id", ondelete="CASCADE"), nullable=False)
+    created_by = Column(Integer, nullable=False)
+    filename = Column(String(255), nullable=False)
+    content_type = Column(String(100), nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+    chunks = relationship(
+        "UploadChunk",
+        cascade="all, delete-orphan",
+        passive_deletes=True
+    )
+
+class UploadChunk(Base):
+    __tablename__ = "upload_chunks"
+    upload_id = Column(String(36), ForeignKey("upload_sessions.id", ondelete="CASCADE"), primary_key=True)
+    chunk_index = Column(Integer, primary_key=True)
+    size = Column(Integer, nullable=False)
+    sha256 = Column(String(64), nullable=False)
+
+# Hàng đợi job nền (thumbnail, ảnh phái sinh...) lưu trong Postgres.
+# Worker claim job bằng SELECT ... FOR UPDATE SKIP LOCKED nên chạy nhiều worker song song được.
+class Job(Base):
+    __tablename__ = "jobs"
+    id = Column(BigInteger, primary_key=True)
+    kind = Column(String(50), nullable=False)
+    payload = Column(JSONB, nullable=False)
+    status = Column(String(20), nullable=False, server_default="queued")  # queued / running / done / failed
+    attempts = Column(Integer, nullable=False, server_default="0")
+    max_attempts = Column(Integer, nullable=False)
+    run_after = Column(DateTime(timezone=True), nullable=False, server_default=func.now())
+    locked_at = Column(DateTime(timezone=True), nullable=True)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+    __table_args__ = (
+        Index("ix_jobs_status_run_after", "status", "run_after"),
+    )
@@ -1,8 +1,13 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from app import crud, schemas
-from app.db import SessionLocal
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+from app import crud, schemas, config
+from app.db import SessionLocal, get_session, run_db
 from app.auth import get_current_user
+from app.utils.archive import SlotResponse, ZipArchive, RangeNotSatisfiable, archive_slots, parse_range
+from app.utils.pagination import encode_cursor
+from common.conditional import is_not_modified, make_etag, not_modified, validator_headers
+from app.utils.slideshow import SCREENS, build_manifest, manifest_cache, manifest_etag
 
 router = APIRouter(
     prefix="/albums",
@@ -17,28 +22,140 @@ def get_db():
     finally:
         db.close()
 
+# Route async dùng get_session + run_db (AsyncSession khi DB_ASYNC=true); route có việc tốn CPU
+# hoặc đọc file (manifest, archive) vẫn là route sync chạy trong threadpool
+
 # Tạo album mới
 @router.post("/", response_model=schemas.Album)
-def create_album(album: schemas.AlbumCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
+async def create_album(album: schemas.AlbumCreate, db=Depends(get_session), user=Depends(get_current_user)):
     if user["role"] not in ["user", "admin"]:
         raise HTTPException(status_code=403, detail="Forbidden")
-    return crud.create_album(db=db, album=album, created_by=user["user_id"])
+    return await run_db(db, crud.create_album, album=album, created_by=user["user_id"])
 
-# Lấy album theo event_id
-@router.get("/event/{event_id}", response_model=schemas.Album)
-def get_album_by_event(event_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    album = crud.get_album_by_event(db=db, event_id=event_id)
-    if not album:
+# Lấy album theo event_id: mặc định chỉ trả tóm tắt (số media, ảnh bìa, dung lượng, lần upload cuối)
+# include_media=true: kèm trang media đầu tiên (media_limit phần tử) và next_cursor để
+# lấy tiếp qua GET /media/album/{album_id}?cursor=...
+# ETag theo revision của album: If-None-Match / If-Modified-Since khớp thì trả 304 sau một query nhỏ
+@router.get("/event/{event_id}", response_model=schemas.AlbumWithMedia, response_model_exclude_unset=True)
+async def get_album_by_event(
+    event_id: int,
+    request: Request,
+    response: Response,
+    include_media: bool = Query(False),
+    media_limit: int = Query(20, ge=1, le=100),
+    db=Depends(get_session),
+    user=Depends(get_current_user)
+):
+    version = await run_db(db, crud.get_album_version_by_event, event_id=event_id)
+    if not version:
         raise HTTPException(status_code=404, detail="Album not found for this event")
-    return album
+    headers = validator_headers(
+        make_etag("album", version.id, version.revision, include_media and media_limit),
+        version.updated_at,
+    )
+    if is_not_modified(request, headers["ETag"], version.updated_at):
+        return not_modified(headers)
+    response.headers.update(headers)
+
+    album = await run_db(db, crud.get_album, album_id=version.id)
+    summary = schemas.Album.model_validate(album).model_dump()
+    if not include_media:
+        return schemas.AlbumWithMedia(**summary)  # media_items không được gán -> không xuất hiện trong response
+
+    media_items = await run_db(db, crud.get_media_page_by_album, album_id=album.id, limit=media_limit + 1)
+    next_cursor = None
+    if len(media_items) > media_limit:
+        media_items = media_items[:media_limit]
+        last = media_items[-1]
+        next_cursor = encode_cursor("uploaded_at", last.uploaded_at, last.id)
+    return schemas.AlbumWithMedia(**summary, media_items=media_items, next_cursor=next_cursor)
+
+# Manifest slideshow: slide theo thứ tự upload, URL render cho từng cỡ màn hình + kích thước sau render,
+# gợi ý preload. Dựng một lần cho mỗi revision của album; ETag theo revision -> revalidate trả 304
+# chỉ tốn một query đọc revision. screen: cỡ màn hình dùng cho header Link preload.
+@router.get("/{album_id}/slideshow")
+def get_slideshow_manifest(
+    album_id: int,
+    request: Request,
+    screen: str = Query(config.SLIDESHOW_DEFAULT_SCREEN),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    if screen not in {s.name for s in SCREENS}:
+        raise HTTPException(status_code=400, detail="Unknown screen size")
+    revision = crud.get_album_revision(db=db, album_id=album_id)
+    if revision is None:
+        raise HTTPException(status_code=404, detail="Album not found")
+
+    headers = validator_headers(manifest_etag(album_id, revision))
+    if is_not_modified(request, headers["ETag"]):
+        return not_modified(headers)
+
+    # Đọc revision trước media: media có mới hơn revision thì lần sau revision tăng và manifest được dựng lại
+    manifest = manifest_cache.get(
+        album_id, revision,
+        lambda: build_manifest(album_id, revision, crud.get_slideshow_media(db=db, album_id=album_id)),
+    )
+    if manifest.links[screen]:
+        headers["Link"] = manifest.links[screen]
+    return Response(content=manifest.body, media_type="application/json", headers=headers)
 
 # Xóa album theo album_id
 @router.delete("/{album_id}")
-def delete_album(album_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    album = crud.get_album(db=db, album_id=album_id)
+async def delete_album(album_id: int, db=Depends(get_session), user=Depends(get_current_user)):
+    album = await run_db(db, crud.get_album, album_id=album_id)
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     if album.created_by != user["user_id"] and user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Forbidden")
-    result = crud.delete_album(db=db, album_id=album_id)
-    return {"detail": "Album deleted successfully"}
\ No newline at end of file
+    await run_db(db, crud.delete_album, album_id=album_id)
+    return {"detail": "Album deleted successfully"}
+
+# Tải cả album dạng ZIP, ghép ngay khi stream từ storage (không file tạm, bộ nhớ không đổi)
+# Hỗ trợ Range/If-Range để tải tiếp; mỗi worker chỉ stream tối đa ARCHIVE_MAX_CONCURRENT archive,
+# vượt quá thì trả 503 + Retry-After để một lần export lớn không chiếm hết service
+@router.get("/{album_id}/archive")
+async def download_album_archive(album_id: int, request: Request, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    album = await run_in_threadpool(crud.get_album, db=db, album_id=album_id)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+
+    if archive_slots.locked():
+        raise HTTPException(
+            status_code=503,
+            detail="Too many archive downloads in progress",
+            headers={"Retry-After": str(config.ARCHIVE_RETRY_AFTER)},
+        )
+    await archive_slots.acquire()
+    try:
+        entries = await run_in_threadpool(crud.get_album_archive_entries, db=db, album_id=album_id)
+        archive = ZipArchive(entries)
+
+        headers = {
+            "Accept-Ranges": "bytes",
+            "ETag": archive.etag,
+            "Content-Disposition": f'attachment; filename="album-{album_id}.zip"',
+        }
+        start, end, status_code = 0, archive.size - 1, 200
+        http_range = request.headers.get("range")
+        if_range = request.headers.get("if-range")
+        if http_range and archive.size and (if_range is None or if_range == archive.etag):
+            try:
+                byte_range = parse_range(http_range, archive.size)
+            except RangeNotSatisfiable:
+                archive_slots.release()
+                return Response(status_code=416, headers={"Content-Range": f"bytes */{archive.size}"})
+            if byte_range:
+                start, end = byte_range
+                status_code = 206
+                headers["Content-Range"] = f"bytes {start}-{end}/{archive.size}"
+        headers["Content-Length"] = str(end - start + 1)
+    except BaseException:
+        archive_slots.release()
+        raise
+
+    # Từ đây slot do response giữ và trả khi response kết thúc
+    return SlotResponse(
+        iterate_in_threadpool(archive.iter_range(start, end)),
+        slots=archive_slots, status_code=status_code, headers=headers, media_type="application/zip",
+    )
@@ -0,0 +1,75 @@
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from typing import List, Optional, Tuple
+from sqlalchemy.orm import Session
+from app import crud, schemas, config
+from app.db import SessionLocal
+from app.auth import get_stream_user
+from app.utils.live_feed import FeedHub, Position, parse_event_id
+
+router = APIRouter(
+    prefix="/albums",
+    tags=["feed"],
+)
+
+def get_db():
+    db = SessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def load_feed_media(album_id: int, after: Optional[Position], ids: Optional[List[int]]) -> List[Tuple[Position, str]]:
+    """Chạy trong threadpool: media của album đã serialize sẵn một lần cho mọi client"""
+    db = SessionLocal()
+    try:
+        limit = len(ids) if ids is not None else config.FEED_REPLAY_PAGE_SIZE
+        items = crud.get_media_feed(db=db, album_id=album_id, after=after, ids=ids, limit=limit)
+        return [((m.feed_seq, m.id), schemas.Media.model_validate(m).model_dump_json()) for m in items]
+    finally:
+        db.close()
+
+# Một hub cho mỗi worker: một connection LISTEN dùng chung cho mọi màn hình đang xem
+feed_hub = FeedHub(config.LISTEN_DATABASE_URL, load_feed_media, queue_size=config.FEED_QUEUE_SIZE)
+
+def feed_response(db: Session, album_id: int, last_event_id: Optional[str]) -> StreamingResponse:
+    after = None
+    if last_event_id:
+        try:
+            feed_seq, media_id = parse_event_id(last_event_id)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid Last-Event-ID")
+        after = (feed_seq, media_id) if feed_seq is not None else crud.get_feed_position(db=db, album_id=album_id, media_id=media_id)
+    return StreamingResponse(
+        feed_hub.stream(album_id, after, keepalive=config.FEED_KEEPALIVE_SECONDS),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},  # nginx không buffer stream
+    )
+
+# Stream media mới của album (Server-Sent Events, event "media", id = "<feed_seq>.<media id>")
+# Kết nối lại: EventSource tự gửi header Last-Event-ID (hoặc truyền last_event_id) -> trả bù media bị lỡ
+@router.get("/{album_id}/feed")
+def album_feed(
+    album_id: int,
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    db: Session = Depends(get_db),
+    user=Depends(get_stream_user)
+):
+    if not crud.get_album(db=db, album_id=album_id):
+        raise HTTPException(status_code=404, detail="Album not found")
+    return feed_response(db, album_id, last_event_id_header or last_event_id)
+
+# Như trên nhưng theo event_id (mỗi sự kiện một album)
+@router.get("/event/{event_id}/feed")
+def event_feed(
+    event_id: int,
+    last_event_id: Optional[str] = Query(None),
+    last_event_id_header: Optional[str] = Header(None, alias="Last-Event-ID"),
+    db: Session = Depends(get_db),
+    user=Depends(get_stream_user)
+):
+    album = crud.get_album_by_event(db=db, event_id=event_id)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found for this event")
+    return feed_response(db, album.id, last_event_id_header or last_event_id)
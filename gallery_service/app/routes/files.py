@@ -0,0 +1,90 @@
+import os
+from mimetypes import guess_type
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import FileResponse, RedirectResponse, Response
+from sqlalchemy.orm import Session
+from app import config, crud
+from app.auth import get_optional_user
+from app.db import get_db
+from app.utils.storage import backend
+from app.utils.storage_backends import is_content_addressed, is_valid_key, verify_signature
+
+router = APIRouter(
+    prefix="/uploads",
+    tags=["files"],
+)
+
+# Cache header cho file gốc:
+# - file đặt tên theo sha256: nội dung không bao giờ đổi -> immutable, ETag mạnh là chính hash
+# - file cũ (uuid): không có hash, trình duyệt phải hỏi lại server (ETag theo mtime/size)
+# "private" vì file cần quyền truy cập, proxy dùng chung không được giữ bản sao
+IMMUTABLE_CACHE_CONTROL = "private, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "private, no-cache"
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """So khớp If-None-Match kiểu weak (RFC 9110), đủ cho GET/HEAD"""
+    if if_none_match.strip() == "*":
+        return True
+    candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return etag.removeprefix("W/") in candidates
+
+def authorize_file(db: Session, key: str, user, expires: Optional[int], signature: Optional[str]) -> None:
+    """Cho phép nếu có URL ký hợp lệ, hoặc user đã đăng nhập và file thuộc một album còn tồn tại"""
+    if expires is not None or signature is not None:
+        if expires is None or not signature or not verify_signature(key, expires, signature):
+            raise HTTPException(status_code=403, detail="Invalid or expired signature")
+        return
+    if user is None:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    content_hash = os.path.splitext(key)[0] if is_content_addressed(key) else None
+    if crud.get_album_for_file(db=db, key=key, content_hash=content_hash) is None:
+        raise HTTPException(status_code=404, detail="File not found")
+
+# Tải file media gốc theo key (thay cho StaticFiles mount cũ, file_url trong DB giữ nguyên)
+# - Range / If-Range: tua video, tải tiếp file dở (FileResponse xử lý, dựa trên ETag bên dưới)
+# - If-None-Match: trả 304 khi client đã có bản giống hệt
+# - local: sendfile qua server ASGI, hoặc X-Accel-Redirect cho nginx nếu cấu hình MEDIA_ACCEL_REDIRECT_PREFIX
+# - s3: redirect sang presigned URL, byte không đi qua gallery service
+@router.api_route("/{key}", methods=["GET", "HEAD"])
+def get_file(
+    key: str,
+    request: Request,
+    expires: Optional[int] = Query(None),
+    signature: Optional[str] = Query(None),
+    db: Session = Depends(get_db),
+    user=Depends(get_optional_user)
+):
+    if not is_valid_key(key):
+        raise HTTPException(status_code=404, detail="File not found")
+    authorize_file(db, key, user, expires, signature)
+
+    path = backend.local_path(key)
+    if path is None:
+        return RedirectResponse(backend.presigned_url(key, config.PRESIGNED_URL_TTL_SECONDS), status_code=307)
+    try:
+        stat_result = os.stat(path)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="File not found")
+
+    headers = {}
+    if is_content_addressed(key):
+        headers["ETag"] = f'"{os.path.splitext(key)[0]}"'
+        headers["Cache-Control"] = IMMUTABLE_CACHE_CONTROL
+    else:
+        headers["Cache-Control"] = REVALIDATE_CACHE_CONTROL
+    response = FileResponse(path, headers=headers, stat_result=stat_result)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and etag_matches(if_none_match, response.headers["etag"]):
+        return Response(
+            status_code=304,
+            headers={"ETag": response.headers["etag"], "Cache-Control": response.headers["cache-control"]},
+        )
+
+    if config.MEDIA_ACCEL_REDIRECT_PREFIX:
+        # nginx tự đọc file (sendfile), tự xử lý Range; app chỉ kiểm tra quyền và gắn header
+        relative_path = os.path.relpath(path, config.UPLOAD_DIR).replace(os.sep, "/")
+        headers["X-Accel-Redirect"] = f"{config.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/')}/{relative_path}"
+        return Response(headers=headers, media_type=guess_type(key)[0] or "application/octet-stream")
+    return response
@@ -1,7 +1,15 @@
 from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+from app.auth import token_validator
+from common.pool_metrics import render_metrics
 
 router = APIRouter()
 
 @router.get("/health")
 def health():
-    return {"status": "ok"}
\ No newline at end of file
+    return {"status": "ok"}
+
+# Số liệu connection pool, cache token và revocation filter (Prometheus text format) của worker nhận request
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(render_metrics() + token_validator.render_metrics(), media_type="text/plain; version=0.0.4")
@@ -1,11 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request, Response
+from fastapi.responses import FileResponse
+import asyncio
+import datetime
+from typing import List, Optional
 from sqlalchemy.orm import Session
-from app import crud, schemas, models
-from app.db import SessionLocal
-from app.utils.storage import save_file
+from app import crud, schemas, config
+from app.db import SessionLocal, get_session, run_db
+from app.utils.storage import save_upload, discard_file, UploadTooLarge, storage_key, backend
+from app.utils.render import UnrenderableImage, Variant, get_or_render, snap_size
+from app.utils.pagination import InvalidCursor, decode_cursor, encode_cursor
+from common.conditional import is_not_modified, make_etag, not_modified, validator_headers
 from app.auth import get_current_user
-from PIL import Image
-import os
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter(
     prefix="/media",
@@ -19,49 +25,89 @@ def get_db():
     finally:
         db.close()
 
-# Hàm tạo thumbnail từ file gốc
-def create_thumbnail(file_url: str) -> str | None:
-    try:
-        filename = file_url.split("/")[-1]
-        file_path = os.path.join("uploads", filename)
-
-        thumb_name = f"thumb_{filename}"
-        thumb_path = os.path.join("uploads", thumb_name)
-
-        img = Image.open(file_path)
-        img.thumbnail((200, 200))
-        img.save(thumb_path)
-
-        return f"/uploads/{thumb_name}"
-    except Exception as e:
-        print("Thumbnail error:", e)
-        return None
+# Route async dùng get_session + run_db (AsyncSession khi DB_ASYNC=true); duplicates/similar (dựng BK-tree),
+# render và upload (đọc/ghi file) vẫn chạy trong threadpool với Session sync
 
 # Thêm media vào album
 @router.post("/album/{album_id}", response_model=schemas.Media)
-def add_media(album_id: int, media: schemas.MediaCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    album = crud.get_album(db=db, album_id=album_id)
+async def add_media(album_id: int, media: schemas.MediaCreate, db=Depends(get_session), user=Depends(get_current_user)):
+    album = await run_db(db, crud.get_album, album_id=album_id)
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     if album.created_by != user["user_id"] and user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Forbidden")
-    return crud.add_media(db=db, media=media, album_id=album_id)
+    return await run_db(db, crud.add_media, media=media, album_id=album_id)
 
 # Lấy media của album với phân trang
+# - Mặc định: page/limit (OFFSET), trang rỗng trả 404 như cũ
+# - Có tham số cursor (lần đầu gửi cursor rỗng): keyset pagination theo (cột sort, id),
+#   chi phí mỗi trang không phụ thuộc độ sâu; trả next_cursor (null khi hết), trang rỗng không phải lỗi.
+#   Tổng số chỉ tính khi include_total=true và được cache ngắn hạn.
+# - sort: uploaded_at / captured_at / byte_size (media thiếu giá trị xếp cuối)
+# - Lọc theo metadata: orientation, captured_after, captured_before, min_width, min_height
+# - ETag theo revision của album + tham số query: không đổi thì trả 304, không chạy query danh sách
 @router.get("/album/{album_id}")
-def get_media_by_album(
+async def get_media_by_album(
     album_id: int,
+    request: Request,
+    response: Response,
     page: int = Query(1, ge=1),
     limit: int = Query(20, ge=1, le=100),
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None),
+    include_total: bool = Query(False),
+    sort: str = Query("uploaded_at", pattern="^(uploaded_at|captured_at|byte_size)$"),
+    orientation: Optional[str] = Query(None, pattern="^(landscape|portrait|square)$"),
+    captured_after: Optional[datetime.datetime] = Query(None),
+    captured_before: Optional[datetime.datetime] = Query(None),
+    min_width: Optional[int] = Query(None, ge=1),
+    min_height: Optional[int] = Query(None, ge=1),
+    db=Depends(get_session),
     user=Depends(get_current_user)
 ):
-    album = crud.get_album(db=db, album_id=album_id)
-    if not album:
+    version = await run_db(db, crud.get_album_version, album_id=album_id)
+    if not version:
         raise HTTPException(status_code=404, detail="Album not found")
-    total = crud.count_media_by_album(db=db, album_id=album_id)
+    headers = validator_headers(
+        make_etag("media-list", album_id, version.revision, sorted(request.query_params.multi_items())),
+        version.updated_at,
+    )
+    if is_not_modified(request, headers["ETag"], version.updated_at):
+        return not_modified(headers)
+    response.headers.update(headers)
+    filters = {
+        "orientation": orientation,
+        "captured_after": captured_after,
+        "captured_before": captured_before,
+        "min_width": min_width,
+        "min_height": min_height,
+    }
+
+    if cursor is not None:
+        value_type = int if sort == "byte_size" else datetime.datetime
+        try:
+            after = decode_cursor(cursor, sort, value_type) if cursor else None
+        except InvalidCursor:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        # Lấy dư một phần tử để biết còn trang sau hay không
+        media_items = await run_db(
+            db, crud.get_media_page_by_album, album_id=album_id, after=after, limit=limit + 1, sort=sort, filters=filters
+        )
+        has_more = len(media_items) > limit
+        media_items = media_items[:limit]
+        next_cursor = None
+        if has_more:
+            last = media_items[-1]
+            next_cursor = encode_cursor(sort, getattr(last, sort), last.id)
+        return {
+            "items": [schemas.Media.model_validate(m) for m in media_items],
+            "limit": limit,
+            "next_cursor": next_cursor,
+            "total": await run_db(db, crud.count_media_by_album_cached, album_id=album_id, filters=filters) if include_total else None,
+        }
+
+    total = await run_db(db, crud.count_media_by_album, album_id=album_id, filters=filters)
     skip = (page - 1) * limit
-    media_items = crud.get_media_by_album(db=db, album_id=album_id, skip=skip, limit=limit)
+    media_items = await run_db(db, crud.get_media_by_album, album_id=album_id, skip=skip, limit=limit, sort=sort, filters=filters)
 
     if not media_items:
         raise HTTPException(status_code=404, detail="No media found for this album")
@@ -73,47 +119,174 @@ def get_media_by_album(
         "total": total
     }
 
-# Lấy media theo id
+# Gom ảnh gần giống nhau trong album (ảnh chụp liên tiếp, bản nén lại...) theo perceptual hash
+# max_distance: số bit dHash khác nhau tối đa để coi là trùng (0 = gần như y hệt)
+@router.get("/album/{album_id}/duplicates", response_model=schemas.DuplicateGroups)
+def get_duplicate_media(
+    album_id: int,
+    max_distance: int = Query(4, ge=0, le=64),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    album = crud.get_album(db=db, album_id=album_id)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+    return {"groups": crud.find_duplicate_groups(db=db, album_id=album_id, max_distance=max_distance)}
+
+# Lấy media theo id (ETag theo revision của album chứa media)
 @router.get("/{media_id}", response_model=schemas.Media)
-def get_media(media_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    media = db.query(models.Media).filter(models.Media.id == media_id).first()
+async def get_media(media_id: int, request: Request, response: Response, db=Depends(get_session), user=Depends(get_current_user)):
+    version = await run_db(db, crud.get_media_version, media_id=media_id)
+    if version:
+        headers = validator_headers(make_etag("media", media_id, version.revision), version.updated_at)
+        if is_not_modified(request, headers["ETag"], version.updated_at):
+            return not_modified(headers)
+        response.headers.update(headers)
+    media = await run_db(db, crud.get_media, media_id=media_id)
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
     return media
 
+# Ảnh gần giống một media trong cùng album, gần nhất trước (media chưa có dHash -> danh sách rỗng)
+@router.get("/{media_id}/similar", response_model=List[schemas.SimilarMedia])
+def get_similar_media(
+    media_id: int,
+    max_distance: int = Query(10, ge=0, le=64),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    media = crud.get_media(db=db, media_id=media_id)
+    if not media:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return [
+        {"distance": distance, "media": similar}
+        for distance, similar in crud.find_similar_media(db=db, media=media, max_distance=max_distance)
+    ]
+
+# Render ảnh theo kích thước yêu cầu, vd. /media/1/render?w=800&fmt=webp
+# Lần đầu render rồi lưu vào cache disk (LRU); w/h được làm tròn lên theo RENDER_SIZES
+@router.get("/{media_id}/render")
+async def render_media(
+    media_id: int,
+    w: Optional[int] = Query(None, ge=1),
+    h: Optional[int] = Query(None, ge=1),
+    fmt: str = Query("webp", pattern="^(webp|jpeg|png)$"),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    if w is None and h is None:
+        raise HTTPException(status_code=400, detail="w or h is required")
+    media = await run_in_threadpool(crud.get_media, db=db, media_id=media_id)
+    if not media:
+        raise HTTPException(status_code=404, detail="Media not found")
+    if media.media_type != "image":
+        raise HTTPException(status_code=400, detail="Only images can be rendered")
+
+    variant = Variant(storage_key(media.file_url), snap_size(w), snap_size(h), fmt)
+    try:
+        path = await get_or_render(variant)
+    except FileNotFoundError:
+        raise HTTPException(status_code=404, detail="Media file not found")
+    except UnrenderableImage:
+        raise HTTPException(status_code=415, detail="Media file is not an image format that can be rendered")
+
+    # File gốc không bao giờ đổi nên variant cũng bất biến
+    return FileResponse(
+        path,
+        media_type=variant.media_type,
+        headers={"Cache-Control": "private, max-age=31536000, immutable"},
+    )
+
+# URL tải trực tiếp có thời hạn (S3: presigned URL của bucket, local: URL ký HMAC)
+@router.get("/{media_id}/download-url", response_model=schemas.DownloadURL)
+async def get_download_url(media_id: int, db=Depends(get_session), user=Depends(get_current_user)):
+    media = await run_db(db, crud.get_media, media_id=media_id)
+    if not media:
+        raise HTTPException(status_code=404, detail="Media not found")
+    expires_in = config.PRESIGNED_URL_TTL_SECONDS
+    return schemas.DownloadURL(
+        url=backend.presigned_url(storage_key(media.file_url), expires_in),
+        expires_in=expires_in,
+    )
+
 # Xóa media theo id
 @router.delete("/{media_id}")
-def delete_media(media_id: int, db: Session = Depends(get_db), user=Depends(get_current_user)):
-    media = db.query(models.Media).filter(models.Media.id == media_id).first()
+async def delete_media(media_id: int, db=Depends(get_session), user=Depends(get_current_user)):
+    media = await run_db(db, crud.get_media, media_id=media_id)
     if not media:
         raise HTTPException(status_code=404, detail="Media not found")
-    album = crud.get_album(db=db, album_id=media.album_id)
+    album = await run_db(db, crud.get_album, album_id=media.album_id)
     if album.created_by != user["user_id"] and user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Forbidden")
-    result = crud.delete_media(db=db, media_id=media_id)
+    await run_db(db, crud.delete_media, media_id=media_id)
     return {"detail": "Media deleted successfully"}
 
 # Upload file vào album
+# Route async: mọi việc blocking (DB, ghi disk) đều đẩy sang threadpool
+# để event loop vẫn phục vụ request khác trong lúc có nhiều upload cùng lúc.
+# Thumbnail do worker tạo nền (python -m app.worker), client xem processing_status của Media
 @router.post("/upload/{album_id}", response_model=schemas.Media)
 async def upload_media(album_id: int, file: UploadFile = File(...), db: Session = Depends(get_db), user=Depends(get_current_user)):
-    album = crud.get_album(db=db, album_id=album_id)
+    album = await run_in_threadpool(crud.get_album, db=db, album_id=album_id)
     if not album:
         raise HTTPException(status_code=404, detail="Album not found")
     if album.created_by != user["user_id"] and user["role"] != "admin":
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    if not file.content_type.startswith("image/"):
+    if not file.content_type or not file.content_type.startswith("image/"):
         raise HTTPException(status_code=400, detail="Invalid file format")
 
-    # Ghi file xuống thư mục uploads
-    file_url = save_file(file)
+    # Stream file xuống thư mục tạm theo từng chunk (hash + kiểm tra kích thước khi ghi)
+    try:
+        stored = await save_upload(file)
+    except UploadTooLarge:
+        raise HTTPException(status_code=413, detail="File too large")
 
-    # Tạo thumbnail
-    thumb_url = create_thumbnail(file_url)
+    # Tạo bản ghi Media trong DB (ảnh trùng nội dung dùng chung blob), kèm job tạo thumbnail nếu cần
+    return await run_in_threadpool(crud.add_uploaded_media, db=db, stored=stored, album_id=album_id)
 
-    # Tạo bản ghi Media trong DB
-    media_data = schemas.MediaCreate(
-        file_url=file_url,
-        media_type="image"
-    )
-    return crud.add_media(db=db, media=media_data, album_id=album_id)
\ No newline at end of file
+# Upload nhiều file trong một request (vd. photographer đẩy cả trăm ảnh sau sự kiện)
+# - Xác thực + kiểm tra album một lần cho cả batch
+# - Ghi file song song, tối đa BATCH_UPLOAD_CONCURRENCY file cùng lúc
+# - Mọi Media được ghi bằng một câu INSERT, một lần commit
+# - Kết quả theo từng file: file lỗi (sai định dạng, quá lớn...) không làm hỏng cả batch
+@router.post("/upload/{album_id}/batch", response_model=schemas.BatchUploadResult)
+async def upload_media_batch(album_id: int, files: List[UploadFile] = File(...), db: Session = Depends(get_db), user=Depends(get_current_user)):
+    if len(files) > config.MAX_BATCH_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files (max {config.MAX_BATCH_FILES})")
+    album = await run_in_threadpool(crud.get_album, db=db, album_id=album_id)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+    if album.created_by != user["user_id"] and user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    semaphore = asyncio.Semaphore(config.BATCH_UPLOAD_CONCURRENCY)
+
+    async def store(file: UploadFile):
+        if not file.content_type or not file.content_type.startswith("image/"):
+            return "Invalid file format"
+        async with semaphore:
+            try:
+                return await save_upload(file)
+            except UploadTooLarge:
+                return "File too large"
+            except OSError:
+                return "Could not store file"
+
+    results = await asyncio.gather(*(store(file) for file in files))
+    stored_files = [result for result in results if not isinstance(result, str)]
+    try:
+        media_items = await run_in_threadpool(crud.add_uploaded_media_batch, db=db, stored_files=stored_files, album_id=album_id)
+    except BaseException:
+        for stored in stored_files:
+            discard_file(stored)
+        raise
+
+    created = iter(media_items)
+    items = [
+        schemas.BatchUploadItem(filename=file.filename, status="error", error=result)
+        if isinstance(result, str)
+        else schemas.BatchUploadItem(filename=file.filename, status="created", media=next(created))
+        for file, result in zip(files, results)
+    ]
+    return schemas.BatchUploadResult(items=items, created=len(media_items), failed=len(files) - len(media_items))
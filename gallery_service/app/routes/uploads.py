@@ -0,0 +1,178 @@
+from fastapi import APIRouter, Depends, HTTPException, Header, Request
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+from datetime import datetime, timezone
+from uuid import uuid4
+import hashlib
+import os
+from app import crud, schemas, config
+from app.db import get_db
+from app.auth import get_current_user
+from app.utils.storage import (
+    create_part_file,
+    write_part_chunk,
+    finalize_part_file,
+    restore_part_file,
+    remove_part_file,
+)
+
+# Resumable upload cho file lớn:
+# 1. POST   /media/uploads                          -> tạo phiên, nhận upload_id + chunk_size
+# 2. PUT    /media/uploads/{id}/chunks/{index}      -> gửi từng chunk kèm header X-Chunk-SHA256
+# 3. GET    /media/uploads/{id}                     -> hỏi đã nhận tới đâu để gửi tiếp khi rớt mạng
+# 4. POST   /media/uploads/{id}/complete            -> hash file, rename thành blob (không copy) và tạo Media
+router = APIRouter(
+    prefix="/media/uploads",
+    tags=["uploads"],
+)
+
+def _total_chunks(upload) -> int:
+    return -(-upload.total_size // upload.chunk_size)
+
+def _session_status(upload, received_chunks) -> schemas.UploadSession:
+    # Offset resume = số byte liên tục tính từ đầu file
+    contiguous = 0
+    for index in received_chunks:
+        if index != contiguous:
+            break
+        contiguous += 1
+    return schemas.UploadSession(
+        upload_id=upload.id,
+        album_id=upload.album_id,
+        filename=upload.filename,
+        total_size=upload.total_size,
+        chunk_size=upload.chunk_size,
+        total_chunks=_total_chunks(upload),
+        received_chunks=received_chunks,
+        received_bytes=min(contiguous * upload.chunk_size, upload.total_size),
+        expires_at=upload.expires_at,
+    )
+
+def _get_owned_session(db: Session, upload_id: str, user, lock: bool = False, shared: bool = False):
+    upload = crud.get_upload_session(db=db, upload_id=upload_id, lock=lock, shared=shared)
+    if not upload or upload.expires_at < datetime.now(timezone.utc):
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    if upload.created_by != user["user_id"] and user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return upload
+
+def _store_chunk(db: Session, upload_id: str, user, chunk_index: int, data: bytes, checksum: str) -> schemas.UploadSession:
+    """Ghi chunk vào file tạm và ghi nhận trong lúc giữ khóa FOR KEY SHARE trên dòng phiên.
+
+    Các chunk vẫn ghi song song với nhau, còn complete / hủy / dọn phiên hết hạn (FOR UPDATE, DELETE) phải chờ
+    chunk đang ghi xong; chunk tới sau thì thấy phiên đã mất (404), không ghi vào file đang hash hay đã thành blob.
+    """
+    sha256 = hashlib.sha256(data).hexdigest()
+    if sha256 != checksum.lower():
+        raise HTTPException(status_code=400, detail="Chunk checksum mismatch")
+    upload = _get_owned_session(db, upload_id, user, shared=True)
+    db.expunge(upload)  # commit bên dưới không làm hết hạn thuộc tính: phiên có thể bị complete ngay sau đó
+    try:
+        write_part_chunk(upload_id, chunk_index * upload.chunk_size, data)
+        crud.record_upload_chunk(
+            db=db,
+            upload_id=upload_id,
+            chunk_index=chunk_index,
+            size=len(data),
+            sha256=sha256,
+            ttl_seconds=config.UPLOAD_SESSION_TTL_SECONDS,
+        )
+    except FileNotFoundError:
+        db.rollback()
+        raise HTTPException(status_code=404, detail="Upload session not found")
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=409, detail="Upload session was completed or deleted")
+    return _session_status(upload, crud.get_upload_chunk_indices(db=db, upload_id=upload_id))
+
+# Tạo phiên upload
+@router.post("", response_model=schemas.UploadSession)
+def create_upload(payload: schemas.UploadSessionCreate, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    album = crud.get_album(db=db, album_id=payload.album_id)
+    if not album:
+        raise HTTPException(status_code=404, detail="Album not found")
+    if album.created_by != user["user_id"] and user["role"] != "admin":
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if not payload.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Invalid file format")
+    if payload.total_size > config.MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=413, detail="File too large")
+
+    upload_id = str(uuid4())
+    create_part_file(upload_id, payload.total_size)
+    upload = crud.create_upload_session(
+        db=db,
+        upload_id=upload_id,
+        session=payload,
+        created_by=user["user_id"],
+        chunk_size=config.UPLOAD_SESSION_CHUNK_SIZE,
+        ttl_seconds=config.UPLOAD_SESSION_TTL_SECONDS,
+    )
+    return _session_status(upload, [])
+
+# Trạng thái phiên upload (dùng để resume)
+@router.get("/{upload_id}", response_model=schemas.UploadSession)
+def get_upload(upload_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    upload = _get_owned_session(db, upload_id, user)
+    return _session_status(upload, crud.get_upload_chunk_indices(db=db, upload_id=upload_id))
+
+# Nhận một chunk: body là bytes thô của chunk
+@router.put("/{upload_id}/chunks/{chunk_index}", response_model=schemas.UploadSession)
+async def upload_chunk(
+    upload_id: str,
+    chunk_index: int,
+    request: Request,
+    x_chunk_sha256: str = Header(...),
+    db: Session = Depends(get_db),
+    user=Depends(get_current_user)
+):
+    upload = await run_in_threadpool(_get_owned_session, db, upload_id, user)
+    if chunk_index < 0 or chunk_index >= _total_chunks(upload):
+        raise HTTPException(status_code=400, detail="Invalid chunk index")
+
+    expected_size = min(upload.chunk_size, upload.total_size - chunk_index * upload.chunk_size)
+
+    # Đọc body nhưng không bao giờ giữ quá một chunk trong bộ nhớ
+    data = bytearray()
+    async for part in request.stream():
+        data += part
+        if len(data) > expected_size:
+            raise HTTPException(status_code=400, detail="Chunk size mismatch")
+    if len(data) != expected_size:
+        raise HTTPException(status_code=400, detail="Chunk size mismatch")
+
+    return await run_in_threadpool(_store_chunk, db, upload_id, user, chunk_index, bytes(data), x_chunk_sha256)
+
+# Hoàn tất: ghép file và đưa vào luồng add_media như upload thường
+@router.post("/{upload_id}/complete", response_model=schemas.Media)
+def complete_upload(upload_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    # Khóa dòng phiên để hai request complete đồng thời không ghép file hai lần
+    upload = _get_owned_session(db, upload_id, user, lock=True)
+    received = crud.get_upload_chunk_indices(db=db, upload_id=upload_id)
+    if len(received) != _total_chunks(upload):
+        raise HTTPException(status_code=409, detail="Upload incomplete")
+
+    try:
+        stored = finalize_part_file(upload_id, upload.filename)
+    except FileNotFoundError:
+        raise HTTPException(status_code=409, detail="Upload data missing")
+
+    # Xóa phiên trong cùng transaction với việc tạo Media (add_uploaded_media sẽ commit)
+    try:
+        db.delete(upload)
+        return crud.add_uploaded_media(db=db, stored=stored, album_id=upload.album_id)
+    except Exception:
+        db.rollback()
+        if os.path.exists(stored.file_path):
+            restore_part_file(upload_id, stored)
+        raise
+
+# Hủy phiên upload
+@router.delete("/{upload_id}")
+def abort_upload(upload_id: str, db: Session = Depends(get_db), user=Depends(get_current_user)):
+    # Khóa dòng phiên: chờ chunk đang ghi xong rồi mới xóa file tạm
+    _get_owned_session(db, upload_id, user, lock=True)
+    crud.delete_upload_session(db=db, upload_id=upload_id)
+    remove_part_file(upload_id)
+    return {"detail": "Upload session deleted successfully"}
@@ -14,9 +14,57 @@ class Media(MediaBase):
     id: int
     album_id: int
     uploaded_at: datetime.datetime
+    content_hash: Optional[str] = None
+    thumbnail_url: Optional[str] = None
+    processing_status: str = "ready"  # pending / ready / failed
+    width: Optional[int] = None
+    height: Optional[int] = None
+    byte_size: Optional[int] = None
+    captured_at: Optional[datetime.datetime] = None
+    orientation: Optional[str] = None  # landscape / portrait / square
 
     model_config = ConfigDict(from_attributes=True)
 
+class SimilarMedia(BaseModel):
+    distance: int  # khoảng cách Hamming giữa hai dHash (0-64), càng nhỏ càng giống
+    media: Media
+
+class DuplicateGroups(BaseModel):
+    groups: List[List[int]]  # mỗi nhóm: id các media gần giống nhau, media upload sớm nhất đứng đầu
+
+class BatchUploadItem(BaseModel):
+    filename: Optional[str] = None
+    status: str  # created / error
+    media: Optional[Media] = None
+    error: Optional[str] = None
+
+class BatchUploadResult(BaseModel):
+    items: List[BatchUploadItem]  # cùng thứ tự với file gửi lên
+    created: int
+    failed: int
+
+class DownloadURL(BaseModel):
+    url: str
+    expires_in: int
+
+# ------------------ UPLOAD SESSION ------------------
+class UploadSessionCreate(BaseModel):
+    album_id: int
+    filename: str = Field(..., max_length=255)
+    content_type: str = Field(..., max_length=100)
+    total_size: int = Field(..., gt=0)
+
+class UploadSession(BaseModel):
+    upload_id: str
+    album_id: int
+    filename: str
+    total_size: int
+    chunk_size: int
+    total_chunks: int
+    received_chunks: List[int]
+    received_bytes: int  # số byte liên tục đã nhận từ đầu file (offset để resume)
+    expires_at: datetime.datetime
+
 # ------------------ ALBUM ------------------
 class AlbumBase(BaseModel):
     name: str
@@ -27,10 +75,20 @@ class AlbumCreate(AlbumBase):
     # không cho client gửi created_by, backend sẽ tự gán
     pass
 
+# Tóm tắt album (đọc từ cột cộng dồn, không tải media)
 class Album(AlbumBase):
     id: int
     created_by: int
     created_at: datetime.datetime
-    media_items: List[Media] = Field(default_factory=list)
+    media_count: int = 0
+    total_bytes: int = 0
+    last_upload_at: Optional[datetime.datetime] = None
+    cover_media_id: Optional[int] = None
+    cover_url: Optional[str] = None
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+# Album kèm một trang media (chỉ khi client yêu cầu include_media)
+class AlbumWithMedia(Album):
+    media_items: List[Media] = Field(default_factory=list)
+    next_cursor: Optional[str] = None  # cursor cho GET /media/album/{id}?cursor=...; null khi hết
@@ -0,0 +1,64 @@
+from dataclasses import dataclass
+from typing import Any, Callable, Dict
+from sqlalchemy.orm import Session
+import app.config as config
+import app.models as models
+from app import crud
+from app.db import SessionLocal
+from app.jobs import JOB_DELETE_FILE, JOB_THUMBNAIL
+from app.utils.render import Variant, render_to_cache, snap_size
+from app.utils.storage import storage_key
+from app.utils.phash import dhash_file
+
+# Các tác vụ nền do worker chạy.
+# - run(payload): chạy trong process pool, KHÔNG đụng DB, trả về dict kết quả (phải pickle được)
+# - on_success / on_failure: chạy trong process chính của worker để ghi kết quả vào DB
+
+@dataclass(frozen=True)
+class Task:
+    run: Callable[[Dict[str, Any]], Dict[str, Any]]
+    on_success: Callable[[Session, Dict[str, Any], Dict[str, Any]], None]
+    on_failure: Callable[[Session, Dict[str, Any]], None]
+    inline: bool = False  # việc I/O nhẹ cần DB: run() chạy ngay trong process chính, được mở session riêng
+
+# ------------------ THUMBNAIL ------------------
+# Job theo blob (content_hash): mọi Media cùng nội dung dùng chung một lần render
+def create_thumbnail(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Render sẵn variant thumbnail vào render cache, kèm perceptual hash (dHash) của ảnh"""
+    size = snap_size(config.THUMBNAIL_SIZE)
+    key = storage_key(payload["file_url"])
+    render_to_cache(Variant(key, size, size, "webp"))
+    return {"dhash": dhash_file(key)}
+
+def thumbnail_done(db: Session, payload: Dict[str, Any], result: Dict[str, Any]) -> None:
+    if "dhash" in result:
+        crud.set_dhash(db, payload["content_hash"], result["dhash"])
+    crud.mark_thumbnails_ready(db, models.Media.content_hash == payload["content_hash"])
+
+def thumbnail_failed(db: Session, payload: Dict[str, Any]) -> None:
+    db.query(models.Media).filter(models.Media.content_hash == payload["content_hash"]).update(
+        {"processing_status": "failed"},
+        synchronize_session=False,
+    )
+    crud.touch_albums(db, models.Media.content_hash == payload["content_hash"])
+
+# ------------------ DELETE FILE ------------------
+# File hết tham chiếu (blob về 0, media cũ bị xóa): xóa khỏi storage, trừ khi đã có upload tạo lại nó
+def delete_file(payload: Dict[str, Any]) -> Dict[str, Any]:
+    db = SessionLocal()
+    try:
+        return {"deleted": crud.delete_unreferenced_file(db, payload["key"])}
+    finally:
+        db.close()
+
+def delete_file_done(db: Session, payload: Dict[str, Any], result: Dict[str, Any]) -> None:
+    pass
+
+def delete_file_failed(db: Session, payload: Dict[str, Any]) -> None:
+    # Hết lượt retry: file nằm lại storage, GC (python -m app.gc) sẽ dọn ở lần chạy sau
+    pass
+
+TASKS: Dict[str, Task] = {
+    JOB_THUMBNAIL: Task(run=create_thumbnail, on_success=thumbnail_done, on_failure=thumbnail_failed),
+    JOB_DELETE_FILE: Task(run=delete_file, on_success=delete_file_done, on_failure=delete_file_failed, inline=True),
+}
@@ -0,0 +1,178 @@
+import asyncio
+import bisect
+import datetime
+import hashlib
+import struct
+import zlib
+from dataclasses import dataclass
+from typing import Iterator, List, Optional, Tuple, Union
+from starlette.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+from app import config
+from app.utils import storage
+
+# Ghép file ZIP của cả album ngay khi stream, không tạo file tạm, bộ nhớ không đổi.
+# - File lưu kiểu STORED (không nén): JPEG/video vốn đã nén, nén thêm chỉ tốn CPU
+# - CRC32 + kích thước của mọi file đã biết trước (lưu ở bảng blobs) -> biết trước toàn bộ layout
+#   và tổng dung lượng, nên trả được Content-Length và phục vụ Range (tải tiếp khi đứt mạng)
+# - ZIP64 tự bật khi file/offset vượt 4 GiB hoặc quá 65535 file
+# - archive_slots: giới hạn số archive đang stream trong mỗi worker
+
+ZIP64_LIMIT = 0xFFFFFFFF
+ZIP64_COUNT_LIMIT = 0xFFFF
+_UTF8_FLAG = 0x0800
+
+archive_slots = asyncio.Semaphore(config.ARCHIVE_MAX_CONCURRENT)
+
+class SlotResponse(StreamingResponse):
+    """StreamingResponse trả slot khi response kết thúc theo mọi cách: stream xong, lỗi, client ngắt trước khi
+    generator kịp chạy hoặc gửi header thất bại (finally trong generator không chạy ở hai trường hợp sau)"""
+
+    def __init__(self, *args, slots: asyncio.Semaphore, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.slots = slots
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slots.release()
+
+class RangeNotSatisfiable(Exception):
+    """Range nằm ngoài kích thước archive"""
+
+@dataclass(frozen=True)
+class ArchiveEntry:
+    name: str              # đường dẫn trong ZIP
+    key: str               # key trong storage backend
+    size: int
+    crc32: int
+    modified_at: datetime.datetime
+
+def compute_crc32(key: str) -> int:
+    """CRC32 của file trong storage (đọc stream một lượt), cho blob cũ chưa có crc32"""
+    crc = 0
+    for chunk in storage.backend.iter_bytes(key):
+        crc = zlib.crc32(chunk, crc)
+    return crc
+
+def _dos_datetime(value: datetime.datetime) -> Tuple[int, int]:
+    if value.year < 1980:
+        return 0, (1 << 5) | 1  # 1980-01-01 00:00
+    dos_time = (value.hour << 11) | (value.minute << 5) | (value.second // 2)
+    dos_date = ((value.year - 1980) << 9) | (value.month << 5) | value.day
+    return dos_time, dos_date
+
+def _local_header(entry: ArchiveEntry, name: bytes) -> bytes:
+    dos_time, dos_date = _dos_datetime(entry.modified_at)
+    zip64 = entry.size >= ZIP64_LIMIT
+    extra = struct.pack("<HHQQ", 0x0001, 16, entry.size, entry.size) if zip64 else b""
+    size_field = 0xFFFFFFFF if zip64 else entry.size
+    return struct.pack(
+        "<IHHHHHIIIHH",
+        0x04034B50, 45 if zip64 else 20, _UTF8_FLAG, 0, dos_time, dos_date,
+        entry.crc32, size_field, size_field, len(name), len(extra),
+    ) + name + extra
+
+def _central_header(entry: ArchiveEntry, name: bytes, offset: int) -> bytes:
+    dos_time, dos_date = _dos_datetime(entry.modified_at)
+    # Trường nào tràn 32-bit thì ghi 0xFFFFFFFF và đưa giá trị thật vào extra ZIP64 (đúng thứ tự)
+    zip64_values = []
+    size_field = entry.size
+    if entry.size >= ZIP64_LIMIT:
+        size_field = 0xFFFFFFFF
+        zip64_values += [entry.size, entry.size]
+    offset_field = offset
+    if offset >= ZIP64_LIMIT:
+        offset_field = 0xFFFFFFFF
+        zip64_values.append(offset)
+    extra = b""
+    if zip64_values:
+        extra = struct.pack(f"<HH{len(zip64_values)}Q", 0x0001, 8 * len(zip64_values), *zip64_values)
+    version = 45 if zip64_values else 20
+    return struct.pack(
+        "<IHHHHHHIIIHHHHHII",
+        0x02014B50, version, version, _UTF8_FLAG, 0, dos_time, dos_date,
+        entry.crc32, size_field, size_field, len(name), len(extra), 0, 0, 0, 0, offset_field,
+    ) + name + extra
+
+def _end_records(count: int, cd_offset: int, cd_size: int) -> bytes:
+    records = b""
+    zip64 = count >= ZIP64_COUNT_LIMIT or cd_offset >= ZIP64_LIMIT or cd_size >= ZIP64_LIMIT
+    if zip64:
+        zip64_eocd_offset = cd_offset + cd_size
+        records += struct.pack("<IQHHIIQQQQ", 0x06064B50, 44, 45, 45, 0, 0, count, count, cd_size, cd_offset)
+        records += struct.pack("<IIQI", 0x07064B50, 0, zip64_eocd_offset, 1)
+    records += struct.pack(
+        "<IHHHHIIH",
+        0x06054B50, 0, 0,
+        min(count, 0xFFFF), min(count, 0xFFFF),
+        min(cd_size, 0xFFFFFFFF), min(cd_offset, 0xFFFFFFFF), 0,
+    )
+    return records
+
+class ZipArchive:
+    """Layout ZIP tính sẵn: danh sách đoạn (offset, độ dài, bytes header hoặc key file)"""
+
+    def __init__(self, entries: List[ArchiveEntry]):
+        self._offsets: List[int] = []
+        self._segments: List[Tuple[int, Union[bytes, str]]] = []
+        central = []
+        offset = 0
+        for entry in entries:
+            name = entry.name.encode("utf-8")
+            header = _local_header(entry, name)
+            central.append(_central_header(entry, name, offset))
+            offset = self._add(offset, len(header), header)
+            offset = self._add(offset, entry.size, entry.key)
+        cd = b"".join(central)
+        cd_offset = offset
+        offset = self._add(offset, len(cd), cd)
+        tail = _end_records(len(entries), cd_offset, len(cd))
+        self.size = self._add(offset, len(tail), tail)
+        # ETag đổi khi album đổi (thêm/xóa/đổi nội dung file) -> If-Range biết bản tải dở còn dùng được không
+        digest = hashlib.sha256()
+        for entry in entries:
+            digest.update(f"{entry.name}:{entry.size}:{entry.crc32}\n".encode("utf-8"))
+        self.etag = f'"{digest.hexdigest()[:32]}"'
+
+    def _add(self, offset: int, length: int, data: Union[bytes, str]) -> int:
+        if length:
+            self._offsets.append(offset)
+            self._segments.append((length, data))
+        return offset + length
+
+    def iter_range(self, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Stream byte [start, end] (end tính cả) của archive"""
+        end = self.size - 1 if end is None else end
+        index = max(bisect.bisect_right(self._offsets, start) - 1, 0)
+        while index < len(self._segments) and self._offsets[index] <= end:
+            seg_offset = self._offsets[index]
+            length, data = self._segments[index]
+            seg_start = max(start - seg_offset, 0)
+            seg_end = min(end - seg_offset, length - 1)
+            if isinstance(data, bytes):
+                yield data[seg_start:seg_end + 1]
+            else:
+                yield from storage.backend.iter_bytes(data, seg_start, seg_end, chunk_size=config.UPLOAD_CHUNK_SIZE)
+            index += 1
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Một khoảng "bytes=a-b" / "bytes=a-" / "bytes=-n" -> (start, end); nhiều khoảng thì bỏ qua (trả cả file)"""
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first == "":
+            suffix = int(last)
+            if suffix <= 0:
+                raise RangeNotSatisfiable()
+            return max(size - suffix, 0), size - 1
+        start = int(first)
+        end = int(last) if last else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        raise RangeNotSatisfiable()
+    return start, min(end, size - 1)
@@ -0,0 +1,42 @@
+import asyncio
+import logging
+import time
+from starlette.concurrency import run_in_threadpool
+from app import crud, config
+from app.db import SessionLocal
+from app.utils.storage import list_part_files, remove_part_file
+
+logger = logging.getLogger(__name__)
+
+# Dọn các phiên resumable upload bị bỏ dở:
+# - phiên quá expires_at -> xóa dòng trong DB và file tạm
+# - file tạm không còn phiên nào (vd. album bị xóa, cascade mất dòng) và đã cũ hơn TTL -> xóa
+
+def cleanup_upload_sessions() -> int:
+    db = SessionLocal()
+    try:
+        expired_ids = crud.delete_expired_upload_sessions(db=db)
+        active_ids = set(crud.get_active_upload_ids(db=db))
+    finally:
+        db.close()
+
+    for upload_id in expired_ids:
+        remove_part_file(upload_id)
+
+    removed = len(expired_ids)
+    cutoff = time.time() - config.UPLOAD_SESSION_TTL_SECONDS
+    for upload_id, mtime in list_part_files().items():
+        if upload_id not in active_ids and mtime < cutoff:
+            remove_part_file(upload_id)
+            removed += 1
+    return removed
+
+async def upload_cleanup_loop():
+    while True:
+        try:
+            removed = await run_in_threadpool(cleanup_upload_sessions)
+            if removed:
+                logger.info("Removed %d abandoned upload sessions", removed)
+        except Exception:
+            logger.exception("Upload session cleanup failed")
+        await asyncio.sleep(config.UPLOAD_SESSION_CLEANUP_INTERVAL)
@@ -0,0 +1,209 @@
+import asyncio
+import json
+import logging
+from typing import AsyncIterator, Callable, Dict, List, Optional, Set, Tuple
+import psycopg2
+import psycopg2.extensions
+from starlette.concurrency import run_in_threadpool
+from app import config
+
+# Feed media mới theo album (Server-Sent Events) cho màn hình slideshow
+# - Transaction thêm media gửi NOTIFY media_added {album_id, ids} (chỉ tới nơi khi commit)
+# - Mỗi worker có đúng một FeedHub: một connection LISTEN + một query tải media cho mỗi thông báo,
+#   rồi chia cho mọi client đang xem album đó (50 màn hình không phải 50 vòng polling DB)
+# - Event id = "<feed_seq>.<media id>": client kết nối lại gửi Last-Event-ID, server trả bù media đứng sau vị trí đó
+#   theo (feed_seq, id) rồi mới nối vào live. feed_seq tăng theo thứ tự commit (id thì không: upload id nhỏ hơn
+#   có thể commit sau), nên media commit trong lúc client mất kết nối không bị bỏ sót
+# - Client đọc chậm (hàng đợi đầy) hoặc mất kết nối LISTEN: đóng stream, client tự kết nối lại và bù bằng Last-Event-ID
+
+logger = logging.getLogger("app.live_feed")
+
+CHANNEL = "media_added"
+NOTIFY_IDS_PER_MESSAGE = 500  # payload NOTIFY tối đa ~8000 byte
+
+Position = Tuple[int, int]  # (feed_seq, media id)
+Event = Tuple[int, str]  # (media id, event SSE đã format)
+# load(album_id, after, ids) -> [(position, JSON)]: media có id trong ids, hoặc đứng sau after (theo (feed_seq, id) tăng dần)
+Loader = Callable[[int, Optional[Position], Optional[List[int]]], List[Tuple[Position, str]]]
+
+def notify_payloads(album_id: int, media_ids: List[int]) -> List[str]:
+    return [
+        json.dumps({"album_id": album_id, "ids": media_ids[i:i + NOTIFY_IDS_PER_MESSAGE]})
+        for i in range(0, len(media_ids), NOTIFY_IDS_PER_MESSAGE)
+    ]
+
+def format_event(position: Position, data: str) -> str:
+    return f"id: {position[0]}.{position[1]}\nevent: media\ndata: {data}\n\n"
+
+def parse_event_id(value: str) -> Tuple[Optional[int], int]:
+    """Last-Event-ID -> (feed_seq, media id); id kiểu cũ (chỉ media id) -> (None, media id). Sai định dạng: ValueError"""
+    feed_seq, dot, media_id = value.partition(".")
+    if not dot:
+        return None, int(value)
+    return int(feed_seq), int(media_id)
+
+class Subscription:
+    """Hàng đợi event của một client; closed: stream phải kết thúc (client sẽ kết nối lại)"""
+
+    def __init__(self, album_id: int, maxsize: int):
+        self.album_id = album_id
+        self.closed = False
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize)
+
+    def push(self, events: List[Event]) -> bool:
+        try:
+            self._queue.put_nowait(events)
+            return True
+        except asyncio.QueueFull:
+            self.close()
+            return False
+
+    def close(self) -> None:
+        if not self.closed:
+            self.closed = True
+            # Đánh thức get() đang chờ; hàng đợi đầy thì bỏ một phần tử cũ để chèn None
+            if self._queue.full():
+                self._queue.get_nowait()
+            self._queue.put_nowait(None)
+
+    async def get(self, timeout: float) -> Optional[List[Event]]:
+        """Lô event tiếp theo; [] khi hết timeout (để gửi keepalive); None khi stream đã bị đóng"""
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None if self.closed else []
+
+class FeedHub:
+    """Fan-out thông báo media_added tới các Subscription trong process"""
+
+    def __init__(self, dsn: str, load: Loader, queue_size: int = 100):
+        self.dsn = dsn
+        self.load = load
+        self.queue_size = queue_size
+        self._subscribers: Dict[int, Set[Subscription]] = {}
+        self._listener: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def subscribe(self, album_id: int) -> Subscription:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Hub chỉ sống trong một event loop (mỗi worker một loop)
+            self._subscribers.clear()
+            self._listener = None
+            self._loop = loop
+        subscription = Subscription(album_id, self.queue_size)
+        self._subscribers.setdefault(album_id, set()).add(subscription)
+        if self._listener is None or self._listener.done():
+            self._listener = loop.create_task(self._listen())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        subscribers = self._subscribers.get(subscription.album_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._subscribers[subscription.album_id]
+        if not self._subscribers and self._listener is not None:
+            # Không còn ai xem thì trả connection LISTEN
+            self._listener.cancel()
+            self._listener = None
+
+    def subscriber_count(self) -> int:
+        return sum(len(s) for s in self._subscribers.values())
+
+    def _connect(self):
+        conn = psycopg2.connect(self.dsn)
+        conn.set_isolation_level(psycopg2.extensions.ISOLATION_LEVEL_AUTOCOMMIT)
+        with conn.cursor() as cur:
+            cur.execute(f"LISTEN {CHANNEL}")
+        return conn
+
+    async def _listen(self) -> None:
+        loop = asyncio.get_running_loop()
+        inbox: asyncio.Queue = asyncio.Queue()
+
+        def on_readable() -> None:
+            try:
+                conn.poll()
+            except psycopg2.Error as exc:
+                loop.remove_reader(conn.fileno())
+                inbox.put_nowait(exc)
+                return
+            while conn.notifies:
+                inbox.put_nowait(conn.notifies.pop(0).payload)
+
+        conn = None
+        try:
+            conn = await run_in_threadpool(self._connect)
+            loop.add_reader(conn.fileno(), on_readable)
+            while True:
+                message = await inbox.get()
+                if isinstance(message, Exception):
+                    raise message
+                await self._dispatch(message)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            # Mất LISTEN -> có thể đã lỡ thông báo: đóng mọi stream, client kết nối lại sẽ bù bằng Last-Event-ID
+            logger.exception("Live feed listener stopped")
+            self._close_all()
+        finally:
+            if conn is not None:
+                if not conn.closed:
+                    loop.remove_reader(conn.fileno())
+                conn.close()
+
+    async def _dispatch(self, payload: str) -> None:
+        message = json.loads(payload)
+        album_id = message["album_id"]
+        if not self._subscribers.get(album_id):
+            return
+        rows = await run_in_threadpool(self.load, album_id, None, message["ids"])
+        events = [(position[1], format_event(position, data)) for position, data in rows]
+        if not events:
+            return
+        for subscription in list(self._subscribers.get(album_id, ())):
+            if not subscription.push(events):
+                self.unsubscribe(subscription)
+
+    def _close_all(self) -> None:
+        for subscribers in self._subscribers.values():
+            for subscription in subscribers:
+                subscription.close()
+        self._subscribers.clear()
+        self._listener = None
+
+    def close(self) -> None:
+        """Đóng mọi stream và connection LISTEN (lúc worker tắt)"""
+        listener = self._listener
+        self._close_all()
+        if listener is not None:
+            listener.cancel()
+
+    async def stream(self, album_id: int, after: Optional[Position], keepalive: float) -> AsyncIterator[str]:
+        """Các dòng SSE: bù media đứng sau vị trí after (nếu có), rồi media mới theo thời gian thực"""
+        subscription = self.subscribe(album_id)  # đăng ký trước khi đọc bù để không lọt media ở giữa
+        try:
+            yield f"retry: {config.FEED_RETRY_MS}\n\n"
+            replayed: Set[int] = set()
+            if after is not None:
+                while True:
+                    rows = await run_in_threadpool(self.load, album_id, after, None)
+                    if not rows:
+                        break
+                    for position, data in rows:
+                        replayed.add(position[1])
+                        yield format_event(position, data)
+                    after = rows[-1][0]
+            while True:
+                events = await subscription.get(keepalive)
+                if events is None:
+                    return
+                if not events:
+                    yield ": keepalive\n\n"
+                    continue
+                for media_id, text in events:
+                    if media_id not in replayed:
+                        yield text
+        finally:
+            self.unsubscribe(subscription)
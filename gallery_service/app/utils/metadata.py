@@ -0,0 +1,80 @@
+import datetime
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Dict, Optional
+from PIL import Image, UnidentifiedImageError
+from app.utils import storage
+
+# Metadata ảnh đọc một lần lúc ingest rồi lưu vào cột của Media (không phải mở lại file về sau)
+# Chỉ đọc header + EXIF, không giải mã pixel nên rẻ, chạy được ngay trong request upload.
+
+_EXIF_IFD = 0x8769
+_TAG_ORIENTATION = 0x0112
+_TAG_DATETIME = 0x0132
+_TAG_DATETIME_ORIGINAL = 0x9003
+_TAG_OFFSET_TIME_ORIGINAL = 0x9011
+_ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+@dataclass(frozen=True)
+class ImageMetadata:
+    width: Optional[int] = None        # kích thước khi hiển thị (đã tính xoay EXIF)
+    height: Optional[int] = None
+    captured_at: Optional[datetime.datetime] = None
+    orientation: Optional[str] = None  # landscape / portrait / square
+
+def orientation_of(width: int, height: int) -> str:
+    if width > height:
+        return "landscape"
+    if width < height:
+        return "portrait"
+    return "square"
+
+def _parse_exif_datetime(value: Any, offset: Any) -> Optional[datetime.datetime]:
+    """EXIF ghi "YYYY:MM:DD HH:MM:SS" theo giờ máy ảnh; không có OffsetTime thì coi là UTC"""
+    if not isinstance(value, str):
+        return None
+    try:
+        parsed = datetime.datetime.strptime(value.strip().rstrip("\x00"), "%Y:%m:%d %H:%M:%S")
+    except ValueError:
+        return None
+    tz = datetime.timezone.utc
+    if isinstance(offset, str):
+        try:
+            tz = datetime.datetime.strptime(offset.strip().rstrip("\x00"), "%z").tzinfo
+        except ValueError:
+            pass
+    return parsed.replace(tzinfo=tz)
+
+def read_image_metadata(source: BinaryIO) -> ImageMetadata:
+    """Đọc metadata từ file ảnh đang mở; file không phải ảnh thì trả về metadata rỗng"""
+    try:
+        with Image.open(source) as img:
+            width, height = img.size
+            exif = img.getexif()
+    except (UnidentifiedImageError, OSError):
+        return ImageMetadata()
+    if exif.get(_TAG_ORIENTATION) in _ROTATED_ORIENTATIONS:
+        width, height = height, width
+    exif_ifd = exif.get_ifd(_EXIF_IFD)
+    captured_at = _parse_exif_datetime(
+        exif_ifd.get(_TAG_DATETIME_ORIGINAL), exif_ifd.get(_TAG_OFFSET_TIME_ORIGINAL)
+    ) or _parse_exif_datetime(exif.get(_TAG_DATETIME), None)
+    return ImageMetadata(width=width, height=height, captured_at=captured_at, orientation=orientation_of(width, height))
+
+def read_file_metadata(file_path: str) -> ImageMetadata:
+    with open(file_path, "rb") as f:
+        return read_image_metadata(f)
+
+def read_stored_metadata(key: str) -> ImageMetadata:
+    """Metadata của file đã nằm trong storage backend (dùng cho backfill)"""
+    with storage.backend.open(key) as f:
+        return read_image_metadata(f)
+
+def media_columns(meta: ImageMetadata, byte_size: Optional[int]) -> Dict[str, Any]:
+    """Giá trị các cột metadata của Media"""
+    return {
+        "width": meta.width,
+        "height": meta.height,
+        "captured_at": meta.captured_at,
+        "orientation": meta.orientation,
+        "byte_size": byte_size,
+    }
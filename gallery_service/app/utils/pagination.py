@@ -0,0 +1,60 @@
+import base64
+import datetime
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple, Union
+
+# Keyset pagination: cursor mã hóa (giá trị cột sort, id) của phần tử cuối trang trước,
+# trang sau lấy các dòng có (giá trị, id) lớn hơn -> chi phí như nhau dù cuộn sâu tới đâu.
+# Cursor là chuỗi opaque với client (base64), gắn với cột sort đã tạo ra nó.
+
+class InvalidCursor(ValueError):
+    """Cursor không giải mã được"""
+
+CursorValue = Union[datetime.datetime, int, None]
+
+def encode_cursor(sort: str, value: CursorValue, item_id: int) -> str:
+    if isinstance(value, datetime.datetime):
+        encoded = value.isoformat()
+    else:
+        encoded = "" if value is None else str(value)
+    raw = f"{sort}|{encoded}|{item_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+def decode_cursor(cursor: str, sort: str, value_type: type) -> Tuple[CursorValue, int]:
+    """Giải mã cursor tạo bởi encode_cursor với cùng cột sort; value_type: datetime.datetime hoặc int"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        cursor_sort, value, item_id = raw.split("|")
+        if cursor_sort != sort:
+            raise ValueError("cursor was created for another sort order")
+        if value == "":
+            return None, int(item_id)
+        if value_type is datetime.datetime:
+            return datetime.datetime.fromisoformat(value), int(item_id)
+        return value_type(value), int(item_id)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise InvalidCursor(cursor) from exc
+
+class TTLCounter:
+    """Cache giá trị đếm theo key trong process, hết hạn sau ttl giây (tổng số gần đúng, rẻ)"""
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._values: Dict[int, Tuple[float, int]] = {}
+
+    def get(self, key: int, compute: Callable[[], int]) -> int:
+        now = time.monotonic()
+        with self._lock:
+            cached: Optional[Tuple[float, int]] = self._values.get(key)
+        if cached and cached[0] > now:
+            return cached[1]
+        value = compute()
+        with self._lock:
+            self._values[key] = (now + self.ttl, value)
+        return value
+
+    def invalidate(self, key: int) -> None:
+        with self._lock:
+            self._values.pop(key, None)
@@ -0,0 +1,104 @@
+import threading
+from typing import Callable, Dict, Generic, Hashable, List, Optional, Tuple, TypeVar
+import numpy as np
+from PIL import Image, ImageOps
+from app.utils import storage
+
+# Perceptual hash (dHash 64-bit) để tìm ảnh gần giống nhau (ảnh chụp liên tiếp, bản nén lại qua Zalo/WhatsApp...)
+# - dHash: thu ảnh xám về 9x8, mỗi bit = pixel bên phải sáng hơn pixel bên trái hay không
+# - Hai ảnh càng giống thì khoảng cách Hamming giữa hai hash càng nhỏ (0 = gần như y hệt)
+# - BKTree: tìm mọi hash trong bán kính d mà không phải so với từng ảnh trong album
+# Postgres không có kiểu uint64 nên hash được lưu dạng BIGINT có dấu (to_signed / to_unsigned).
+
+HASH_SIZE = 8
+
+def load_pixels(key: str) -> np.ndarray:
+    """Đọc ảnh trong storage thành mảng xám (8, 9) uint8; JPEG chỉ giải mã ở độ phân giải nhỏ (draft)"""
+    with storage.backend.open(key) as source, Image.open(source) as img:
+        img.draft("L", (HASH_SIZE * 8, HASH_SIZE * 8))
+        img = ImageOps.exif_transpose(img).convert("L")
+        img = img.resize((HASH_SIZE + 1, HASH_SIZE), Image.Resampling.BOX)
+        return np.asarray(img, dtype=np.uint8)
+
+def dhash_array(pixels: np.ndarray) -> np.ndarray:
+    """dHash cho cả lô ảnh cùng lúc: (N, 8, 9) uint8 -> (N,) uint64"""
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    packed = np.packbits(bits.reshape(len(pixels), -1), axis=1)  # (N, 8) byte, bit đầu tiên là bit cao nhất
+    return packed.view(">u8").reshape(-1).astype(np.uint64)
+
+def dhash_file(key: str) -> int:
+    return int(dhash_array(load_pixels(key)[np.newaxis])[0])
+
+def to_signed(value: int) -> int:
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+def to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+def hamming(a: int, b: int) -> int:
+    return ((a ^ b) & 0xFFFFFFFFFFFFFFFF).bit_count()
+
+T = TypeVar("T")
+
+class BKTree(Generic[T]):
+    """BK-tree theo khoảng cách Hamming: chỉ duyệt nhánh con có khoảng cách trong [d - r, d + r]"""
+
+    def __init__(self):
+        # node = (hash, các item có đúng hash đó, con theo khoảng cách)
+        self._root: Optional[Tuple[int, List[T], Dict[int, tuple]]] = None
+        self.size = 0
+
+    def add(self, value: int, item: T) -> None:
+        self.size += 1
+        if self._root is None:
+            self._root = (value, [item], {})
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                node[1].append(item)
+                return
+            child = node[2].get(distance)
+            if child is None:
+                node[2][distance] = (value, [item], {})
+                return
+            node = child
+
+    def search(self, value: int, max_distance: int) -> List[Tuple[int, T]]:
+        """Mọi (khoảng cách, item) có khoảng cách tới value <= max_distance, gần nhất trước"""
+        if self._root is None:
+            return []
+        results = []
+        stack = [self._root]
+        while stack:
+            node_value, items, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= max_distance:
+                results.extend((distance, item) for item in items)
+            for child_distance, child in children.items():
+                if distance - max_distance <= child_distance <= distance + max_distance:
+                    stack.append(child)
+        results.sort(key=lambda r: r[0])
+        return results
+
+class IndexCache:
+    """Cache BK-tree theo key (vd. album_id) trong process; dựng lại khi chữ ký dữ liệu đổi"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[Hashable, Tuple[Hashable, BKTree]] = {}
+
+    def get(self, key: Hashable, signature: Hashable, build: Callable[[], BKTree]) -> BKTree:
+        with self._lock:
+            cached = self._entries.get(key)
+        if cached and cached[0] == signature:
+            return cached[1]
+        tree = build()
+        with self._lock:
+            self._entries.pop(key, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[key] = (signature, tree)
+        return tree
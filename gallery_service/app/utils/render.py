@@ -0,0 +1,222 @@
+import asyncio
+import math
+import os
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+from uuid import uuid4
+from PIL import Image, ImageOps, UnidentifiedImageError
+from starlette.concurrency import run_in_threadpool
+from app import config
+from app.utils import storage
+
+# Render ảnh theo kích thước/định dạng khi được yêu cầu lần đầu, cache kết quả trên disk.
+# - render_variant(): decode nhanh bằng draft() (JPEG giải mã thẳng ở 1/2, 1/4, 1/8) + reducing_gap
+# - DiskLRUCache: cache giới hạn dung lượng, truy cập thì "touch" mtime, đầy thì xóa file cũ nhất
+# - get_or_render(): gộp các request đồng thời cho cùng một variant thành một lần render
+
+FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+
+class UnrenderableImage(Exception):
+    """File gốc không decode được thành ảnh (không phải ảnh, định dạng Pillow không hỗ trợ, hỏng, quá lớn)"""
+
+# Orientation EXIF xoay 90/270 độ -> chiều rộng/cao của ảnh gốc bị đảo
+_ROTATED_ORIENTATIONS = {5, 6, 7, 8}
+
+def snap_size(value: Optional[int]) -> Optional[int]:
+    """Làm tròn lên kích thước cho phép gần nhất, tránh việc mỗi giá trị w/h tạo ra một file cache"""
+    if value is None:
+        return None
+    for allowed in config.RENDER_SIZES:
+        if allowed >= value:
+            return allowed
+    return config.RENDER_SIZES[-1]
+
+def thumbnail_query() -> str:
+    size = snap_size(config.THUMBNAIL_SIZE)
+    return f"w={size}&h={size}&fmt=webp"
+
+def thumbnail_url(media_id: int) -> str:
+    """URL render của thumbnail chuẩn (được job nền render sẵn vào cache)"""
+    return f"/media/{media_id}/render?{thumbnail_query()}"
+
+def variant_url(media_id: int, width: Optional[int], height: Optional[int], fmt: str = "webp") -> str:
+    """URL render chuẩn hóa (w/h đã làm tròn theo RENDER_SIZES) để mọi client dùng chung một file cache"""
+    params = []
+    if width:
+        params.append(f"w={snap_size(width)}")
+    if height:
+        params.append(f"h={snap_size(height)}")
+    return f"/media/{media_id}/render?{'&'.join(params)}&fmt={fmt}"
+
+def fitted_size(width: int, height: int, box_width: int, box_height: int) -> Tuple[int, int]:
+    """Kích thước ảnh sau khi render vào khung (cùng cách làm tròn với Image.thumbnail, không phóng to)"""
+    if box_width >= width and box_height >= height:
+        return width, height
+    aspect = width / height
+
+    def round_aspect(number: float, key: Callable[[int], float]) -> int:
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    if box_width / box_height >= aspect:
+        return round_aspect(box_height * aspect, key=lambda n: abs(aspect - n / box_height)), box_height
+    return box_width, round_aspect(box_width / aspect, key=lambda n: 0 if n == 0 else abs(aspect - box_width / n))
+
+@dataclass(frozen=True)
+class Variant:
+    source_key: str  # key của file gốc trong storage backend
+    width: Optional[int]
+    height: Optional[int]
+    fmt: str
+
+    @property
+    def cache_key(self) -> str:
+        stem = os.path.splitext(self.source_key)[0]
+        return f"{stem}_{self.width or 0}x{self.height or 0}.{self.fmt}"
+
+    @property
+    def media_type(self) -> str:
+        return FORMATS[self.fmt][1]
+
+def render_variant(variant: Variant, dest_path: str) -> None:
+    """Resize ảnh gốc vào khung width x height (giữ tỉ lệ, không phóng to) rồi lưu ra dest_path"""
+    box = (variant.width or config.RENDER_MAX_DIMENSION, variant.height or config.RENDER_MAX_DIMENSION)
+    pil_format = FORMATS[variant.fmt][0]
+
+    with storage.backend.open(variant.source_key) as source:
+        try:
+            with Image.open(source) as img:
+                draft_box = box
+                if img.getexif().get(0x0112) in _ROTATED_ORIENTATIONS:
+                    draft_box = (box[1], box[0])
+                img.draft("RGB", draft_box)
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail(box, resample=Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+                if pil_format == "JPEG" and img.mode != "RGB":
+                    img = img.convert("RGB")
+                elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+                    img = img.convert("RGBA")
+        except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as exc:
+            raise UnrenderableImage(str(exc)) from exc
+    img.save(dest_path, format=pil_format, quality=config.RENDER_QUALITY)
+
+class DiskLRUCache:
+    """Cache file trên disk có giới hạn tổng dung lượng, xóa theo LRU (mtime).
+
+    Dùng được từ nhiều process (các gunicorn worker, job worker): mỗi process giữ ước lượng
+    dung lượng riêng, khi vượt ngưỡng thì quét lại thư mục nên số liệu tự hiệu chỉnh.
+    """
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._approx_bytes: Optional[int] = None
+        os.makedirs(directory, exist_ok=True)
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], key)
+
+    def get(self, key: str) -> Optional[str]:
+        path = self.path_for(key)
+        try:
+            os.utime(path)  # đánh dấu vừa dùng
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key: str, tmp_path: str) -> str:
+        """Đưa file đã render (tmp_path, cùng filesystem) vào cache"""
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        size = os.path.getsize(tmp_path)
+        os.replace(tmp_path, path)
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_total()
+            else:
+                self._approx_bytes += size
+            over_limit = self._approx_bytes > self.max_bytes
+        if over_limit:
+            self.evict()
+        return path
+
+    def remove_prefix(self, stem: str) -> int:
+        """Xóa mọi variant của một file gốc (key bắt đầu bằng stem)"""
+        removed = 0
+        shard = os.path.join(self.directory, stem[:2])
+        if not os.path.isdir(shard):
+            return 0
+        with os.scandir(shard) as entries:
+            for entry in entries:
+                if entry.name.startswith(f"{stem}_"):
+                    try:
+                        os.remove(entry.path)
+                        removed += 1
+                    except FileNotFoundError:
+                        pass
+        return removed
+
+    def _entries(self):
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                yield path, st.st_size, st.st_mtime
+
+    def _scan_total(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def evict(self) -> None:
+        """Xóa file ít dùng nhất cho tới khi còn 90% max_bytes"""
+        with self._lock:
+            entries = sorted(self._entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            target = int(self.max_bytes * 0.9)
+            for path, size, _ in entries:
+                if total <= target:
+                    break
+                try:
+                    os.remove(path)
+                    total -= size
+                except FileNotFoundError:
+                    pass
+            self._approx_bytes = total
+
+render_cache = DiskLRUCache(config.RENDER_CACHE_DIR, config.RENDER_CACHE_MAX_BYTES)
+
+def render_to_cache(variant: Variant) -> str:
+    """Trả về đường dẫn variant trong cache, render nếu chưa có (sync, dùng trong threadpool/worker)"""
+    cached = render_cache.get(variant.cache_key)
+    if cached:
+        return cached
+    tmp_path = os.path.join(render_cache.directory, f".{uuid4()}.tmp")
+    try:
+        render_variant(variant, tmp_path)
+        return render_cache.put(variant.cache_key, tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+_inflight: Dict[str, asyncio.Task] = {}
+
+async def get_or_render(variant: Variant) -> str:
+    """Bản async của render_to_cache: request đồng thời cho cùng variant chỉ render một lần"""
+    key = variant.cache_key
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(run_in_threadpool(render_to_cache, variant))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    # shield: client ngắt kết nối không hủy lần render mà request khác đang chờ
+    return await asyncio.shield(task)
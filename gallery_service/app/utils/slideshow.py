@@ -0,0 +1,108 @@
+import hashlib
+import json
+import threading
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Tuple
+from app import config
+from app.utils.render import fitted_size, snap_size, variant_url
+
+# Manifest slideshow của album: danh sách slide theo thứ tự, mỗi slide có URL render sẵn cho
+# từng cỡ màn hình + kích thước ảnh sau render, kèm gợi ý preload N ảnh kế tiếp.
+# Manifest chỉ phụ thuộc nội dung album -> dựng một lần cho mỗi revision của album (Album.revision
+# tăng mỗi khi thêm/xóa media), cache trong process, ETag = revision nên màn hình revalidate gần như miễn phí.
+
+@dataclass(frozen=True)
+class Screen:
+    name: str
+    width: int
+    height: int
+
+    @property
+    def box(self) -> Tuple[int, int]:
+        """Khung render thật sự (w/h làm tròn lên theo RENDER_SIZES, giống /media/{id}/render)"""
+        return snap_size(self.width), snap_size(self.height)
+
+def parse_screens(spec: str) -> List[Screen]:
+    """"hd=1280x720,fhd=1920x1080" -> [Screen("hd", 1280, 720), ...]"""
+    screens = []
+    for item in spec.split(","):
+        name, _, size = item.strip().partition("=")
+        width, _, height = size.partition("x")
+        screens.append(Screen(name.strip(), int(width), int(height)))
+    return screens
+
+SCREENS = parse_screens(config.SLIDESHOW_SCREENS)
+
+# Đổi cấu hình cỡ màn hình/định dạng thì mọi ETag cũ mất hiệu lực
+_CONFIG_TAG = hashlib.sha256(
+    f"{config.SLIDESHOW_SCREENS}|{config.SLIDESHOW_FORMAT}|{config.RENDER_SIZES}|{config.SLIDESHOW_PRELOAD_COUNT}".encode("utf-8")
+).hexdigest()[:8]
+
+def manifest_etag(album_id: int, revision: int) -> str:
+    return f'"slideshow-{album_id}-{revision}-{_CONFIG_TAG}"'
+
+def slide_entry(media) -> Dict:
+    variants = {}
+    for screen in SCREENS:
+        box_width, box_height = screen.box
+        variant = {"url": variant_url(media.id, screen.width, screen.height, config.SLIDESHOW_FORMAT)}
+        if media.width and media.height:
+            variant["width"], variant["height"] = fitted_size(media.width, media.height, box_width, box_height)
+        variants[screen.name] = variant
+    return {
+        "media_id": media.id,
+        "width": media.width,
+        "height": media.height,
+        "orientation": media.orientation,
+        "captured_at": media.captured_at.isoformat() if media.captured_at else None,
+        "uploaded_at": media.uploaded_at.isoformat() if media.uploaded_at else None,
+        "variants": variants,
+    }
+
+@dataclass(frozen=True)
+class Manifest:
+    body: bytes               # JSON đã serialize, trả thẳng cho mọi request cùng revision
+    links: Dict[str, str]     # header Link rel=preload cho các ảnh đầu tiên, theo tên cỡ màn hình
+
+def build_manifest(album_id: int, revision: int, media_items: list) -> Manifest:
+    slides = [slide_entry(media) for media in media_items]
+    manifest = {
+        "album_id": album_id,
+        "revision": revision,
+        "screens": [{"name": s.name, "width": s.width, "height": s.height} for s in SCREENS],
+        # Client hiển thị slide i thì giữ sẵn ảnh của slide i+1 .. i+count
+        "preload": {"count": config.SLIDESHOW_PRELOAD_COUNT},
+        "slides": slides,
+    }
+    # Trình duyệt tải trước các ảnh đầu tiên ngay khi nhận header, trước cả khi script đọc manifest
+    links = {
+        screen.name: ", ".join(
+            f'<{slide["variants"][screen.name]["url"]}>; rel=preload; as=image'
+            for slide in slides[:config.SLIDESHOW_PRELOAD_COUNT]
+        )
+        for screen in SCREENS
+    }
+    return Manifest(json.dumps(manifest, separators=(",", ":")).encode("utf-8"), links)
+
+class ManifestCache:
+    """Manifest đã dựng theo album, chỉ giữ bản của revision mới nhất; tối đa max_entries album"""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: Dict[int, Tuple[int, Manifest]] = {}
+
+    def get(self, album_id: int, revision: int, build: Callable[[], Manifest]) -> Manifest:
+        with self._lock:
+            cached = self._entries.get(album_id)
+        if cached and cached[0] == revision:
+            return cached[1]
+        manifest = build()
+        with self._lock:
+            self._entries.pop(album_id, None)
+            if len(self._entries) >= self.max_entries:
+                self._entries.pop(next(iter(self._entries)))
+            self._entries[album_id] = (revision, manifest)
+        return manifest
+
+manifest_cache = ManifestCache(config.SLIDESHOW_CACHE_ENTRIES)
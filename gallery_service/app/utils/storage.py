@@ -1,23 +1,192 @@
+import hashlib
 import os
+import zlib
+from dataclasses import dataclass
+from typing import BinaryIO, Optional
 from fastapi import UploadFile
+from starlette.concurrency import run_in_threadpool
 from uuid import uuid4
+from app import config
+from app.utils.storage_backends import create_backend
 
-# Backend lưu trữ media cho Gallery Service
-# - UPLOAD_DIR: thư mục mount từ Docker volume/PVC
-# - save_file(): nhận file upload, lưu xuống disk, trả về đường dẫn để ghi vào DB
+# Lưu trữ media cho Gallery Service (content-addressed)
+# - backend: local (UPLOAD_DIR chia shard) hoặc S3, xem storage_backends.py; mọi đọc/ghi file media đi qua đây
+# - UPLOAD_DIR: thư mục mount từ Docker volume/PVC, luôn chứa file tạm (INCOMING_DIR) dù backend là gì
+# - Mỗi file được đặt tên theo sha256 nội dung: ảnh trùng byte chỉ lưu một bản (bảng blobs đếm tham chiếu)
+# - save_file(): stream upload vào file tạm trong INCOMING_DIR, vừa ghi vừa hash + kiểm tra kích thước
+# - save_upload(): bản async của save_file, đẩy toàn bộ I/O sang threadpool để không chặn event loop
+# - promote_file() / discard_file(): đưa file tạm thành blob chính thức, hoặc bỏ đi nếu blob đã tồn tại
+# - *_part_file(): file tạm của resumable upload, cũng nằm trong INCOMING_DIR (cùng filesystem
+#   với UPLOAD_DIR nên backend local chỉ cần rename, không copy lại dữ liệu)
 
-UPLOAD_DIR = "uploads"
+UPLOAD_DIR = config.UPLOAD_DIR
+MEDIA_URL_PREFIX = "/uploads"
+INCOMING_DIR = os.path.join(UPLOAD_DIR, ".incoming")
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+os.makedirs(INCOMING_DIR, exist_ok=True)
 
-def save_file(file: UploadFile) -> str:
-    # Sinh tên file duy nhất để tránh trùng lặp
-    file_extension = os.path.splitext(file.filename)[1]
-    unique_name = f"{uuid4()}{file_extension}"
-    file_path = os.path.join(UPLOAD_DIR, unique_name)
+backend = create_backend()
 
-    # Ghi file vào thư mục volume/PVC
-    with open(file_path, "wb") as f:
-        f.write(file.file.read())
+class UploadTooLarge(Exception):
+    """File upload vượt quá MAX_UPLOAD_SIZE"""
 
-    # Trả về đường dẫn để Gallery lưu trong DB
-    return f"/{UPLOAD_DIR}/{unique_name}"
\ No newline at end of file
+@dataclass
+class StoredFile:
+    file_path: str   # file tạm trong INCOMING_DIR
+    size: int
+    sha256: str
+    extension: str
+    crc32: int       # cần cho file ZIP (archive album), tính luôn khi ghi để khỏi đọc lại file
+
+    @property
+    def blob_name(self) -> str:
+        return f"{self.sha256}{self.extension}"
+
+def copy_stream(src: BinaryIO, dest_path: str, max_size: int) -> tuple[int, str, int]:
+    """Copy src xuống dest_path theo từng chunk, vừa ghi vừa hash (sha256 + crc32) và kiểm tra kích thước.
+
+    Bộ nhớ dùng tối đa một chunk, bất kể file lớn cỡ nào. Lỗi giữa chừng thì xóa file ghi dở.
+    """
+    hasher = hashlib.sha256()
+    crc = 0
+    size = 0
+    try:
+        with open(dest_path, "wb") as out:
+            while chunk := src.read(config.UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLarge(f"File exceeds {max_size} bytes")
+                hasher.update(chunk)
+                crc = zlib.crc32(chunk, crc)
+                out.write(chunk)
+    except BaseException:
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise
+    return size, hasher.hexdigest(), crc
+
+def storage_key(file_url: str) -> str:
+    """Key trong storage backend của file media từ file_url lưu trong DB"""
+    return file_url.rsplit("/", 1)[-1]
+
+def blob_url(blob_name: str) -> str:
+    return f"{MEDIA_URL_PREFIX}/{blob_name}"
+
+def checksum_file(file_path: str) -> tuple[str, int]:
+    """Tính (sha256, crc32) của file trên disk, đọc theo từng chunk"""
+    hasher = hashlib.sha256()
+    crc = 0
+    with open(file_path, "rb") as f:
+        while chunk := f.read(config.UPLOAD_CHUNK_SIZE):
+            hasher.update(chunk)
+            crc = zlib.crc32(chunk, crc)
+    return hasher.hexdigest(), crc
+
+def file_extension(filename: Optional[str]) -> str:
+    return os.path.splitext(filename or "")[1].lower()
+
+def save_file(file: UploadFile, max_size: Optional[int] = None) -> StoredFile:
+    max_size = max_size or config.MAX_UPLOAD_SIZE
+
+    # Ghi vào file tạm, tên chính thức (sha256) chỉ biết được sau khi đọc hết
+    tmp_path = os.path.join(INCOMING_DIR, f"{uuid4()}.upload")
+    size, sha256, crc32 = copy_stream(file.file, tmp_path, max_size)
+
+    return StoredFile(
+        file_path=tmp_path,
+        size=size,
+        sha256=sha256,
+        extension=file_extension(file.filename),
+        crc32=crc32,
+    )
+
+async def save_upload(file: UploadFile, max_size: Optional[int] = None) -> StoredFile:
+    max_size = max_size or config.MAX_UPLOAD_SIZE
+
+    # Client đã khai báo kích thước (multipart đã parse xong) -> chặn sớm, khỏi copy
+    if file.size is not None and file.size > max_size:
+        raise UploadTooLarge(f"File exceeds {max_size} bytes")
+
+    return await run_in_threadpool(save_file, file, max_size)
+
+def promote_file(stored: StoredFile, blob_name: str) -> None:
+    """Đưa file tạm thành blob chính thức (local: rename, S3: upload multipart)"""
+    backend.put_file(blob_name, stored.file_path)
+
+def discard_file(stored: StoredFile) -> None:
+    """Bỏ file tạm (nội dung đã có sẵn trong một blob khác)"""
+    try:
+        os.remove(stored.file_path)
+    except FileNotFoundError:
+        pass
+
+def delete_blob_file(blob_name: str) -> None:
+    backend.delete(blob_name)
+
+def part_file_path(upload_id: str) -> str:
+    return os.path.join(INCOMING_DIR, f"{upload_id}.part")
+
+def create_part_file(upload_id: str, total_size: int) -> None:
+    """Tạo file tạm đúng kích thước (sparse), các chunk sẽ được ghi thẳng vào đúng offset"""
+    with open(part_file_path(upload_id), "wb") as f:
+        f.truncate(total_size)
+
+def write_part_chunk(upload_id: str, offset: int, data: bytes) -> None:
+    """Ghi một chunk vào file tạm tại offset; an toàn khi nhiều chunk được PUT song song"""
+    fd = os.open(part_file_path(upload_id), os.O_WRONLY)
+    try:
+        os.pwrite(fd, data, offset)
+    finally:
+        os.close(fd)
+
+def finalize_part_file(upload_id: str, filename: Optional[str]) -> StoredFile:
+    """Đưa file tạm đã đủ chunk sang tên riêng (rename, không copy) rồi hash; file giữ ở đó cho tới khi promote.
+    Sau rename không request nào mở được file qua part_file_path nữa nên nội dung đã hash không đổi."""
+    src_path = os.path.join(INCOMING_DIR, f"{uuid4()}.upload")
+    os.rename(part_file_path(upload_id), src_path)
+    sha256, crc32 = checksum_file(src_path)
+    return StoredFile(
+        file_path=src_path,
+        size=os.path.getsize(src_path),
+        sha256=sha256,
+        extension=file_extension(filename),
+        crc32=crc32,
+    )
+
+def restore_part_file(upload_id: str, stored: StoredFile) -> None:
+    """Trả file về chỗ cũ khi complete thất bại, để phiên upload vẫn complete lại được"""
+    os.rename(stored.file_path, part_file_path(upload_id))
+
+def remove_part_file(upload_id: str) -> None:
+    try:
+        os.remove(part_file_path(upload_id))
+    except FileNotFoundError:
+        pass
+
+def list_incoming_files() -> list[tuple[str, float, int]]:
+    """(tên, mtime, kích thước) của mọi file tạm trong INCOMING_DIR (upload dở, part file)"""
+    files = []
+    with os.scandir(INCOMING_DIR) as entries:
+        for entry in entries:
+            if entry.is_file():
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((entry.name, st.st_mtime, st.st_size))
+    return files
+
+def remove_incoming_file(name: str) -> None:
+    try:
+        os.remove(os.path.join(INCOMING_DIR, name))
+    except FileNotFoundError:
+        pass
+
+def list_part_files() -> dict[str, float]:
+    """upload_id -> mtime của mọi file tạm đang nằm trong INCOMING_DIR"""
+    part_files = {}
+    with os.scandir(INCOMING_DIR) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.name.endswith(".part"):
+                part_files[entry.name[:-len(".part")]] = entry.stat().st_mtime
+    return part_files
@@ -0,0 +1,230 @@
+import base64
+import hashlib
+import hmac
+import os
+import re
+import tempfile
+import time
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Iterator, Optional, Tuple
+from app import config
+
+# Backend lưu trữ file media, chọn bằng STORAGE_BACKEND:
+# - "local": thư mục UPLOAD_DIR, chia shard theo 2 cấp prefix của hash (ab/cd/abcd....jpg)
+#   để một thư mục không bao giờ chứa hàng triệu file
+# - "s3": bucket S3-compatible (AWS S3, MinIO...), client tải thẳng qua presigned URL
+# Key của file là tên blob ("<sha256><ext>"); file cũ (uuid, hoặc hash ghi trước khi chia shard)
+# vẫn nằm phẳng trong UPLOAD_DIR và vẫn đọc được.
+
+_KEY_PATTERN = re.compile(r"^[A-Za-z0-9][A-Za-z0-9._-]*$")
+_HASHED_KEY_PATTERN = re.compile(r"^[0-9a-f]{64}")
+_CONTENT_ADDRESSED_PATTERN = re.compile(r"^[0-9a-f]{64}(\.[A-Za-z0-9]+)?$")
+
+def is_valid_key(key: str) -> bool:
+    return bool(_KEY_PATTERN.match(key)) and ".." not in key
+
+def is_content_addressed(key: str) -> bool:
+    """Key dạng "<sha256><ext>": nội dung file không bao giờ đổi"""
+    return bool(_CONTENT_ADDRESSED_PATTERN.match(key))
+
+def shard_path(key: str) -> str:
+    """ab/cd/<key> cho key dạng hash, key cũ (uuid) giữ nguyên"""
+    if _HASHED_KEY_PATTERN.match(key):
+        return os.path.join(key[:2], key[2:4], key)
+    return key
+
+class StorageBackend(ABC):
+    """Giao diện chung cho mọi backend lưu trữ; backend thiếu method nào thì lỗi ngay khi khởi tạo"""
+
+    @abstractmethod
+    def put_file(self, key: str, src_path: str) -> None:
+        """Đưa file tạm trên local disk vào storage (file tạm bị move/xóa)"""
+
+    @abstractmethod
+    def open(self, key: str) -> BinaryIO:
+        """Mở file để đọc (seek được), dùng cho Pillow"""
+
+    @abstractmethod
+    def iter_bytes(self, key: str, start: int = 0, end: Optional[int] = None, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        """Stream nội dung file trong khoảng [start, end] (end tính cả), không đọc hết vào bộ nhớ"""
+
+    @abstractmethod
+    def size(self, key: str) -> Optional[int]:
+        """Kích thước file, None nếu không tồn tại"""
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        """Xóa file (không có thì bỏ qua)"""
+
+    @abstractmethod
+    def iter_keys(self) -> Iterator[Tuple[str, float]]:
+        """Liệt kê (key, thời điểm sửa cuối) của mọi file"""
+
+    def local_path(self, key: str) -> Optional[str]:
+        """Đường dẫn trên local disk nếu có (để sendfile), backend remote trả về None"""
+        return None
+
+    @abstractmethod
+    def presigned_url(self, key: str, expires_in: int) -> str:
+        """URL tải trực tiếp có thời hạn, không cần đi qua gallery worker"""
+
+# ------------------ LOCAL ------------------
+def sign_key(key: str, expires: int) -> str:
+    message = f"{key}:{expires}".encode("utf-8")
+    digest = hmac.new(config.STORAGE_SIGNING_KEY.encode("utf-8"), message, hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+def verify_signature(key: str, expires: int, signature: str) -> bool:
+    if expires < time.time():
+        return False
+    return hmac.compare_digest(sign_key(key, expires), signature)
+
+class LocalStorage(StorageBackend):
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, shard_path(key))
+
+    def _existing_path(self, key: str) -> str:
+        """Đường dẫn shard, hoặc đường dẫn phẳng nếu file được ghi từ trước khi chia shard"""
+        path = self._path(key)
+        if not os.path.exists(path):
+            flat = os.path.join(self.root, key)
+            if os.path.exists(flat):
+                return flat
+        return path
+
+    def put_file(self, key: str, src_path: str) -> None:
+        dest = self._path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        os.replace(src_path, dest)
+
+    def open(self, key: str) -> BinaryIO:
+        return open(self._existing_path(key), "rb")
+
+    def iter_bytes(self, key, start=0, end=None, chunk_size=1024 * 1024):
+        with open(self._existing_path(key), "rb") as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(chunk_size if remaining is None else min(chunk_size, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def size(self, key):
+        try:
+            return os.path.getsize(self._existing_path(key))
+        except FileNotFoundError:
+            return None
+
+    def delete(self, key):
+        try:
+            os.remove(self._existing_path(key))
+        except FileNotFoundError:
+            pass
+
+    def iter_keys(self):
+        for root, dirs, files in os.walk(self.root):
+            # Bỏ qua thư mục nội bộ (.incoming, .variants...)
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if name.startswith("."):
+                    continue
+                try:
+                    yield name, os.stat(os.path.join(root, name)).st_mtime
+                except FileNotFoundError:
+                    continue
+
+    def local_path(self, key):
+        return self._existing_path(key)
+
+    def presigned_url(self, key, expires_in):
+        expires = int(time.time()) + expires_in
+        return f"/uploads/{key}?expires={expires}&signature={sign_key(key, expires)}"
+
+# ------------------ S3 ------------------
+class S3Storage(StorageBackend):
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: Optional[str] = None, region: Optional[str] = None,
+                 access_key: Optional[str] = None, secret_key: Optional[str] = None):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError as exc:
+            raise RuntimeError("STORAGE_BACKEND=s3 requires boto3 to be installed") from exc
+
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.client = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            region_name=region,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+            config=Config(signature_version="s3v4", s3={"addressing_style": "path"}),
+        )
+
+    def _object_key(self, key: str) -> str:
+        sharded = shard_path(key).replace(os.sep, "/")
+        return f"{self.prefix}/{sharded}" if self.prefix else sharded
+
+    def put_file(self, key, src_path):
+        # upload_file tự chia multipart cho file lớn, bộ nhớ không phụ thuộc kích thước file
+        self.client.upload_file(src_path, self.bucket, self._object_key(key))
+        os.remove(src_path)
+
+    def open(self, key):
+        # Pillow cần seek: tải về file tạm (giữ trong RAM nếu nhỏ, tràn ra disk nếu lớn)
+        buffer = tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024)
+        self.client.download_fileobj(self.bucket, self._object_key(key), buffer)
+        buffer.seek(0)
+        return buffer
+
+    def iter_bytes(self, key, start=0, end=None, chunk_size=1024 * 1024):
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        response = self.client.get_object(Bucket=self.bucket, Key=self._object_key(key), Range=byte_range)
+        yield from response["Body"].iter_chunks(chunk_size)
+
+    def size(self, key):
+        from botocore.exceptions import ClientError
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))["ContentLength"]
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+
+    def iter_keys(self):
+        paginator = self.client.get_paginator("list_objects_v2")
+        prefix = f"{self.prefix}/" if self.prefix else ""
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            for obj in page.get("Contents", []):
+                yield obj["Key"].rsplit("/", 1)[-1], obj["LastModified"].timestamp()
+
+    def presigned_url(self, key, expires_in):
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=expires_in,
+        )
+
+def create_backend() -> StorageBackend:
+    if config.STORAGE_BACKEND == "s3":
+        return S3Storage(
+            bucket=config.S3_BUCKET,
+            prefix=config.S3_PREFIX,
+            endpoint_url=config.S3_ENDPOINT_URL,
+            region=config.S3_REGION,
+            access_key=config.S3_ACCESS_KEY,
+            secret_key=config.S3_SECRET_KEY,
+        )
+    if config.STORAGE_BACKEND != "local":
+        raise RuntimeError(f"Unknown STORAGE_BACKEND: {config.STORAGE_BACKEND}")
+    return LocalStorage(config.UPLOAD_DIR)
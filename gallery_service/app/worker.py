@@ -0,0 +1,131 @@
+import logging
+import signal
+import time
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict
+import app.config as config
+from app import jobs
+from app.db import SessionLocal
+from app.tasks import TASKS
+
+# Worker xử lý job nền của Gallery Service
+# Chạy: python -m app.worker
+# - Process chính: claim job từ Postgres, ghi kết quả/retry vào DB
+# - Process pool (JOB_WORKER_PROCESSES): chạy phần tốn CPU (Pillow), throughput tăng theo số core
+# - Task inline (xóa file...): I/O nhẹ, chạy luôn trong process chính
+
+logger = logging.getLogger("app.worker")
+
+def run_task(kind: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Entry point chạy trong process con"""
+    return TASKS[kind].run(payload)
+
+def run_inline(kind: str, payload: Dict[str, Any]) -> Future:
+    """Chạy task inline ngay trong process chính, trả về Future đã xong để đi chung đường ghi kết quả"""
+    future: Future = Future()
+    try:
+        future.set_result(TASKS[kind].run(payload))
+    except Exception as exc:
+        future.set_exception(exc)
+    return future
+
+def submit_jobs(executor: Executor, inflight: Dict[Future, int], limit: int) -> int:
+    """Claim tối đa `limit` job và đẩy vào executor; trả về số job đã claim"""
+    if limit <= 0:
+        return 0
+    db = SessionLocal()
+    try:
+        claimed = jobs.claim_jobs(db=db, limit=limit)
+        for job in claimed:
+            if job.kind not in TASKS:
+                jobs.fail_job(db=db, job=job, error=f"Unknown job kind: {job.kind}")
+                continue
+            if TASKS[job.kind].inline:
+                inflight[run_inline(job.kind, job.payload)] = job.id
+                continue
+            inflight[executor.submit(run_task, job.kind, job.payload)] = job.id
+        db.commit()
+        return len(claimed)
+    finally:
+        db.close()
+
+def record_result(job_id: int, future: Future) -> None:
+    """Ghi kết quả một job đã chạy xong (thành công hoặc lỗi) vào DB"""
+    db = SessionLocal()
+    try:
+        job = jobs.get_job(db=db, job_id=job_id)
+        if job is None:
+            return
+        task = TASKS[job.kind]
+        try:
+            result = future.result()
+        except Exception as exc:
+            logger.warning("Job %s (%s) attempt %s failed: %r", job.id, job.kind, job.attempts, exc)
+            if jobs.fail_job(db=db, job=job, error=f"{type(exc).__name__}: {exc}"):
+                task.on_failure(db, job.payload)
+        else:
+            jobs.complete_job(db=db, job=job)
+            task.on_success(db, job.payload, result)
+        db.commit()
+    finally:
+        db.close()
+
+def collect_finished(inflight: Dict[Future, int], timeout: float) -> int:
+    """Chờ tối đa `timeout` giây cho job đang chạy, ghi kết quả những job đã xong"""
+    if not inflight:
+        return 0
+    done, _ = wait(inflight, timeout=timeout, return_when=FIRST_COMPLETED)
+    for future in done:
+        record_result(inflight.pop(future), future)
+    return len(done)
+
+def run_until_idle(executor: Executor, concurrency: int) -> int:
+    """Chạy cho tới khi không còn job sẵn sàng (dùng cho test và chạy tay); trả về số job đã xử lý"""
+    inflight: Dict[Future, int] = {}
+    processed = 0
+    while True:
+        submit_jobs(executor, inflight, concurrency - len(inflight))
+        if not inflight:
+            return processed
+        processed += collect_finished(inflight, timeout=None)
+
+def run_forever() -> None:
+    concurrency = config.JOB_WORKER_PROCESSES
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        logger.info("Received signal %s, finishing in-flight jobs...", signum)
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    executor = ProcessPoolExecutor(max_workers=concurrency)
+    inflight: Dict[Future, int] = {}
+    logger.info("Worker started with %d processes", concurrency)
+    try:
+        while not stopping or inflight:
+            try:
+                if not stopping:
+                    submit_jobs(executor, inflight, concurrency - len(inflight))
+                if inflight:
+                    collect_finished(inflight, timeout=config.JOB_POLL_INTERVAL)
+                else:
+                    time.sleep(config.JOB_POLL_INTERVAL)
+            except BrokenProcessPool:
+                # Một process con chết (vd. OOM khi decode ảnh lỗi): tạo pool mới,
+                # job đang chạy sẽ được claim lại sau JOB_LOCK_TIMEOUT_SECONDS
+                logger.exception("Process pool broken, restarting it")
+                inflight.clear()
+                executor = ProcessPoolExecutor(max_workers=concurrency)
+            except Exception:
+                logger.exception("Worker loop error")
+                time.sleep(config.JOB_POLL_INTERVAL)
+    finally:
+        executor.shutdown(wait=True)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+    run_forever()
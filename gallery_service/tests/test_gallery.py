@@ -1,9 +1,23 @@
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
-from app.auth import get_current_user
+from app.auth import get_current_user, get_optional_user, get_stream_user
 import io
+import glob
+import hashlib
+import os
+import app.config as config
 from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+from app import crud, jobs, models
+from app.db import SessionLocal
+from app.worker import run_until_idle
+from app.utils import render, storage
+from app.utils.storage_backends import LocalStorage, S3Storage
+from app.utils.render import DiskLRUCache, Variant, render_variant
+import asyncio
+import json
+import time
 
 client = TestClient(app)
 
@@ -12,16 +26,18 @@ def override_get_current_user():
     return {"user_id": 1, "role": "admin", "username": "test_devops"}
 
 app.dependency_overrides[get_current_user] = override_get_current_user
+app.dependency_overrides[get_optional_user] = override_get_current_user
+app.dependency_overrides[get_stream_user] = override_get_current_user
 
 # Biến global để lưu ID album và media
 created_album_id = None
 created_media_id = None
 
 
-def create_fake_image():
+def create_fake_image(color="red"):
     """Tạo file ảnh giả trong bộ nhớ"""
     file = io.BytesIO()
-    image = Image.new("RGB", (100, 100), color="red")
+    image = Image.new("RGB", (100, 100), color=color)
     image.save(file, "jpeg")
     file.name = "test.jpg"
     file.seek(0)
@@ -70,6 +86,111 @@ def test_get_media_by_id():
     assert data["id"] == created_media_id
 
 
+def test_thumbnail_job():
+    """Worker tạo thumbnail nền cho ảnh vừa upload và cập nhật trạng thái trên Media"""
+    if not created_media_id:
+        return
+
+    assert client.get(f"/media/{created_media_id}").json()["processing_status"] == "pending"
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        assert run_until_idle(executor, concurrency=1) >= 1
+
+    data = client.get(f"/media/{created_media_id}").json()
+    assert data["processing_status"] == "ready"
+    assert data["thumbnail_url"].startswith(f"/media/{created_media_id}/render?")
+
+    # Thumbnail đã được render sẵn vào cache
+    response = client.get(data["thumbnail_url"])
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/webp"
+
+
+def test_render_media():
+    """Render variant theo yêu cầu, header cache bất biến"""
+    if not created_media_id:
+        return
+
+    response = client.get(f"/media/{created_media_id}/render?w=60&fmt=jpeg")
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "image/jpeg"
+    assert "immutable" in response.headers["cache-control"]
+    # w=60 được làm tròn lên 100, ảnh gốc 100x100 không bị phóng to
+    assert Image.open(io.BytesIO(response.content)).size == (100, 100)
+
+    assert client.get(f"/media/{created_media_id}/render").status_code == 400
+    assert client.get(f"/media/{created_media_id}/render?w=100&fmt=gif").status_code == 422
+
+
+def test_render_undecodable_media():
+    """File khai báo image/jpeg nhưng không decode được: render trả 415 thay vì 500"""
+    if not created_album_id:
+        return
+
+    body = b"not really a jpeg " + os.urandom(64)
+    response = client.post(f"/media/upload/{created_album_id}", files={"file": ("fake.jpg", io.BytesIO(body), "image/jpeg")})
+    assert response.status_code == 200
+    response = client.get(f"/media/{response.json()['id']}/render?w=100")
+    assert response.status_code == 415 and response.json()["detail"]
+
+
+def test_render_variant_and_lru_eviction(monkeypatch, tmp_path):
+    """render_variant giữ tỉ lệ khi thu nhỏ; DiskLRUCache xóa file ít dùng nhất khi đầy"""
+    monkeypatch.setattr(storage, "backend", LocalStorage(str(tmp_path)))
+    Image.new("RGB", (1000, 500), color="blue").save(tmp_path / "wide.jpg", "jpeg")
+    dest = tmp_path / "out.webp"
+    render_variant(Variant("wide.jpg", 400, None, "webp"), str(dest))
+    assert Image.open(dest).size == (400, 200)
+
+    cache = DiskLRUCache(str(tmp_path / "cache"), max_bytes=250)
+    for key in ["aa_1", "bb_2", "cc_3"]:
+        tmp_file = tmp_path / f"{key}.tmp"
+        tmp_file.write_bytes(b"x" * 100)
+        cache.put(key, str(tmp_file))
+        time.sleep(0.01)
+    # aa_1 cũ nhất bị xóa để về dưới ngưỡng
+    assert cache.get("aa_1") is None
+    assert cache.get("cc_3") is not None
+
+
+def test_render_requests_are_coalesced(monkeypatch, tmp_path):
+    """Nhiều request đồng thời cho cùng variant chỉ render một lần"""
+    calls = []
+
+    def slow_render(variant):
+        calls.append(variant)
+        time.sleep(0.2)
+        return str(tmp_path / "rendered.webp")
+
+    monkeypatch.setattr(render, "render_to_cache", slow_render)
+    variant = Variant(str(tmp_path / "src.jpg"), 400, None, "webp")
+
+    async def burst():
+        return await asyncio.gather(*[render.get_or_render(variant) for _ in range(5)])
+
+    results = asyncio.run(burst())
+    assert len(calls) == 1
+    assert len(set(results)) == 1
+
+
+def test_job_retry_with_backoff():
+    """Job lỗi được xếp lại với backoff thay vì bị nuốt lỗi"""
+    db = SessionLocal()
+    try:
+        job = jobs.enqueue_job(db, jobs.JOB_THUMBNAIL, {"content_hash": "0" * 64, "file_url": "/uploads/missing.jpg"})
+        db.commit()
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            run_until_idle(executor, concurrency=1)
+        db.refresh(job)
+        assert job.status == "queued"
+        assert job.attempts == 1
+        assert "FileNotFoundError" in job.last_error
+        assert job.run_after > job.updated_at
+    finally:
+        db.delete(job)
+        db.commit()
+        db.close()
+
+
 def test_delete_media():
     """Xóa ảnh để dọn dẹp hệ thống sau khi test"""
     if not created_media_id:
@@ -88,4 +209,783 @@ def test_upload_wrong_format():
 
     response = client.post(f"/media/upload/{created_album_id}", files=files)
     assert response.status_code == 400
-    assert response.json()["detail"] == "Invalid file format"
\ No newline at end of file
+    assert response.json()["detail"] == "Invalid file format"
+
+def test_upload_too_large(monkeypatch):
+    """Kiểm tra backend chặn file vượt quá MAX_UPLOAD_SIZE và không để lại file ghi dở"""
+    global created_album_id
+    monkeypatch.setattr(config, "MAX_UPLOAD_SIZE", 10)
+    fake_file = create_fake_image()
+    files = {"file": ("big.jpg", fake_file, "image/jpeg")}
+
+    response = client.post(f"/media/upload/{created_album_id}", files=files)
+    assert response.status_code == 413
+    assert response.json()["detail"] == "File too large"
+    assert not glob.glob(os.path.join(storage.INCOMING_DIR, "*.upload"))
+
+
+def test_resumable_upload(monkeypatch):
+    """Upload theo chunk: tạo phiên, gửi thiếu chunk, hỏi offset, gửi nốt rồi complete"""
+    global created_album_id
+    monkeypatch.setattr(config, "UPLOAD_SESSION_CHUNK_SIZE", 256)
+    data = create_fake_image().getvalue()
+    chunks = [data[i:i + 256] for i in range(0, len(data), 256)]
+
+    response = client.post("/media/uploads", json={
+        "album_id": created_album_id,
+        "filename": "resume.jpg",
+        "content_type": "image/jpeg",
+        "total_size": len(data),
+    })
+    assert response.status_code == 200
+    session = response.json()
+    upload_id = session["upload_id"]
+    assert session["total_chunks"] == len(chunks)
+
+    def put_chunk(index, body, checksum=None):
+        return client.put(
+            f"/media/uploads/{upload_id}/chunks/{index}",
+            content=body,
+            headers={"X-Chunk-SHA256": checksum or hashlib.sha256(body).hexdigest()},
+        )
+
+    # Chunk sai checksum bị từ chối
+    assert put_chunk(0, chunks[0], checksum="0" * 64).status_code == 400
+
+    # Gửi chunk 0 và chunk cuối, "rớt mạng" ở giữa
+    assert put_chunk(0, chunks[0]).status_code == 200
+    assert put_chunk(len(chunks) - 1, chunks[-1]).status_code == 200
+    status = client.get(f"/media/uploads/{upload_id}").json()
+    assert status["received_bytes"] == 256
+
+    # Chưa đủ chunk thì không complete được
+    assert client.post(f"/media/uploads/{upload_id}/complete").status_code == 409
+
+    for index in range(1, len(chunks) - 1):
+        assert put_chunk(index, chunks[index]).status_code == 200
+    assert client.get(f"/media/uploads/{upload_id}").json()["received_bytes"] == len(data)
+
+    response = client.post(f"/media/uploads/{upload_id}/complete")
+    assert response.status_code == 200
+    media = response.json()
+    assert media["album_id"] == created_album_id
+    with storage.backend.open(storage.storage_key(media["file_url"])) as f:
+        assert f.read() == data
+
+    # Phiên đã xong thì không còn tồn tại
+    assert client.get(f"/media/uploads/{upload_id}").status_code == 404
+
+
+def test_resumable_upload_chunk_vs_complete(monkeypatch):
+    """Chunk gửi lại trong lúc complete giữ khóa phiên: chờ complete xong rồi nhận 404, không ghi vào file đã hash"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    monkeypatch.setattr(config, "UPLOAD_SESSION_CHUNK_SIZE", 256)
+    data = create_fake_image(color="teal").getvalue()
+    upload_id = client.post("/media/uploads", json={
+        "album_id": created_album_id, "filename": "race.jpg", "content_type": "image/jpeg", "total_size": len(data),
+    }).json()["upload_id"]
+    chunk = data[:256]
+    put = lambda: client.put(f"/media/uploads/{upload_id}/chunks/0", content=chunk,
+                             headers={"X-Chunk-SHA256": hashlib.sha256(chunk).hexdigest()})
+    assert put().status_code == 200
+
+    db = SessionLocal()
+    try:
+        upload = crud.get_upload_session(db, upload_id, lock=True)  # như complete_upload
+        with ThreadPoolExecutor(1) as pool:
+            retry = pool.submit(put)
+            time.sleep(0.3)
+            assert not retry.done()
+            stored = storage.finalize_part_file(upload_id, "race.jpg")
+            db.delete(upload)
+            db.commit()
+            assert retry.result(timeout=5).status_code == 404
+        assert not os.path.exists(storage.part_file_path(upload_id))
+        assert storage.checksum_file(stored.file_path)[0] == stored.sha256
+        storage.discard_file(stored)
+    finally:
+        db.close()
+
+
+def test_duplicate_upload_is_deduplicated():
+    """Ảnh trùng nội dung chỉ lưu một bản; file chỉ bị xóa khi Media cuối cùng bị xóa"""
+    global created_album_id
+    data = create_fake_image(color="green").getvalue()
+
+    first = client.post(f"/media/upload/{created_album_id}", files={"file": ("a.jpg", io.BytesIO(data), "image/jpeg")}).json()
+    second = client.post(f"/media/upload/{created_album_id}", files={"file": ("b.JPG", io.BytesIO(data), "image/jpeg")}).json()
+    assert first["id"] != second["id"]
+    assert first["content_hash"] == second["content_hash"] == hashlib.sha256(data).hexdigest()
+    assert first["file_url"] == second["file_url"]
+
+    db = SessionLocal()
+    try:
+        blob = db.query(models.Blob).filter(models.Blob.sha256 == first["content_hash"]).one()
+        assert blob.ref_count == 2
+        # Chỉ một job thumbnail cho cả hai Media
+        pending = db.query(models.Job).filter(
+            models.Job.payload["content_hash"].astext == first["content_hash"]
+        ).count()
+        assert pending == 1
+    finally:
+        db.close()
+
+    file_path = storage.backend.local_path(storage.storage_key(first["file_url"]))
+    assert client.delete(f"/media/{first['id']}").status_code == 200
+    assert os.path.exists(file_path)
+    assert client.delete(f"/media/{second['id']}").status_code == 200
+    # File được xóa nền bởi worker
+    assert os.path.exists(file_path)
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        run_until_idle(executor, concurrency=1)
+    assert not os.path.exists(file_path)
+
+
+def test_sharded_storage_and_signed_urls():
+    """Blob nằm trong thư mục shard ab/cd/; /uploads phục vụ file, URL ký sai hoặc hết hạn bị từ chối"""
+    global created_album_id
+    data = create_fake_image(color="yellow").getvalue()
+    media = client.post(f"/media/upload/{created_album_id}", files={"file": ("s.jpg", io.BytesIO(data), "image/jpeg")}).json()
+    key = storage.storage_key(media["file_url"])
+    assert storage.backend.local_path(key) == os.path.join(config.UPLOAD_DIR, key[:2], key[2:4], key)
+
+    response = client.get(media["file_url"])
+    assert response.status_code == 200
+    assert response.content == data
+
+    signed = client.get(f"/media/{media['id']}/download-url").json()
+    assert client.get(signed["url"]).content == data
+    assert client.get(f"/uploads/{key}?expires=1&signature=x").status_code == 403
+    assert client.get("/uploads/..%2Fsecret").status_code == 404
+
+    # Backend thiếu method bị phát hiện ngay khi khởi tạo
+    from app.utils.storage_backends import StorageBackend
+    class Incomplete(StorageBackend):
+        def put_file(self, key, src_path):
+            pass
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_s3_storage_backend(tmp_path):
+    """S3Storage chạy với server S3 giả lập (moto): put/đọc theo range/liệt kê/xóa/presigned URL"""
+    import boto3
+    import requests
+    from moto.server import ThreadedMotoServer
+
+    server = ThreadedMotoServer(port=0)
+    server.start()
+    try:
+        host, port = server.get_host_and_port()
+        endpoint = f"http://{host}:{port}"
+        boto3.client("s3", endpoint_url=endpoint, region_name="us-east-1",
+                     aws_access_key_id="test", aws_secret_access_key="test").create_bucket(Bucket="gallery")
+        backend = S3Storage("gallery", prefix="media", endpoint_url=endpoint, region="us-east-1",
+                            access_key="test", secret_key="test")
+
+        key = hashlib.sha256(b"hello world").hexdigest() + ".txt"
+        src = tmp_path / "upload.tmp"
+        src.write_bytes(b"hello world")
+        backend.put_file(key, str(src))
+        assert not src.exists()
+
+        assert backend.size(key) == 11
+        assert b"".join(backend.iter_bytes(key, 6, 10)) == b"world"
+        with backend.open(key) as f:
+            assert f.read() == b"hello world"
+        assert [k for k, _ in backend.iter_keys()] == [key]
+        assert backend.local_path(key) is None
+        assert requests.get(backend.presigned_url(key, 60)).content == b"hello world"
+
+        backend.delete(key)
+        assert backend.size(key) is None
+    finally:
+        server.stop()
+
+
+def test_serve_media_ranges_and_caching(monkeypatch):
+    """/uploads: ETag mạnh + immutable, 304 khi trùng ETag, Range/If-Range, chặn request không xác thực"""
+    global created_album_id
+    data = create_fake_image(color="purple").getvalue()
+    media = client.post(f"/media/upload/{created_album_id}", files={"file": ("r.jpg", io.BytesIO(data), "image/jpeg")}).json()
+    url = media["file_url"]
+
+    response = client.get(url)
+    etag = response.headers["etag"]
+    assert etag == f'"{media["content_hash"]}"'
+    assert response.headers["cache-control"] == "private, max-age=31536000, immutable"
+    assert response.headers["accept-ranges"] == "bytes"
+
+    assert client.get(url, headers={"If-None-Match": etag}).status_code == 304
+
+    partial = client.get(url, headers={"Range": "bytes=10-19"})
+    assert partial.status_code == 206
+    assert partial.content == data[10:20]
+    assert partial.headers["content-range"] == f"bytes 10-19/{len(data)}"
+    # If-Range không khớp (file đã đổi) -> trả cả file
+    stale = client.get(url, headers={"Range": "bytes=10-19", "If-Range": '"stale"'})
+    assert stale.status_code == 200 and stale.content == data
+
+    head = client.head(url)
+    assert head.status_code == 200 and head.headers["content-length"] == str(len(data))
+
+    monkeypatch.setattr(config, "MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-uploads")
+    accel = client.get(url)
+    key = storage.storage_key(url)
+    assert accel.headers["x-accel-redirect"] == f"/protected-uploads/{key[:2]}/{key[2:4]}/{key}"
+    assert accel.content == b""
+    monkeypatch.setattr(config, "MEDIA_ACCEL_REDIRECT_PREFIX", "")
+
+    # Không có token và không có chữ ký -> 401; file không thuộc album nào -> 404
+    monkeypatch.delitem(app.dependency_overrides, get_optional_user)
+    assert client.get(url).status_code == 401
+    monkeypatch.setitem(app.dependency_overrides, get_optional_user, override_get_current_user)
+    assert client.get(f"/uploads/{'0' * 64}.jpg").status_code == 404
+
+
+def test_batch_upload():
+    """Batch upload: một request nhiều file, file lỗi không làm hỏng cả batch, file trùng dùng chung blob"""
+    global created_album_id
+    blue = create_fake_image(color="navy").getvalue()
+    files = [
+        ("files", ("a.jpg", io.BytesIO(blue), "image/jpeg")),
+        ("files", ("bad.txt", io.BytesIO(b"not an image"), "text/plain")),
+        ("files", ("b.jpg", create_fake_image(color="orange"), "image/jpeg")),
+        ("files", ("c.jpg", io.BytesIO(blue), "image/jpeg")),
+    ]
+    response = client.post(f"/media/upload/{created_album_id}/batch", files=files)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["created"] == 3 and body["failed"] == 1
+    assert [item["status"] for item in body["items"]] == ["created", "error", "created", "created"]
+    assert body["items"][1]["error"] == "Invalid file format"
+    first, third = body["items"][0]["media"], body["items"][3]["media"]
+    assert first["file_url"] == third["file_url"]
+    assert first["processing_status"] == "pending"
+
+    db = SessionLocal()
+    try:
+        blob = db.query(models.Blob).filter(models.Blob.sha256 == hashlib.sha256(blue).hexdigest()).one()
+        assert blob.ref_count == 2
+        assert db.query(models.Job).filter(models.Job.payload["content_hash"].astext == blob.sha256).count() == 1
+    finally:
+        db.close()
+    assert client.get(first["file_url"]).content == blue
+
+    # Sau khi thumbnail render xong, batch mới cùng nội dung dùng lại ngay (ready, không xếp job mới)
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        run_until_idle(executor, concurrency=1)
+    again = client.post(f"/media/upload/{created_album_id}/batch", files=[("files", ("d.jpg", io.BytesIO(blue), "image/jpeg"))]).json()
+    media = again["items"][0]["media"]
+    assert media["processing_status"] == "ready"
+    assert media["thumbnail_url"] == f"/media/{media['id']}/render?w=200&h=200&fmt=webp"
+
+
+def test_cursor_pagination():
+    """Cursor mode: duyệt hết album không trùng/sót, trang cuối next_cursor=null, album rỗng không 404"""
+    album = client.post("/albums/", json={"name": "Keyset", "event_id": 2}).json()
+    files = [("files", (f"{i}.jpg", create_fake_image(color=(i * 40, 10, 10)), "image/jpeg")) for i in range(5)]
+    created = client.post(f"/media/upload/{album['id']}/batch", files=files).json()
+    expected_ids = [item["media"]["id"] for item in created["items"]]
+
+    seen, cursor = [], ""
+    while True:
+        body = client.get(f"/media/album/{album['id']}", params={"cursor": cursor, "limit": 2, "include_total": True}).json()
+        assert body["total"] == 5
+        seen += [m["id"] for m in body["items"]]
+        if body["next_cursor"] is None:
+            break
+        cursor = body["next_cursor"]
+    assert seen == expected_ids
+
+    assert client.get(f"/media/album/{album['id']}", params={"cursor": "not-a-cursor"}).status_code == 400
+    empty = client.post("/albums/", json={"name": "Empty", "event_id": 3}).json()
+    body = client.get(f"/media/album/{empty['id']}", params={"cursor": ""}).json()
+    assert body == {"items": [], "limit": 20, "next_cursor": None, "total": None}
+
+
+def test_album_archive(monkeypatch):
+    """ZIP cả album: đọc được bằng zipfile, Range ghép lại đúng bản đầy đủ, ZIP64 khi vượt ngưỡng, 503 khi đầy"""
+    import zipfile
+    from app.utils import archive
+
+    album = client.post("/albums/", json={"name": "Archive", "event_id": 4}).json()
+    images = {color: create_fake_image(color=color).getvalue() for color in ["pink", "teal", "gold"]}
+    files = [("files", (f"{color}.jpg", io.BytesIO(data), "image/jpeg")) for color, data in images.items()]
+    created = client.post(f"/media/upload/{album['id']}/batch", files=files).json()
+
+    # Blob cũ chưa có crc32 được tính bù
+    db = SessionLocal()
+    try:
+        db.query(models.Blob).filter(models.Blob.sha256 == hashlib.sha256(images["pink"]).hexdigest()).update({"crc32": None})
+        db.commit()
+    finally:
+        db.close()
+
+    response = client.get(f"/albums/{album['id']}/archive")
+    assert response.status_code == 200
+    assert response.headers["content-length"] == str(len(response.content))
+    with zipfile.ZipFile(io.BytesIO(response.content)) as zf:
+        assert zf.testzip() is None
+        names = [f"{item['media']['id']}.jpg" for item in created["items"]]
+        assert zf.namelist() == names
+        assert [zf.read(name) for name in names] == list(images.values())
+        assert all(info.compress_type == zipfile.ZIP_STORED for info in zf.infolist())
+
+    full, etag = response.content, response.headers["etag"]
+    part = client.get(f"/albums/{album['id']}/archive", headers={"Range": "bytes=100-", "If-Range": etag})
+    assert part.status_code == 206
+    assert full[:100] + part.content == full
+    stale = client.get(f"/albums/{album['id']}/archive", headers={"Range": "bytes=100-", "If-Range": '"old"'})
+    assert stale.status_code == 200 and stale.content == full
+    assert client.get(f"/albums/{album['id']}/archive", headers={"Range": f"bytes={len(full)}-"}).status_code == 416
+
+    monkeypatch.setattr(archive, "ZIP64_LIMIT", 10)
+    monkeypatch.setattr(archive, "ZIP64_COUNT_LIMIT", 2)
+    zip64 = client.get(f"/albums/{album['id']}/archive").content
+    with zipfile.ZipFile(io.BytesIO(zip64)) as zf:
+        assert [zf.read(name) for name in zf.namelist()] == list(images.values())
+
+    # Mọi lượt tải (kể cả 416) đều trả slot
+    assert archive.archive_slots._value == config.ARCHIVE_MAX_CONCURRENT
+    monkeypatch.setattr(archive, "archive_slots", asyncio.Semaphore(0))
+    import app.routes.album as album_routes
+    monkeypatch.setattr(album_routes, "archive_slots", archive.archive_slots)
+    busy = client.get(f"/albums/{album['id']}/archive")
+    assert busy.status_code == 503
+    assert busy.headers["retry-after"] == str(config.ARCHIVE_RETRY_AFTER)
+
+def test_album_archive_client_disconnect(monkeypatch):
+    """Client ngắt trước khi đọc body (generator chưa chạy / gửi header lỗi): slot vẫn được trả"""
+    from contextlib import suppress
+    import app.routes.album as album_routes
+    from app.utils import archive
+
+    album = client.post("/albums/", json={"name": "Disconnect", "event_id": 4}).json()
+    client.post(f"/media/upload/{album['id']}", files={"file": ("a.jpg", create_fake_image(), "image/jpeg")})
+    slots = asyncio.Semaphore(1)
+    monkeypatch.setattr(album_routes, "archive_slots", slots)
+
+    async def request(spec_version, fail_send):
+        path = f"/albums/{album['id']}/archive"
+        scope = {
+            "type": "http", "asgi": {"version": "3.0", "spec_version": spec_version}, "http_version": "1.1",
+            "method": "GET", "scheme": "http", "path": path, "raw_path": path.encode(), "query_string": b"",
+            "root_path": "", "headers": [(b"host", b"testserver")], "client": ("test", 1), "server": ("testserver", 80),
+        }
+
+        async def receive():
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if fail_send and message["type"] == "http.response.start":
+                raise OSError("client gone")
+
+        with suppress(Exception):
+            await app(scope, receive, send)
+
+    for spec_version, fail_send in (("2.0", False), ("2.0", True), ("2.4", True)):
+        asyncio.run(request(spec_version, fail_send))
+        assert slots._value == 1, (spec_version, fail_send)
+    assert client.get(f"/albums/{album['id']}/archive").status_code == 200
+
+
+def create_pattern_image(seed, size=(300, 200), quality=95):
+    """Ảnh có hoa văn ngẫu nhiên (ảnh một màu thì dHash luôn bằng 0)"""
+    import numpy as np
+    noise = np.random.default_rng(seed).integers(0, 256, (8, 12, 3), dtype=np.uint8)
+    file = io.BytesIO()
+    Image.fromarray(noise).resize(size, Image.Resampling.BILINEAR).save(file, "jpeg", quality=quality)
+    return file.getvalue()
+
+
+def test_near_duplicate_detection():
+    """dHash tính cùng job thumbnail; bản nén lại/thu nhỏ của cùng ảnh bị gom nhóm, ảnh khác thì không"""
+    from app.backfill import backfill_dhash
+
+    album = client.post("/albums/", json={"name": "Burst", "event_id": 5}).json()
+    images = [
+        create_pattern_image(1),
+        create_pattern_image(1, size=(150, 100), quality=40),  # bản "WhatsApp" của ảnh trên
+        create_pattern_image(2),
+    ]
+    files = [("files", (f"{i}.jpg", io.BytesIO(data), "image/jpeg")) for i, data in enumerate(images)]
+    original, copy, other = [item["media"]["id"] for item in client.post(f"/media/upload/{album['id']}/batch", files=files).json()["items"]]
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        run_until_idle(executor, concurrency=1)
+
+    assert client.get(f"/media/album/{album['id']}/duplicates").json() == {"groups": [[original, copy]]}
+    similar = client.get(f"/media/{original}/similar").json()
+    assert [s["media"]["id"] for s in similar] == [copy]
+    assert similar[0]["distance"] <= 4
+
+    # Backfill bằng NumPy cho kết quả giống hệt job
+    db = SessionLocal()
+    try:
+        before = dict(db.query(models.Media.id, models.Media.dhash).filter(models.Media.album_id == album["id"]).all())
+        db.query(models.Media).filter(models.Media.album_id == album["id"]).update({"dhash": None})
+        db.commit()
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            assert backfill_dhash(executor, album_id=album["id"], batch_size=2) == 3
+        db.expire_all()
+        after = dict(db.query(models.Media.id, models.Media.dhash).filter(models.Media.album_id == album["id"]).all())
+        assert after == before
+    finally:
+        db.close()
+
+
+def test_bk_tree_matches_linear_scan():
+    """BK-tree trả đúng tập kết quả như so từng cặp"""
+    import random
+    from app.utils.phash import BKTree, hamming
+
+    rng = random.Random(7)
+    values = [rng.getrandbits(64) for _ in range(500)]
+    values += [v ^ (1 << rng.randrange(64)) for v in values[:50]]
+    tree = BKTree()
+    for i, v in enumerate(values):
+        tree.add(v, i)
+    for query in values[:20]:
+        expected = sorted(i for i, v in enumerate(values) if hamming(query, v) <= 12)
+        assert sorted(i for _, i in tree.search(query, 12)) == expected
+
+
+def create_exif_image(size, captured_at=None, orientation=None):
+    file = io.BytesIO()
+    exif = Image.Exif()
+    if orientation:
+        exif[0x0112] = orientation
+    if captured_at:
+        exif.get_ifd(0x8769)[0x9003] = captured_at
+        exif.get_ifd(0x8769)[0x9011] = "+07:00"
+    Image.new("RGB", size, color="white").save(file, "jpeg", exif=exif)
+    return file.getvalue()
+
+
+def test_media_metadata_sort_and_filter():
+    """Metadata đọc lúc upload; sort theo thời điểm chụp (null xếp cuối), lọc theo hướng ảnh; backfill đọc lại y hệt"""
+    from app.backfill import backfill_metadata
+
+    album = client.post("/albums/", json={"name": "Metadata", "event_id": 6}).json()
+    images = [
+        create_exif_image((300, 200), "2024:05:01 12:00:00"),
+        create_exif_image((300, 200), "2024:05:01 09:30:00", orientation=6),  # xoay 90 độ -> dọc
+        create_exif_image((120, 120)),                                         # không có EXIF
+        create_exif_image((301, 200), "2024:05:01 09:00:00"),
+    ]
+    files = [("files", (f"{i}.jpg", io.BytesIO(data), "image/jpeg")) for i, data in enumerate(images)]
+    ids = [item["media"]["id"] for item in client.post(f"/media/upload/{album['id']}/batch", files=files).json()["items"]]
+
+    rotated = client.get(f"/media/{ids[1]}").json()
+    assert (rotated["width"], rotated["height"], rotated["orientation"]) == (200, 300, "portrait")
+    assert rotated["byte_size"] == len(images[1])
+    assert rotated["captured_at"].startswith("2024-05-01T02:30:00")  # 09:30 +07:00 -> UTC
+
+    seen, cursor = [], ""
+    while cursor is not None:
+        body = client.get(f"/media/album/{album['id']}", params={"cursor": cursor, "limit": 1, "sort": "captured_at"}).json()
+        seen += [m["id"] for m in body["items"]]
+        cursor = body["next_cursor"]
+    assert seen == [ids[3], ids[1], ids[0], ids[2]]
+
+    landscape = client.get(f"/media/album/{album['id']}", params={"orientation": "landscape", "sort": "byte_size"}).json()
+    assert {m["id"] for m in landscape["items"]} == {ids[0], ids[3]} and landscape["total"] == 2
+    # Cursor của sort khác không dùng lẫn được
+    first = client.get(f"/media/album/{album['id']}", params={"cursor": "", "limit": 1, "sort": "uploaded_at"}).json()
+    cursor = first["next_cursor"]
+    assert cursor is not None
+    assert client.get(f"/media/album/{album['id']}", params={"cursor": cursor, "limit": 1, "sort": "uploaded_at"}).status_code == 200
+    response = client.get(f"/media/album/{album['id']}", params={"cursor": cursor, "sort": "byte_size"})
+    assert response.status_code == 400
+
+    db = SessionLocal()
+    try:
+        columns = [models.Media.width, models.Media.height, models.Media.byte_size, models.Media.captured_at, models.Media.orientation]
+        before = db.query(models.Media.id, *columns).filter(models.Media.album_id == album["id"]).order_by(models.Media.id).all()
+        db.query(models.Media).filter(models.Media.album_id == album["id"]).update({c.key: None for c in columns})
+        db.commit()
+        with ProcessPoolExecutor(max_workers=2) as executor:
+            assert backfill_metadata(executor, album_id=album["id"]) == 4
+        after = db.query(models.Media.id, *columns).filter(models.Media.album_id == album["id"]).order_by(models.Media.id).all()
+        assert after == before
+    finally:
+        db.close()
+
+
+def test_garbage_collector():
+    """GC xóa file mồ côi + file tạm hỏng cũ hơn grace period; dry-run chỉ báo cáo; file đang dùng không bị đụng"""
+    from app.gc import run_gc
+
+    data = create_fake_image(color="maroon").getvalue()
+    live = client.post(f"/media/upload/{created_album_id}", files={"file": ("live.jpg", io.BytesIO(data), "image/jpeg")}).json()
+    live_path = storage.backend.local_path(storage.storage_key(live["file_url"]))
+
+    old = time.time() - 7200
+    orphans = {
+        "thumb_legacy.jpg": os.path.join(config.UPLOAD_DIR, "thumb_legacy.jpg"),
+        "orphan": storage.backend.local_path(hashlib.sha256(b"orphan").hexdigest() + ".jpg"),
+        "upload": os.path.join(storage.INCOMING_DIR, "crashed.upload"),
+    }
+    recent = os.path.join(config.UPLOAD_DIR, "thumb_recent.jpg")
+    for path in [*orphans.values(), recent]:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(b"x" * 10)
+    for path in [*orphans.values(), live_path]:
+        os.utime(path, (old, old))
+
+    report = run_gc(dry_run=True, grace_seconds=3600, batch_size=2, max_deletes_per_second=0)
+    assert report.orphan_files == 2 and report.stale_temp_files == 1 and report.deleted_files == 0
+    assert all(os.path.exists(path) for path in orphans.values())
+
+    report = run_gc(grace_seconds=3600, batch_size=2, max_deletes_per_second=0)
+    assert report.deleted_files == 2 and report.stale_temp_files == 1
+    assert not any(os.path.exists(path) for path in orphans.values())
+    assert os.path.exists(recent) and os.path.exists(live_path)
+    os.remove(recent)
+
+
+def test_album_summary_counters():
+    """Album trả tóm tắt cộng dồn (không kèm media); media chỉ có khi include_media, theo trang"""
+
+    album = client.post("/albums/", json={"name": "Summary", "event_id": 7}).json()
+    summary = client.get("/albums/event/7").json()
+    assert summary["media_count"] == 0 and summary["cover_url"] is None and "media_items" not in summary
+
+    images = [create_fake_image(color=color).getvalue() for color in ("olive", "teal", "navy")]
+    first = client.post(f"/media/upload/{album['id']}", files={"file": ("a.jpg", io.BytesIO(images[0]), "image/jpeg")}).json()
+    files = [("files", (f"{i}.jpg", io.BytesIO(data), "image/jpeg")) for i, data in enumerate(images[1:])]
+    batch = [item["media"] for item in client.post(f"/media/upload/{album['id']}/batch", files=files).json()["items"]]
+    client.post(f"/media/album/{album['id']}", json={"file_url": "https://example.com/clip.mp4", "media_type": "video"})
+
+    summary = client.get("/albums/event/7").json()
+    assert summary["media_count"] == 4
+    assert summary["total_bytes"] == sum(len(data) for data in images)
+    assert summary["cover_media_id"] == first["id"] and summary["cover_url"] == render.thumbnail_url(first["id"])
+    assert summary["last_upload_at"] is not None
+
+    detail = client.get("/albums/event/7", params={"include_media": True, "media_limit": 3}).json()
+    assert [m["id"] for m in detail["media_items"]] == [first["id"]] + [m["id"] for m in batch]
+    rest = client.get(f"/media/album/{album['id']}", params={"cursor": detail["next_cursor"]}).json()
+    assert len(rest["items"]) == 1 and rest["next_cursor"] is None
+
+    # Xóa ảnh bìa: ảnh upload sớm nhất còn lại thành ảnh bìa
+    assert client.delete(f"/media/{first['id']}").status_code == 200
+    summary = client.get("/albums/event/7").json()
+    assert summary["media_count"] == 3
+    assert summary["total_bytes"] == len(images[1]) + len(images[2])
+    assert summary["cover_media_id"] == batch[0]["id"]
+
+    # Giá trị cộng dồn khớp với tính lại từ đầu
+    db = SessionLocal()
+    try:
+        crud.refresh_album_summaries(db, album_id=album["id"])
+        db.commit()
+    finally:
+        db.close()
+    assert client.get("/albums/event/7").json() == summary
+
+
+def test_live_feed():
+    """Media mới tới client SSE qua LISTEN/NOTIFY; kết nối lại với Last-Event-ID nhận bù media bị lỡ"""
+    from app.routes.feed import feed_hub
+
+    album = client.post("/albums/", json={"name": "Live", "event_id": 8}).json()
+    assert client.get("/albums/999999/feed").status_code == 404
+    assert client.get(f"/albums/{album['id']}/feed", headers={"Last-Event-ID": "abc"}).status_code == 400
+
+    def upload(color):
+        data = create_fake_image(color=color).getvalue()
+        return client.post(f"/media/upload/{album['id']}", files={"file": ("live.jpg", io.BytesIO(data), "image/jpeg")}).json()
+
+    def parse(event):
+        fields = dict(line.split(": ", 1) for line in event.strip().split("\n"))
+        feed_seq, media_id = (int(part) for part in fields["id"].split("."))
+        return (feed_seq, media_id), fields["event"], json.loads(fields["data"])
+
+    async def scenario():
+        feed = feed_hub.stream(album["id"], None, keepalive=0.3)
+        assert (await anext(feed)).startswith("retry:")
+        assert await anext(feed) == ": keepalive\n\n"  # chờ connection LISTEN sẵn sàng
+        first = await asyncio.to_thread(upload, "coral")
+        position, kind, data = parse(await asyncio.wait_for(anext(feed), 5))
+        assert (position[1], kind, data["file_url"]) == (first["id"], "media", first["file_url"])
+        await feed.aclose()
+        assert feed_hub.subscriber_count() == 0
+
+        # Lỡ hai media trong lúc mất kết nối -> kết nối lại nhận bù theo thứ tự
+        missed = [await asyncio.to_thread(upload, color) for color in ("khaki", "plum")]
+        feed = feed_hub.stream(album["id"], position, keepalive=0.3)
+        assert (await anext(feed)).startswith("retry:")
+        replayed = [parse(await anext(feed))[0] for _ in missed]
+        assert [media_id for _, media_id in replayed] == [m["id"] for m in missed]
+        await feed.aclose()
+        return replayed[-1]
+
+    last_seen = asyncio.run(scenario())
+
+    # Upload có id nhỏ hơn nhưng commit sau media client đã thấy: vẫn được trả bù
+    db = SessionLocal()
+    try:
+        late = models.Media(album_id=album["id"], file_url="/uploads/late.jpg", media_type="image")
+        db.add(late)
+        db.flush()  # id đã cấp, chưa commit
+        late_id = late.id
+        seen = upload("olive")
+        assert late_id < seen["id"]
+        feed_seq = crud.add_to_album_summary(db, album["id"], 1, 0)
+        crud.notify_media_added(db, album["id"], [late_id], feed_seq)
+        db.commit()
+        seen_position = db.query(models.Media.feed_seq, models.Media.id).filter(models.Media.id == seen["id"]).one()
+    finally:
+        db.close()
+    assert tuple(seen_position) > last_seen
+
+    async def resume():
+        feed = feed_hub.stream(album["id"], tuple(seen_position), keepalive=0.3)
+        assert (await anext(feed)).startswith("retry:")
+        position = parse(await asyncio.wait_for(anext(feed), 5))[0]
+        await feed.aclose()
+        return position
+
+    assert asyncio.run(resume())[1] == late_id
+    # Last-Event-ID kiểu cũ (chỉ media id) vẫn được nhận
+    db = SessionLocal()
+    try:
+        assert crud.get_feed_position(db, album["id"], seen["id"]) == tuple(seen_position)
+    finally:
+        db.close()
+
+
+def test_slideshow_manifest():
+    """Manifest slideshow: URL + kích thước đúng với ảnh render thật, ETag theo revision, 304 khi không đổi"""
+    album = client.post("/albums/", json={"name": "Slideshow", "event_id": 9}).json()
+    images = [create_exif_image((3000, 2000)), create_exif_image((1000, 1500), orientation=6)]
+    ids = [
+        client.post(f"/media/upload/{album['id']}", files={"file": (f"{i}.jpg", io.BytesIO(data), "image/jpeg")}).json()["id"]
+        for i, data in enumerate(images)
+    ]
+    client.post(f"/media/album/{album['id']}", json={"file_url": "https://example.com/clip.mp4", "media_type": "video"})
+
+    response = client.get(f"/albums/{album['id']}/slideshow")
+    assert response.status_code == 200
+    manifest = response.json()
+    etag = response.headers["etag"]
+    assert [slide["media_id"] for slide in manifest["slides"]] == ids
+    assert manifest["preload"]["count"] == config.SLIDESHOW_PRELOAD_COUNT
+    assert f'</media/{ids[0]}/render?w=1920&h=1200&fmt=webp>; rel=preload; as=image' in response.headers["link"]
+
+    rotated = manifest["slides"][1]
+    assert (rotated["width"], rotated["height"]) == (1500, 1000)
+    for slide in manifest["slides"]:
+        for variant in slide["variants"].values():
+            rendered = Image.open(io.BytesIO(client.get(variant["url"]).content))
+            assert rendered.size == (variant["width"], variant["height"])
+
+    assert client.get(f"/albums/{album['id']}/slideshow", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get(f"/albums/{album['id']}/slideshow", params={"screen": "8k"}).status_code == 400
+
+    # Album đổi -> revision tăng -> ETag mới
+    assert client.delete(f"/media/{ids[0]}").status_code == 200
+    response = client.get(f"/albums/{album['id']}/slideshow", headers={"If-None-Match": etag})
+    assert response.status_code == 200 and response.headers["etag"] != etag
+    assert [slide["media_id"] for slide in response.json()["slides"]] == ids[1:]
+
+
+def test_conditional_get():
+    """Album / danh sách media / media trả 304 khi revision album chưa đổi; upload, thumbnail xong đều đổi ETag"""
+    album = client.post("/albums/", json={"name": "Conditional", "event_id": 10}).json()
+    data = create_fake_image(color="indigo").getvalue()
+    media = client.post(f"/media/upload/{album['id']}", files={"file": ("c.jpg", io.BytesIO(data), "image/jpeg")}).json()
+
+    urls = ["/albums/event/10", f"/media/album/{album['id']}?cursor=", f"/media/{media['id']}"]
+    etags = {}
+    for url in urls:
+        response = client.get(url)
+        assert response.status_code == 200 and "last-modified" in response.headers
+        etags[url] = response.headers["etag"]
+        assert client.get(url, headers={"If-None-Match": etags[url]}).status_code == 304
+        assert client.get(url, headers={"If-Modified-Since": response.headers["last-modified"]}).status_code == 304
+    # Tham số khác -> ETag khác
+    assert client.get(f"/media/album/{album['id']}?cursor=&limit=5").headers["etag"] != etags[urls[1]]
+
+    # Thumbnail xong (job nền) đổi processing_status -> phải revalidate ra bản mới
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        run_until_idle(executor, concurrency=1)
+    for url in urls:
+        response = client.get(url, headers={"If-None-Match": etags[url]})
+        assert response.status_code == 200 and response.headers["etag"] != etags[url]
+    assert client.get(f"/media/{media['id']}").json()["processing_status"] == "ready"
+
+def test_async_session_mode(monkeypatch):
+    """DB_ASYNC: các route album/media cơ bản chạy trên AsyncSession (asyncpg) thay vì Session sync"""
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    from sqlalchemy.pool import NullPool
+    import app.db as db_module
+
+    async_engine = create_async_engine(config.ASYNC_DATABASE_URL, poolclass=NullPool)
+    monkeypatch.setattr(db_module.database, "AsyncSessionLocal", async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False))
+    with TestClient(app) as async_client:
+        album = async_client.post("/albums/", json={"name": "Async", "event_id": 11}).json()
+        summary = async_client.get("/albums/event/11")
+        assert summary.status_code == 200 and summary.json()["media_count"] == 0
+
+        urls = [f"https://example.com/async-{i}.jpg" for i in range(3)]
+        for url in urls:
+            created = async_client.post(f"/media/album/{album['id']}", json={"file_url": url, "media_type": "image"})
+            assert created.status_code == 200
+        first = async_client.get(f"/media/album/{album['id']}?cursor=&limit=2&include_total=true").json()
+        assert len(first["items"]) == 2 and first["total"] == 3 and first["next_cursor"]
+        rest = async_client.get(f"/media/album/{album['id']}?cursor={first['next_cursor']}&limit=2").json()
+        assert len(rest["items"]) == 1 and rest["next_cursor"] is None
+        assert async_client.get(f"/media/album/{album['id']}?page=1&limit=10").json()["total"] == 3
+
+        media_id = rest["items"][0]["id"]
+        response = async_client.get(f"/media/{media_id}")
+        assert response.status_code == 200
+        assert async_client.get(f"/media/{media_id}", headers={"If-None-Match": response.headers["etag"]}).status_code == 304
+        assert async_client.get("/albums/event/11?include_media=true").json()["media_count"] == 3
+
+        assert async_client.delete(f"/media/{media_id}").status_code == 200
+        assert async_client.get(f"/media/{media_id}").status_code == 404
+        assert async_client.delete(f"/albums/{album['id']}").status_code == 200
+        assert async_client.get("/albums/event/11").status_code == 404
+
+def test_pool_metrics():
+    """/metrics xuất số liệu pool; chờ lấy connection, timeout khi pool cạn và invalidate đều được đếm"""
+    from sqlalchemy import create_engine, text
+    from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+    from sqlalchemy.pool import QueuePool
+    from common import pool_metrics
+
+    client.get("/media/album/1?cursor=")
+    body = client.get("/metrics").text
+    assert 'db_pool_size{pool="sync"' in body
+    assert 'db_pool_checked_out{pool="sync"' in body
+    assert 'db_pool_checkout_wait_seconds_bucket{pool="sync"' in body
+    assert pool_metrics.REGISTRY["sync"].wait_count > 0
+
+    # Pool 1 connection, không overflow: lần mượn thứ hai phải timeout
+    small = create_engine(config.DATABASE_URL, poolclass=pool_metrics.instrumented(QueuePool, "test-small"),
+                          pool_size=1, max_overflow=0, pool_timeout=0.1)
+    stats = pool_metrics.REGISTRY["test-small"]
+    try:
+        conn = small.connect()
+        with pytest.raises(PoolTimeoutError):
+            small.connect()
+        assert stats.timeouts == 1 and stats.connects == 1 and stats.pool.checkedout() == 1
+        assert 'db_pool_checkout_timeouts_total{pool="test-small"' in client.get("/metrics").text
+        conn.invalidate()
+        conn.close()
+        with small.connect() as again:
+            assert again.execute(text("SELECT 1")).scalar() == 1
+        assert stats.invalidations["hard"] == 1 and stats.connects == 2 and stats.wait_count == 3
+        # dispose() tạo pool mới: vẫn đếm vào cùng nhãn, listener không bị gắn trùng
+        small.dispose()
+        with small.connect():
+            pass
+        assert stats.pool is small.pool and stats.connects == 3
+    finally:
+        small.dispose()
+        del pool_metrics.REGISTRY["test-small"]